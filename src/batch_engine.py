@@ -0,0 +1,280 @@
+#     BounceAnalyzer is a program to analyze the bounces of objects
+#     Copyright (C) 2023  Raphael Kriegl
+
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+""" batch evaluation without a GUI, run `python src/batch_engine.py ROOT "*.cihx"` to evaluate all matching videos below ROOT """
+
+import os
+import sys
+import time
+import logging
+import argparse
+import traceback
+from concurrent.futures import wait, FIRST_COMPLETED
+from dataclasses import dataclass
+from pathlib import Path
+import warnings
+
+warnings.filterwarnings('ignore', module='pyMRAW')
+
+from data_classes import BounceData, VideoInfoPresets
+from batch_ledger import BatchLedger
+from bounce_evaluator import BounceEvaluator
+from result_io import save_result
+from pipeline import Pipeline, process_pool
+from result_cache import ResultCache
+import instrumentation
+from instrumentation import StageProfiler, aggregate_profiles, log_aggregate, save_profile
+from results_store import ResultsStore
+import streak_builder
+from streak_builder import STREAK_CHUNK_SIZE
+from streak_cache import StreakCache
+from video_probe import VideoProbe, plan_batch
+from video_reader import IVideoReader, open_video
+
+# number of processes evaluating files in parallel
+BATCH_WORKERS = os.cpu_count() or 1
+# memory all parallel evaluations may use together, the estimated footprints of running files are kept below it
+BATCH_RAM_BUDGET = 8 * 2**30
+
+
+@dataclass
+class EvalParams:
+    """ evaluation parameters that are set by the user, the rest of VideoInfoPresets is read from the video """
+    ball_size: float = 2.5e-3
+    accel_thresh: float = 1500.0
+    rel_threshold: float = 0.5
+    # None reads the scale from the video, or calculates it from the ball size
+    pixel_scale: float = None
+    savgol_window: int = None
+
+
+@dataclass
+class BatchResult:
+    """ outcome of one file of a batch, data is None if the evaluation failed """
+    filename: str
+    data: BounceData = None
+    error: str = None
+    duration: float = 0.0
+    # stage profiles of the evaluation, if profiling is on
+    profile: list = None
+
+
+def video_info(reader: IVideoReader, filename: str, params: EvalParams) -> VideoInfoPresets:
+    """ evaluation parameters of a video, combines its metadata with the user parameters like DataControl does """
+    pixel_scale = params.pixel_scale or (reader.pixel_scale if reader.pixel_scale != 1.0 else None)
+    return VideoInfoPresets(
+        length = len(reader),
+        shape = reader.frame_shape,
+        pixel_scale = pixel_scale,
+        frame_rate = reader.frame_rate,
+        accel_thresh = params.accel_thresh,
+        bit_depth = reader.color_bit_depth,
+        filename = str(filename),
+        ball_size = params.ball_size,
+        rel_threshold = params.rel_threshold,
+        savgol_window = params.savgol_window
+    )
+
+
+def _decode(filename: str, params: EvalParams, streak_cache: StreakCache = None, result_cache: ResultCache = None):
+    """ reads the video into its streak image, the part of the evaluation bound by disk and decoding, nothing is read for cached results """
+    logging.info(f"Process file {filename}")
+    reader = open_video(str(filename))
+    info = video_info(reader, filename, params)
+    cached = result_cache.load(filename, info) if result_cache else None
+    if cached is not None:
+        logging.info(f"Using cached result of {filename}")
+        return filename, None, info, cached
+    # read when called, so profiling can be switched on in worker processes by the environment
+    evaluator = BounceEvaluator(reader, streak_cache, profiler=StageProfiler() if instrumentation.PROFILE_STAGES else None)
+    evaluator.streak(info)
+    return filename, evaluator, info, None
+
+
+def _evaluate(decoded, result_cache: ResultCache = None):
+    filename, evaluator, info, cached = decoded
+    if cached is not None:
+        return filename, evaluator, *cached, info
+    data, streak = evaluator.evaluate(info)
+    if result_cache: result_cache.store(filename, info, data, streak)
+    return filename, evaluator, data, streak, info
+
+
+def _save(evaluated) -> tuple[BounceData, list]:
+    """ saves the results and the stage profile if profiling is on, returns the data and the profile """
+    filename, evaluator, data, streak, info = evaluated
+    save_result(Path(filename).with_suffix(".json"), data, streak, info.rel_threshold)
+    profile = evaluator.profiler.to_list() if evaluator and evaluator.profiler else None
+    if profile: save_profile(filename, profile)
+    return data, profile
+
+
+def process_file(filename: str, params: EvalParams, streak_cache: StreakCache = None, result_cache: ResultCache = None) -> BounceData:
+    """ evaluates one video and saves json, csv and streak image next to it """
+    return _save(_evaluate(_decode(filename, params, streak_cache, result_cache), result_cache))[0]
+
+
+def _process_safe(filename: str, params: EvalParams, streak_cache: StreakCache = None, result_cache: ResultCache = None) -> BatchResult:
+    """ process_file that logs and returns errors instead of raising them """
+    start = time.perf_counter()
+    try:
+        data, profile = _save(_evaluate(_decode(filename, params, streak_cache, result_cache), result_cache))
+        return BatchResult(filename, data=data, profile=profile, duration=time.perf_counter() - start)
+    except Exception as ex:
+        logging.error(f"Failed to process {filename}:\n{traceback.format_exc()}")
+        return BatchResult(filename, error=repr(ex), duration=time.perf_counter() - start)
+
+
+def _init_worker():
+    # the pool already uses all cores, so every process builds its streak on one thread
+    streak_builder.STREAK_WORKERS = 1
+    logging.getLogger("numba").setLevel(logging.WARNING)
+
+
+def estimate_memory(probe: VideoProbe) -> int:
+    """
+    estimated peak memory of evaluating a video, the frames are read in chunks,
+    so the streak image and the per frame results dominate instead of the whole decoded video
+    """
+    streak_bytes = probe.num_frames * probe.height * (1 if probe.bit_depth <= 8 else 2)
+    # contour, position, velocity and acceleration arrays as float64, raw and smoothed
+    series_bytes = probe.num_frames * 8 * 16
+    return STREAK_CHUNK_SIZE * probe.frame_bytes + 4 * streak_bytes + series_bytes
+
+
+def run_batch(files: list, params: EvalParams, streak_cache: StreakCache = None, workers: int = 1, ram_budget: int = BATCH_RAM_BUDGET, ledger: BatchLedger = None,
+              result_cache: ResultCache = None):
+    """
+    evaluates all files, failed files are logged and skipped, yields a BatchResult per file as soon as it is done
+
+    :param workers: number of processes, 1 evaluates the files one after another in this process
+    :param ram_budget: bytes the running evaluations may use together, see estimate_memory
+    :param ledger: skips files with current results in the ledger and records the outcome of all evaluated files
+    :param result_cache: files with a cached result are not evaluated again, their cached results are saved
+    """
+    # largest first, so no big file is left running alone at the end
+    probes = plan_batch(files, largest_first=workers > 1)
+    if ledger is None:
+        yield from _run_probes(probes, params, streak_cache, workers, ram_budget, result_cache)
+        return
+
+    todo, stats = ledger.pending([p.filename for p in probes], params)
+    todo = set(todo)
+    for result in _run_probes([p for p in probes if p.filename in todo], params, streak_cache, workers, ram_budget, result_cache):
+        ledger.record(result.filename, stats[result.filename], params, result.duration, result.error)
+        yield result
+
+
+def _run_probes(probes: list[VideoProbe], params: EvalParams, streak_cache: StreakCache, workers: int, ram_budget: int, result_cache: ResultCache = None):
+    if workers <= 1:
+        # decoding, evaluation and saving of consecutive files overlap
+        pipeline = Pipeline([
+            ("decode", lambda filename: _decode(filename, params, streak_cache, result_cache)),
+            ("evaluate", lambda decoded: _evaluate(decoded, result_cache)),
+            ("save", _save),
+        ])
+        for item in pipeline.run(p.filename for p in probes):
+            data, profile = item.value or (None, None)
+            yield BatchResult(item.key, data=data, profile=profile, error=item.error, duration=item.duration)
+        return
+
+    pending = list(probes)
+    running = {}
+    with process_pool(workers, _init_worker) as pool:
+        while pending or running:
+            used = sum(running.values())
+            # start the largest pending files that fit into the budget, a file exceeding the budget runs alone
+            for probe in list(pending):
+                if len(running) >= workers: break
+                size = estimate_memory(probe)
+                if used + size <= ram_budget or not running:
+                    pending.remove(probe)
+                    running[pool.submit(_process_safe, probe.filename, params, streak_cache, result_cache)] = size
+                    used += size
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                del running[future]
+                yield future.result()
+
+
+def find_files(root: str, pattern: str) -> list[Path]:
+    """ all files matching the pattern in the root directory and all subfolders recursively """
+    return sorted(Path(root).rglob(pattern))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Evaluate all bounce videos in a folder without the GUI")
+    parser.add_argument("root", help="root directory, searched recursively")
+    parser.add_argument("pattern", nargs="?", default="*.cihx", help="file match pattern (default: %(default)s)")
+    parser.add_argument("--ball-size", type=float, default=2.5, help="ball size in mm (default: %(default)s)")
+    parser.add_argument("--accel-thresh", type=float, default=EvalParams.accel_thresh, help="acceleration threshold in m/s^2 (default: %(default)s)")
+    parser.add_argument("--rel-threshold", type=float, default=EvalParams.rel_threshold, help="relative image threshold (default: %(default)s)")
+    parser.add_argument("--pixel-scale", type=float, default=None, help="pixel scale in m/px, calculated from the ball size if not given")
+    parser.add_argument("--savgol-window", type=int, default=None, help="window of the smoothing filter in frames, derived from the frame rate if not given")
+    parser.add_argument("--no-cache", action="store_true", help="do not use the streak and result caches")
+    parser.add_argument("--force", action="store_true", help="evaluate all files again, instead of only new, changed and failed ones, and do not use cached results")
+    parser.add_argument("-j", "--workers", type=int, default=BATCH_WORKERS, help="number of parallel processes (default: %(default)s)")
+    parser.add_argument("--ram-budget", type=float, default=BATCH_RAM_BUDGET / 2**30, help="memory in GiB the parallel evaluations may use together (default: %(default)s)")
+    parser.add_argument("--profile", action="store_true", help="record time and memory of every evaluation stage, saved as _profile.json next to every video")
+    parser.add_argument("-v", "--verbose", action="store_true")
+    return parser.parse_args(argv)
+
+
+def params_from_args(args) -> EvalParams:
+    return EvalParams(
+        ball_size=args.ball_size / 1000,
+        accel_thresh=args.accel_thresh,
+        rel_threshold=args.rel_threshold,
+        pixel_scale=args.pixel_scale,
+        savgol_window=args.savgol_window
+    )
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    logging.getLogger("numba").setLevel(logging.WARNING)
+    params = params_from_args(args)
+    if args.profile:
+        # also switches profiling on in the worker processes
+        os.environ["BOUNCE_PROFILE"] = "1"
+        instrumentation.PROFILE_STAGES = True
+    streak_cache = None if args.no_cache else StreakCache()
+    result_cache = None if args.no_cache or args.force else ResultCache()
+    ledger = BatchLedger(args.root)
+    if args.force: ledger.entries.clear()
+    # all results of the batch in one place, besides the files next to every video
+    store = ResultsStore(args.root)
+    params_hash = ledger.params_hash(params)
+
+    failed = 0
+    profiles = []
+    for result in run_batch(find_files(args.root, args.pattern), params, streak_cache, workers=args.workers, ram_budget=int(args.ram_budget * 2**30), ledger=ledger, result_cache=result_cache):
+        if result.error:
+            failed += 1
+        else:
+            store.append(result.data, params_hash, rel_threshold=params.rel_threshold)
+            if result.profile: profiles.append(result.profile)
+            logging.info(f"{result.filename}: COR {result.data.cor:0.3f}, max. deformation {result.data.max_deformation*1000:0.3f} mm")
+    store.flush()
+    ledger.compact()
+    if profiles: log_aggregate(aggregate_profiles(profiles))
+    logging.info(f"Batch done, {failed} failed")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,143 @@
+#     BounceAnalyzer is a program to analyze the bounces of objects
+#     Copyright (C) 2023  Raphael Kriegl
+
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import os
+import json
+import time
+import logging
+import tempfile
+from dataclasses import dataclass, asdict, replace
+from pathlib import Path
+
+from fingerprint import hash_values, recording_stat, video_fingerprint
+from result_io import result_paths
+
+# file name of the ledger in the batch root
+LEDGER_NAME = "bounce_ledger.jsonl"
+
+
+@dataclass
+class LedgerEntry:
+    """ outcome of the last evaluation of a file """
+    filename: str
+    state: str # "done" or "failed"
+    fingerprint: str # content of the recording, None if it changed while it was evaluated
+    params_hash: str
+    duration: float = 0.0
+    error: str = None
+    finished: float = 0.0
+    stat: str = None # sizes and modification times of the recording, see fingerprint.recording_stat
+
+
+class BatchLedger:
+    """
+    append only log of the evaluated files of a batch, stored as json lines in the batch root
+
+    A rerun of the batch skips files that were evaluated with the same parameters, did not change since and still have their results.
+    Unchanged files are recognized by their size and modification time, only files where those differ, e.g. copies, are fingerprinted.
+    The last line of a file wins, lines cut off by a crash are ignored.
+    """
+    def __init__(self, root):
+        self.root = Path(root).resolve()
+        self.path = self.root / LEDGER_NAME
+        self.entries: dict[str, LedgerEntry] = {}
+        self._load()
+
+    def _load(self):
+        if not self.path.exists(): return
+        content = self.path.read_text(encoding="utf-8")
+        for line in content.splitlines():
+            try:
+                entry = LedgerEntry(**json.loads(line))
+            except (json.JSONDecodeError, TypeError):
+                logging.warning(f"Ignoring broken line in {self.path}")
+                continue
+            self.entries[entry.filename] = entry
+        if content and not content.endswith("\n"):
+            # terminate a line cut off by a crash, so the next entry starts on its own line
+            with open(self.path, "a", encoding="utf-8") as f: f.write("\n")
+
+    def _key(self, filename) -> str:
+        """ files are stored relative to the root, so the ledger stays valid if the batch folder is moved """
+        path = Path(filename).resolve()
+        return str(path.relative_to(self.root)) if path.is_relative_to(self.root) else str(path)
+
+    @staticmethod
+    def params_hash(params) -> str:
+        return hash_values(sorted(asdict(params).items()))
+
+    def is_current(self, filename: str, stat: str, params_hash: str) -> bool:
+        """ True if the file was evaluated successfully with these parameters, did not change since and its results exist """
+        entry = self.entries.get(self._key(filename))
+        if (entry is None or entry.state != "done" or entry.fingerprint is None or entry.params_hash != params_hash
+                or not result_paths(filename)["json"].exists()):
+            return False
+        if entry.stat == stat:
+            return True
+        if entry.fingerprint != video_fingerprint(filename, with_mtime=False):
+            return False
+        # same content with another modification time, remember it so the next run does not fingerprint it again
+        self._append(replace(entry, stat=stat))
+        return True
+
+    def pending(self, filenames: list, params) -> tuple[list, dict[str, str]]:
+        """
+        filters out the files with current results
+
+        :returns: the files to evaluate and their recording_stat, needed to record them later
+        """
+        params_hash = self.params_hash(params)
+        todo, stats = [], {}
+        for f in filenames:
+            stat = recording_stat(f)
+            if not self.is_current(f, stat, params_hash):
+                todo.append(f)
+                stats[str(f)] = stat
+        if len(todo) < len(filenames):
+            logging.info(f"Skipping {len(filenames) - len(todo)} of {len(filenames)} files with current results")
+        return todo, stats
+
+    def record(self, filename: str, stat: str, params, duration: float, error: str = None):
+        """
+        appends the outcome of an evaluation and flushes it to disk right away
+
+        :param stat: recording_stat of the file before it was evaluated, a file that changed since is evaluated again in the next run
+        """
+        try:
+            fingerprint = video_fingerprint(filename, with_mtime=False) if recording_stat(filename) == stat else None
+        except OSError:
+            fingerprint = None
+        self._append(LedgerEntry(self._key(filename), "failed" if error else "done", fingerprint, self.params_hash(params), duration, error, time.time(), stat))
+
+    def _append(self, entry: LedgerEntry):
+        self.entries[entry.filename] = entry
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(asdict(entry)) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def compact(self):
+        """ rewrites the ledger with only the last entry of every file """
+        fd, tmp = tempfile.mkstemp(dir=self.path.parent, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            for entry in self.entries.values():
+                f.write(json.dumps(asdict(entry)) + "\n")
+        os.replace(tmp, self.path)
+
+    @property
+    def failed(self) -> list[str]:
+        """ files that failed in their last evaluation """
+        return [str(self.root / e.filename) for e in self.entries.values() if e.state == "failed"]
@@ -16,6 +16,12 @@
 
 
 
+import os
+import time
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Callable, Union
 import numpy as np
 
 import cv2
@@ -26,41 +32,190 @@ from numpy.polynomial import Polynomial
 from numpy.polynomial import polynomial as P
 
 from data_classes import BounceData, VideoInfoPresets
+from streak_builder import build_streak
+from streak_cache import StreakCache
+from instrumentation import StageProfiler
+from video_reader import IVideoReader, crop_video
 
 USE_SPLINE_CONTOUR = False
+# part of the result cache key, change when a change of the evaluation changes its results
+EVALUATOR_VERSION = "1"
+
+
+@dataclass
+class Kinematics:
+    """ position, velocity and acceleration of the object over time, raw and smoothed """
+    contour_y: np.ndarray
+    time: np.ndarray
+    position: np.ndarray
+    velocity: np.ndarray
+    acceleration: np.ndarray
+    position_smooth: np.ndarray
+    velocity_smooth: np.ndarray
+    acceleration_smooth: np.ndarray
 
-def bounce_eval(video: np.ndarray, info: VideoInfoPresets):
-        
-    w,h = info.shape
-    N = info.length
-    dt =  1/info.frame_rate
-    line_fit_window = int(round(0.0025 / dt))
-    spline_smoothing_mult = np.e**(info.frame_rate/30000 -1)
-    filter_window = int(info.frame_rate * 0.0007) # approx 21 at 30000 fps seems to work
-    pixel_scale = (0.0000197)#self._video_reader.reader.pixel_scale
-    accel_thresh = -abs(info.accel_thresh)
-    
-    # generate streak image
-    streak = video.min(axis=2).T
 
-    # find contours in streak image
-    contour_x, contour_y, _ = _find_contour(streak, info)
-    # contour_clean = _clean_contour(contour, N)
+@dataclass
+class Impact:
+    """ indices and times of touching and releasing the surface """
+    acceleration_thresh: float
+    max_acceleration: float
+    impact_idx: int
+    impact_time: float
+    release_idx: int
+    release_time: float
+    max_deformation: float
 
 
-    # calculate pixel scale
-    if not info.pixel_scale:
-        pixel_scale = _get_scale(streak, contour_y, contour_x[0], info)
-    else: pixel_scale = info.pixel_scale
+class EvaluationCancelled(Exception):
+    """ raised at the next checkpoint of an evaluation after its cancel event was set """
+
+
+class BounceEvaluator:
+    """
+    evaluates the bounce in a video as a chain of stages: streak -> contour -> scale -> kinematics -> impact -> fits
 
-    time = contour_x*dt
-    position = contour_y * pixel_scale
+    The output of every stage is memoized on its parameters and on the outputs of the stages it depends on,
+    so evaluating again after a parameter change only reruns the stages downstream of that parameter.
+    E.g. changing the acceleration threshold reruns impact and fits, changing the image threshold reruns from contour on.
+
+    An evaluation can be cancelled from another thread between stages and between the chunks of the streak,
+    the stages finished until then stay memoized.
+    """
+    def __init__(self, video: Union[IVideoReader, np.ndarray], streak_cache: StreakCache = None, profiler: StageProfiler = None):
+        self.video = video
+        self.streak_cache = streak_cache
+        # records the resources of every recomputed stage if given
+        self.profiler = profiler
+        # stage name -> (key, version, output)
+        self._memo: dict[str, tuple] = {}
+        self.recomputed: list[str] = []
+        self.timings: dict[str, float] = {}
+        self.cancel_event: threading.Event = None
+        self.stage_callback: Callable[[str], None] = None
+
+    def _check_cancelled(self):
+        if self.cancel_event is not None and self.cancel_event.is_set():
+            raise EvaluationCancelled()
+
+    def _stage(self, name: str, fn: Callable, params: tuple, *depends_on: str):
+        """ returns the memoized output of stage name, or runs fn if params or any upstream output changed """
+        key = (params, tuple(self._memo[d][1] for d in depends_on))
+        memo = self._memo.get(name)
+        if memo is not None and memo[0] == key:
+            return memo[2]
+        self._check_cancelled()
+        if self.stage_callback: self.stage_callback(name)
+        start = time.perf_counter()
+        if self.profiler is not None:
+            with self.profiler.stage(name):
+                output = fn()
+        else:
+            output = fn()
+        self.timings[name] = time.perf_counter() - start
+        self.recomputed.append(name)
+        self._memo[name] = (key, memo[1] + 1 if memo else 0, output)
+        return output
+
+    def streak(self, info: VideoInfoPresets, progress_callback: Callable[[float], None] = None) -> np.ndarray:
+        """ generate streak image, or load it from the cache if this video was evaluated before, the only stage that reads the video """
+        def progress(frac):
+            # checkpoint after every chunk, reading the video is by far the longest stage
+            self._check_cancelled()
+            if progress_callback: progress_callback(frac)
+        return self._stage("streak", lambda: _get_streak(self.video, info, progress, self.streak_cache), (info.roi,))
+
+    def evaluate(self, info: VideoInfoPresets, progress_callback: Callable[[float], None] = None, cancel_event: threading.Event = None,
+                 stage_callback: Callable[[str], None] = None):
+        """
+        evaluates the video with the parameters in info, returns the BounceData and the streak image
+
+        :param progress_callback: called with the fraction of the streak that was built
+        :param cancel_event: setting it raises EvaluationCancelled at the next checkpoint
+        :param stage_callback: called with the name of every stage that is recomputed, before it runs
+        """
+        self.cancel_event = cancel_event
+        self.stage_callback = stage_callback
+        self.recomputed = []
+        self.timings = {}
+        frame_offset = slice(*(info.frame_range or (None,))).indices(info.length)[0]
+        row_offset = slice(*(info.roi_rows or (None,))).indices(info.shape[0])[0]
+        line_fit_window = _line_fit_window(info.frame_rate)
+        filter_window = _filter_window(info.frame_rate, info.savgol_window)
+
+        streak = self.streak(info, progress_callback)
+        # find contours in streak image
+        contour_x, contour_y = self._stage("contour", lambda: _find_contour(streak, info)[:2], (info.rel_threshold, info.bit_depth), "streak")
+        # calculate pixel scale
+        pixel_scale = self._stage("scale", lambda: info.pixel_scale or _get_scale(streak, contour_y, contour_x[0], info), (info.pixel_scale, info.ball_size), "streak", "contour")
+        kin = self._stage("kinematics", lambda: _kinematics(contour_x, contour_y, pixel_scale, info.frame_rate, filter_window, frame_offset, row_offset), (info.frame_rate, filter_window, frame_offset, row_offset), "contour", "scale")
+        impact = self._stage("impact", lambda: _impact(kin, info.accel_thresh, info.frame_rate), (info.accel_thresh, info.frame_rate), "kinematics")
+        dist_linefit_down, dist_linefit_up = self._stage("fits", lambda: _line_fits(kin, impact, line_fit_window), (line_fit_window,), "kinematics", "impact")
+        self._check_cancelled()
+        cof = abs(dist_linefit_up.coef[1] / dist_linefit_down.coef[1])
+
+        w,h = info.shape
+        data = BounceData(
+            contour_x=contour_x,
+            contour_y=kin.contour_y,
+            time=kin.time,
+            position=kin.position,
+            velocity=kin.velocity,
+            acceleration=kin.acceleration,
+            position_smooth=kin.position_smooth,
+            velocity_smooth=kin.velocity_smooth,
+            acceleration_smooth=kin.acceleration_smooth,
+            acceleration_thresh=impact.acceleration_thresh,
+            impact_idx=impact.impact_idx,
+            impact_time=impact.impact_time,
+            release_idx=impact.release_idx,
+            release_time=impact.release_time,
+            max_deformation=impact.max_deformation,
+            max_acceleration=impact.max_acceleration,
+            cor=cof,
+            speed_in=dist_linefit_down.coef[1],
+            speed_out=dist_linefit_up.coef[1],
+            speed_in_intercept=dist_linefit_down.coef[0],
+            speed_out_intercept=dist_linefit_up.coef[0],
+            video_framerate=info.frame_rate,
+            video_resolution= f"{w}x{h}",
+            video_num_frames=info.length,
+            video_pixel_scale=pixel_scale,
+            video_name=info.filename,
+            video_roi=info.roi
+        )
+        logging.debug("Recomputed stages: " + ", ".join(f"{name} {t*1000:.1f} ms" for name, t in self.timings.items()))
+        return data, streak
+
+
+def bounce_eval(video: Union[IVideoReader, np.ndarray], info: VideoInfoPresets, progress_callback: Callable[[float], None] = None, streak_cache: StreakCache = None):
+    """ evaluates all stages of the bounce in video, use a BounceEvaluator to reevaluate the same video with other parameters """
+    return BounceEvaluator(video, streak_cache).evaluate(info, progress_callback)
+
+
+def _filter_window(frame_rate, savgol_window: int = None) -> int:
+    """ window of the Savitzky-Golay filter, derived from the frame rate if not set """
+    return savgol_window or int(frame_rate * 0.0007) # approx 21 at 30000 fps seems to work
+
+
+def _line_fit_window(frame_rate) -> int:
+    """ number of frames after release used for the outgoing speed """
+    return int(round(0.0025 * frame_rate))
+
+
+def _kinematics(contour_x, contour_y, pixel_scale, frame_rate, filter_window, frame_offset=0, row_offset=0) -> Kinematics:
+    """ converts the contour to position over time and derives velocity and acceleration """
+    dt =  1/frame_rate
+    spline_smoothing_mult = np.e**(frame_rate/30000 -1)
+
+    time = (contour_x + frame_offset)*dt
+    position = (contour_y + row_offset) * pixel_scale
 
     if USE_SPLINE_CONTOUR:
         m = len(contour_x)
         spl = splrep(contour_x, contour_y, s=np.sqrt(2*m)*spline_smoothing_mult)
-        y_new = splev(contour_x, spl, der=0)
-        position_f = y_new * pixel_scale
+        contour_y = splev(contour_x, spl, der=0)
+        position_f = contour_y * pixel_scale
 
         velocity = np.gradient(savgol_filter(position, filter_window, 5, mode="interp"), time)
         velocity_fs = np.gradient(position_f, time)
@@ -77,6 +232,14 @@ def bounce_eval(video: np.ndarray, info: VideoInfoPresets):
         # accel_s = np.gradient(velocity_fs, time)
         accel_fs = savgol_filter(accel, filter_window, 5, mode="interp")
 
+    return Kinematics(contour_y, time, position, velocity, accel, position_f, velocity_fs, accel_fs)
+
+
+def _impact(kin: Kinematics, accel_thresh, frame_rate) -> Impact:
+    """ detects touching the surface by the acceleration threshold and release by the position """
+    dt = 1/frame_rate
+    accel_thresh = -abs(accel_thresh)
+    time, position, accel, accel_fs = kin.time, kin.position, kin.acceleration, kin.acceleration_smooth
 
     max_acc_idx = np.abs(accel).argmax()
     max_acc = accel[max_acc_idx]
@@ -88,46 +251,29 @@ def bounce_eval(video: np.ndarray, info: VideoInfoPresets):
     release_point = max_acc_idx + (np.argwhere(position[max_acc_idx:]<=position[touch_point])[0]).item()
     release_time = release_point*dt + time[0]
 
-    max_dist = position.argmax()
     max_deformation = np.abs(position[touch_point] - position.max()).squeeze()
+    return Impact(accel_thresh, max_acc, touch_point, touch_time, release_point, release_time, max_deformation)
 
-    # linefit on position before and after hit for velocity detection
+
+def _line_fits(kin: Kinematics, impact: Impact, line_fit_window):
+    """ linefit on position before and after hit for velocity detection """
+    time, position = kin.time, kin.position
+    touch_point, release_point = impact.impact_idx, impact.release_idx
     dist_linefit_down = Polynomial(P.polyfit(time[:touch_point], position[:touch_point],deg=1))
     dist_linefit_up = Polynomial(P.polyfit(time[release_point:release_point + line_fit_window], position[release_point:release_point + line_fit_window],deg=1))
-    cof = abs(dist_linefit_up.coef[1] / dist_linefit_down.coef[1])
-
-
-    data = BounceData(
-        contour_x=contour_x,
-        contour_y=y_new if USE_SPLINE_CONTOUR else contour_y,
-        time=time,
-        position=position,
-        velocity=velocity,
-        acceleration=accel,
-        position_smooth=position_f,
-        velocity_smooth=velocity_fs,
-        acceleration_smooth=accel_fs,
-        acceleration_thresh=accel_thresh,
-        impact_idx=touch_point,
-        impact_time=touch_time,
-        release_idx=release_point,
-        release_time=release_time,
-        max_deformation=max_deformation,
-        max_acceleration=max_acc,
-        cor=cof,
-        speed_in=dist_linefit_down.coef[1],
-        speed_out=dist_linefit_up.coef[1],
-        speed_in_intercept=dist_linefit_down.coef[0],
-        speed_out_intercept=dist_linefit_up.coef[0],
-        video_framerate=info.frame_rate,
-        video_resolution= f"{w}x{h}",
-        video_num_frames=N,
-        video_pixel_scale=pixel_scale,
-        video_name=info.filename
-    )
+    return dist_linefit_down, dist_linefit_up
 
-    
-    return data, streak
+
+def _get_streak(video, info: VideoInfoPresets, progress_callback=None, streak_cache: StreakCache = None):
+    """ streams the frames in chunks cropped to the region of interest and reduces them to the streak image, uses the cache if given """
+    use_cache = streak_cache is not None and os.path.exists(info.filename)
+    streak = streak_cache.load(info.filename, info) if use_cache else None
+    if streak is None:
+        streak = build_streak(crop_video(video, info.roi_rows, info.roi_cols, info.frame_range), progress_callback=progress_callback)
+        if use_cache: streak_cache.store(info.filename, info, streak)
+    elif progress_callback:
+        progress_callback(1.0)
+    return streak
 
 
 def _second_order_central_diff(y,x):
@@ -162,24 +308,12 @@ def _find_contour(img: np.ndarray, info:VideoInfoPresets):
     this determines the top contour of the streak image by fractional indexing (similar to LabView Threshold 1D)
     uses used defined relative threshold (to max value) for edge detection
     """
-    cvimg = int(2**info.bit_depth-1) - img #invert image by subtracting it from fully white max value
+    cvimg = _invert_streak(img, info.bit_depth)
     # blur = cvimg #cv2.GaussianBlur(cvimg, (5,5), 1)#
 
     thresh = info.rel_threshold * cvimg.max()
-    thresh_idx = np.argmin(cvimg <= thresh, axis=0)
-    thresh_x = np.arange(len(thresh_idx))
-    contour_x, upper_idx = _clean_contour(np.array([thresh_x, thresh_idx]), info.length)
-
-    # fractional indexing to return smoother position line
-    lower_idx = upper_idx - 1
-    upper_values = cvimg[upper_idx,contour_x].astype(np.float64)
-    lower_values = cvimg[lower_idx,contour_x].astype(np.float64)
-
-    delta = (upper_values - lower_values)
-
-    frac_idx = lower_idx + (upper_idx - lower_idx) * (thresh - lower_values)/delta
-    contour_y = np.where(delta == 0, upper_idx, frac_idx)
-    # contour = np.array([clean_x, frac_idx])
+    thresh_idx = _threshold_crossing(cvimg, thresh)
+    contour_x, contour_y = _fractional_contour(cvimg, thresh, thresh_idx)
     
     # contours, _ = cv2.findContours(cvimg.astype(np.uint8), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_NONE)
     # # get the contour that has the least mean y value, which should be the upper most contour
@@ -193,6 +327,35 @@ def _find_contour(img: np.ndarray, info:VideoInfoPresets):
     # contour = np.array([contour_x, contour_y])
     return contour_x, contour_y, cvimg
 
+def _invert_streak(img: np.ndarray, bit_depth: int) -> np.ndarray:
+    """ invert image by subtracting it from fully white max value """
+    return int(2**bit_depth-1) - img
+
+def _threshold_crossing(cvimg: np.ndarray, thresh: float, scratch: np.ndarray = None) -> np.ndarray:
+    """
+    row index of the first pixel above the threshold in every column of the inverted streak, 0 if a column never crosses it
+
+    :param scratch: bool array of the shape of cvimg that is reused for the mask, e.g. when looping over many thresholds
+    """
+    return np.argmin(np.less_equal(cvimg, thresh, out=scratch), axis=0)
+
+def _fractional_contour(cvimg: np.ndarray, thresh: float, thresh_idx: np.ndarray):
+    """ cleans the threshold crossings of one threshold and interpolates between the rows around it """
+    thresh_x = np.arange(len(thresh_idx))
+    contour_x, upper_idx = _clean_contour(np.array([thresh_x, thresh_idx]), cvimg.shape[1])
+
+    # fractional indexing to return smoother position line
+    lower_idx = upper_idx - 1
+    upper_values = cvimg[upper_idx,contour_x].astype(np.float64)
+    lower_values = cvimg[lower_idx,contour_x].astype(np.float64)
+
+    delta = (upper_values - lower_values)
+
+    frac_idx = lower_idx + (upper_idx - lower_idx) * (thresh - lower_values)/delta
+    contour_y = np.where(delta == 0, upper_idx, frac_idx)
+    # contour = np.array([clean_x, frac_idx])
+    return contour_x, contour_y
+
 def _clean_contour(contour, num_frames):
     # remove contour parts that touch the image border
     del_pos = np.argwhere(contour[1]==0)
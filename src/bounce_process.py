@@ -17,8 +17,8 @@
 import os, sys
 sys.path.append('src')
 sys.path.append('qt')
+import time
 import logging
-import traceback
 from pathlib import Path
 #silences error on program quit, as handler is deleted before logger
 logging.raiseExceptions = False
@@ -35,9 +35,16 @@ from PySide6.QtCore import QCoreApplication, Qt, Signal, Slot
 from ui_bounce import Ui_Bounce
 from ui_patterndlg import Ui_PatternDialog
 from video_controller import VideoController
-from bounce_evaluator import bounce_eval
+from bounce_evaluator import BounceEvaluator
 from data_control import DataControl
+from video_probe import plan_batch
+from streak_cache import StreakCache
+from result_cache import ResultCache
+from batch_engine import EvalParams
+from batch_ledger import BatchLedger
 from qthread_worker import CallbackWorker, Worker
+from eval_worker import EvalWorker
+from instrumentation import PROFILE_STAGES, StageProfiler
 
 
 class PatternDialog(QDialog, Ui_PatternDialog):
@@ -86,6 +93,21 @@ class BounceAnalyzer(QMainWindow, Ui_Bounce):
         self.video_done = False
         self.abort_batch_flag = False
         self.batch_thread = None
+        self.streak_cache = StreakCache()
+        self.result_cache = ResultCache()
+        self.batch_ledger: BatchLedger = None
+        self.batch_stats: dict[str, str] = {}
+        self.batch_params: EvalParams = None
+        # videos of the running batch that were not started yet, the current one and when it was started
+        self.batch_queue: list[str] = []
+        self.batch_total = 0
+        self.batch_file: str = None
+        self.batch_start = 0.0
+        self.evaluator: BounceEvaluator = None
+        self.eval_worker: EvalWorker = None
+        self._pending_eval = None
+        self.eval_error: str = None
+        self.batch_running = False
         self.setAcceptDrops(True)
 
         self.videoController.load_video("data/ball_12bit_full.cihx")
@@ -94,6 +116,12 @@ class BounceAnalyzer(QMainWindow, Ui_Bounce):
         self.register_action_events()
 
     def closeEvent(self, event):
+        if self.eval_worker is not None and self.eval_worker.isRunning():
+            # a cancelled evaluation of a batch must neither be recorded as done nor start the next file
+            self.batch_running = False
+            self.batch_queue = []
+            self.cancel_eval()
+            self.eval_worker.wait()
         self.videoViewer.closeEvent(event)
         return super().closeEvent(event)
 
@@ -110,6 +138,7 @@ class BounceAnalyzer(QMainWindow, Ui_Bounce):
         self.abortBatchBtn.clicked.connect(self.batch_abort)
 
         self.data_control.data_update_done_signal.connect(self.set_done)
+        self.videoController.loaded_video_signal.connect(self.cancel_eval)
         self.update_progress_signal.connect(self.update_progress)
         
         self.saveDataBtn.clicked.connect(self.data_control.save_dialog)
@@ -119,6 +148,8 @@ class BounceAnalyzer(QMainWindow, Ui_Bounce):
         # shortcuts
         QShortcut(QtGui.QKeySequence("Space"), self, self.videoController.play_pause)
         QShortcut(QtGui.QKeySequence("Ctrl+S"), self, lambda: self.videoController.save_current_frame())
+        QShortcut(QtGui.QKeySequence("["), self, self.data_control.set_frame_range_start)
+        QShortcut(QtGui.QKeySequence("]"), self, self.data_control.set_frame_range_stop)
 
     
     def dragEnterEvent(self, event: QtGui.QDragEnterEvent) -> None:
@@ -146,17 +177,77 @@ class BounceAnalyzer(QMainWindow, Ui_Bounce):
             event.ignore()
 
     def bounce_eval(self):
-        info = self.data_control.eval_params
-        data, streak = bounce_eval(self.videoController.reader.image_array, info)
+        """ evaluates the loaded video on a worker thread, a running evaluation is cancelled and replaced by the new one """
+        # keep the evaluator of the loaded video, so only stages affected by changed parameters are recomputed
+        if self.evaluator is None or self.evaluator.video is not self.videoController.reader:
+            self.evaluator = BounceEvaluator(self.videoController.reader, streak_cache=self.streak_cache, profiler=StageProfiler() if PROFILE_STAGES else None)
+        self.video_done = False
+        self.eval_error = None
+        self._pending_eval = (self.evaluator, self.data_control.eval_params)
+        if self.eval_worker is not None and self.eval_worker.isRunning():
+            # the pending evaluation starts when the cancelled one reached its next checkpoint
+            self.eval_worker.cancel()
+            return
+        self._start_eval()
+
+    def _start_eval(self):
+        evaluator, info = self._pending_eval
+        self._pending_eval = None
+        self.eval_worker = EvalWorker(evaluator, info, self.result_cache)
+        self.eval_worker.result_signal.connect(self._eval_result)
+        self.eval_worker.stage_signal.connect(lambda stage: self.statusBar().showMessage(f"Evaluating: {stage}"))
+        self.eval_worker.error_signal.connect(self._eval_failed)
+        self.eval_worker.finished.connect(self._eval_finished)
+        if not self.batch_running:
+            self.eval_worker.progress_signal.connect(self.update_progress)
+            self.progressBar.setValue(0)
+            self.progressBar.show()
+        self.eval_worker.start()
+
+    @Slot(object, object)
+    def _eval_result(self, data, streak):
+        # results are queued to the GUI thread, so the worker can have been cancelled after it emitted
+        if self.sender().cancelled: return
         self.data_control.update_data_signal.emit(data, streak)
 
+    @Slot()
+    def cancel_eval(self):
+        """ cancels the running evaluation, e.g. because another video was loaded and its result would belong to the previous one """
+        self._pending_eval = None
+        if self.eval_worker is not None and self.eval_worker.isRunning():
+            self.eval_worker.cancel()
+
+    @Slot(str)
+    def _eval_failed(self, error):
+        self.eval_error = error
+        if not self.batch_running:
+            QMessageBox.critical(self, "Evaluation failed", error)
+
+    @Slot()
+    def _eval_finished(self):
+        # the thread ends right after emitting finished, so isRunning is reliable for the next evaluation
+        self.eval_worker.wait()
+        if self._pending_eval is not None:
+            self._start_eval()
+            return
+        self.statusBar().clearMessage()
+        self.set_done()
+        if self.batch_running:
+            # the result was delivered and saved before the worker finished, so the batch can move on
+            self._batch_file_done(self.eval_error)
+        else:
+            self.progressBar.hide()
+
     @Slot(list)
     def file_dropped(self, files):
+        if self.batch_running:
+            QMessageBox.warning(self, "Batch running", "Wait for the batch to finish or abort it first!")
+            return
         if len(files) == 1:
             file = Path(files[0])
             if file.is_file():
                 logging.info(f"Loading file {str(file)}")
-                if file.suffix in [".json", ".csv"]:
+                if file.suffix in [".json", ".npz", ".csv"]:
                     self.data_control.load_data(file)
                     self.tabWidget.setCurrentIndex(1)
                 else:
@@ -173,21 +264,35 @@ class BounceAnalyzer(QMainWindow, Ui_Bounce):
         dlg = PatternDialog(parent=self, root_path_prefill=root)
         if dlg.exec():
             root, pattern = dlg.values
-            glb = list(Path(root).rglob(pattern))
-            # self.batch_process(glb)
+            # read only the headers, to drop broken files and size the batch before decoding anything
+            glb = [probe.filename for probe in plan_batch(Path(root).rglob(pattern))]
+            # files evaluated with the same parameters by an earlier, possibly aborted, run are skipped
+            # the pixel scale is read from every video when it is loaded, so it is not part of the parameters
+            dc = self.data_control
+            self.batch_params = EvalParams(ball_size=dc.ball_size, accel_thresh=dc.accel_thresh, rel_threshold=dc.rel_threshold)
+            self.batch_ledger = BatchLedger(root)
+            glb, self.batch_stats = self.batch_ledger.pending(glb, self.batch_params)
             self.progressBar.setValue(0)
             self.progressBar.show()
             self.abortBatchBtn.show()
             self.batch_process(glb)
-            self.batch_done()
-            # self.batch_thread = CallbackWorker(self.batch_process, glb, slotOnFinished=self.batch_done)
-            # self.batch_thread.start()
+
+    def set_eval_triggers_enabled(self, enabled: bool):
+        """ manual evaluations and loading other videos would replace the evaluation of the batch, so they are disabled while it runs """
+        self.startEvalBtn.setEnabled(enabled)
+        self.actionOpen.setEnabled(enabled)
+        self.actionBatch_Process.setEnabled(enabled)
 
     def batch_done(self):
-        QMessageBox.information(self, "Done", "Batch processing done!")
+        if self.batch_ledger: self.batch_ledger.compact()
+        self.batch_queue = []
+        self.batch_file = None
+        self.batch_running = False
+        self.abort_batch_flag = False
+        self.set_eval_triggers_enabled(True)
         self.progressBar.hide()
         self.abortBatchBtn.hide()
-        self.abort_batch_flag = False
+        QMessageBox.information(self, "Done", "Batch processing done!")
 
     def batch_abort(self):
         self.abort_batch_flag = True
@@ -201,33 +306,45 @@ class BounceAnalyzer(QMainWindow, Ui_Bounce):
         self.progressBar.setValue(int(round(frac,2)*100))
         
     def batch_process(self, files):
-        total_count = len(files)
-        cur_count = 0
-        for f in files:
+        """ evaluates the files one after the other, each evaluation is started when the one before finished, see _eval_finished """
+        self.batch_queue = list(files)
+        self.batch_total = len(files)
+        self.batch_running = True
+        self.set_eval_triggers_enabled(False)
+        self._batch_next()
+
+    def _batch_next(self):
+        while self.batch_queue and not self.abort_batch_flag:
+            self.batch_file = self.batch_queue.pop(0)
+            self.batch_start = time.perf_counter()
+            logging.info(f"Process file {self.batch_file}")
             try:
-                if self.abort_batch_flag: return
-                self.auto_process(f)
+                self.data_control.save_on_data_event = True
+                self.videoController.load_video(self.batch_file)
+                self.bounce_eval()
+                return
             except Exception as e:
-                res = QMessageBox.question(self,"Error encountered!", f"While prosessing the program encountered an error. Continue?\n\nError:\n{traceback.print_exc()}")
-                if res == QMessageBox.StandardButton.Yes:
-                    continue
-                else:
-                    return
-            finally:
-                cur_count += 1
-                self.update_progress_signal.emit(cur_count/total_count)
-            QApplication.processEvents()
-
-    def auto_process(self, filename):
-        logging.info(f"Process file {filename}")
-        self.data_control.save_on_data_event = True
-        self.video_done = False
-        self.videoController.load_video(filename)
-        self.bounce_eval()
-        # self.evaluator._thread.wait()
-        # self.evaluator.video_eval(callback=self.set_done)
-        QApplication.processEvents()
-        
+                logging.exception(f"Cannot process {self.batch_file}")
+                self.data_control.save_on_data_event = False
+                if not self._batch_record(repr(e)): break
+        self.batch_done()
+
+    def _batch_file_done(self, error: str = None):
+        self.data_control.save_on_data_event = False
+        if self._batch_record(error):
+            self._batch_next()
+        else:
+            self.batch_done()
+
+    def _batch_record(self, error: str = None) -> bool:
+        """ records the current file in the ledger and updates the progress, returns whether the batch continues """
+        self.batch_ledger.record(self.batch_file, self.batch_stats[self.batch_file], self.batch_params,
+                                 time.perf_counter() - self.batch_start, error=error)
+        self.update_progress_signal.emit((self.batch_total - len(self.batch_queue)) / self.batch_total)
+        if error is None:
+            return True
+        res = QMessageBox.question(self, "Error encountered!", f"While prosessing the program encountered an error. Continue?\n\nError:\n{error}")
+        return res == QMessageBox.StandardButton.Yes
 
 
 class App(QApplication):
@@ -14,9 +14,11 @@
 #     You should have received a copy of the GNU General Public License
 #     along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
-from dataclasses import dataclass, field
-from dataclass_wizard import JSONSerializable, JSONFileWizard
+import json
+from dataclasses import dataclass, field, fields
+from dataclass_wizard import JSONSerializable, LoadMixin, DumpMixin
 import numpy as np
+import pandas as pd
 
 @dataclass
 class VideoInfoPresets:
@@ -29,25 +31,52 @@ class VideoInfoPresets:
     filename: str
     ball_size: float
     rel_threshold: float
+    # region of interest as (start, stop) windows, applied while reading the video, None uses the full range
+    roi_rows: tuple[int,int] = None
+    roi_cols: tuple[int,int] = None
+    frame_range: tuple[int,int] = None
+    # window of the Savitzky-Golay filter in frames, None derives it from the frame rate
+    savgol_window: int = None
+
+    @property
+    def roi(self) -> str:
+        """ region of interest as 'rows,cols,frames' string of start:stop ranges, empty if the whole video is used """
+        if not (self.roi_rows or self.roi_cols or self.frame_range):
+            return ""
+        height, width = self.shape[:2]
+        ranges = [slice(*(r or (None,))).indices(n)[:2] for r, n in ((self.roi_rows, height), (self.roi_cols, width), (self.frame_range, self.length))]
+        return ",".join(f"{start}:{stop}" for start, stop in ranges)
+
+# per frame series of BounceData, all other fields are scalars
+SERIES_FIELDS = ("contour_x", "contour_y", "time", "position", "velocity", "acceleration", "position_smooth", "velocity_smooth", "acceleration_smooth")
+# dtype of the float series, float32 halves their memory but keeps only about 7 significant digits
+SERIES_FLOAT_DTYPE = np.float64
+SERIES_INT_DTYPE = np.int32
+
 
 # @dataclass_json
-@dataclass
-class BounceData(JSONSerializable, JSONFileWizard):
+@dataclass(slots=True)
+class BounceData(JSONSerializable, LoadMixin, DumpMixin):
+    """
+    results of an evaluation, the per frame series are numpy arrays
+
+    The json files contain the series as lists, the same format as before the series were arrays.
+    """
     video_framerate: float
     video_resolution: str
     video_num_frames: int
     video_pixel_scale: float #mm/px
     video_name: str = field(compare=False)
 
-    contour_x: list[int]
-    contour_y: list[float]
-    time: list[float]
-    position: list[float]
-    velocity: list[float]
-    acceleration: list[float]
-    position_smooth: list[float]
-    velocity_smooth: list[float]
-    acceleration_smooth: list[float]
+    contour_x: np.ndarray
+    contour_y: np.ndarray
+    time: np.ndarray
+    position: np.ndarray
+    velocity: np.ndarray
+    acceleration: np.ndarray
+    position_smooth: np.ndarray
+    velocity_smooth: np.ndarray
+    acceleration_smooth: np.ndarray
 
     acceleration_thresh: float
     impact_idx: int = 0.0
@@ -62,20 +91,41 @@ class BounceData(JSONSerializable, JSONFileWizard):
     speed_in_intercept: float = 0.0
     speed_out_intercept: float = 0.0
     max_acceleration: float = 0.0
-
-
-
+    video_roi: str = ""
 
     def __post_init__(self):
-        self.contour_x = list(self.contour_x)
-        self.contour_y = list(self.contour_y)
-        self.time = list(self.time)
-        self.position = list(self.position)   
-        self.velocity = list(self.velocity)
-        self.acceleration = list(self.acceleration)
-        self.position_smooth = list(self.position_smooth)
-        self.velocity_smooth = list(self.velocity_smooth)
-        self.acceleration_smooth = list(self.acceleration_smooth)
-
-
-
+        # no copy if the evaluation already returns arrays of the right dtype
+        for name in SERIES_FIELDS:
+            dtype = SERIES_INT_DTYPE if name == "contour_x" else SERIES_FLOAT_DTYPE
+            setattr(self, name, np.asarray(getattr(self, name), dtype=dtype))
+
+    def __eq__(self, other):
+        if other.__class__ is not self.__class__:
+            return NotImplemented
+        for f in fields(self):
+            if not f.compare: continue
+            a, b = getattr(self, f.name), getattr(other, f.name)
+            if not (np.array_equal(a, b) if f.name in SERIES_FIELDS else a == b):
+                return False
+        return True
+
+    def series_table(self) -> pd.DataFrame:
+        """ table with a column per series and the scalars repeated in every row, the series columns share the memory of the arrays """
+        table = pd.DataFrame({name: getattr(self, name) for name in SERIES_FIELDS}, copy=False)
+        for i, f in enumerate(fields(self)):
+            if f.name not in SERIES_FIELDS:
+                table.insert(i, f.name, getattr(self, f.name))
+        return table
+
+    @classmethod
+    def from_json_file(cls, file, *, decoder=json.load, **decoder_kwargs):
+        with open(file) as f:
+            return cls.from_dict(decoder(f, **decoder_kwargs))
+
+    def to_json_file(self, file, mode="w", encoder=json.dump, **encoder_kwargs):
+        with open(file, mode) as f:
+            encoder(self.to_dict(), f, **encoder_kwargs)
+
+
+BounceData.register_load_hook(np.ndarray, lambda o, *_: np.asarray(o))
+BounceData.register_dump_hook(np.ndarray, lambda o, *_: o.tolist())
@@ -17,7 +17,6 @@
 import logging
 
 from pathlib import Path
-from dataclasses import asdict
 from scipy import stats
 import numpy as np
 import pandas as pd
@@ -30,6 +29,7 @@ from PIL import Image
 
 from video_controller import VideoController
 from data_classes import BounceData, VideoInfoPresets
+from result_io import load_result, result_paths, save_result
 from video_reader import IVideoReader
 
 from typing import TYPE_CHECKING
@@ -60,6 +60,9 @@ class DataControl(QObject):
         self.save_on_data_event = False
         self.rel_threshold = 0.5
         self.target_path = None
+        self.roi_rows = None
+        self.roi_cols = None
+        self.frame_range = None
 
         self._plot_thread: Worker = None
         self.ui: Ui_Bounce = self.parent()
@@ -80,6 +83,7 @@ class DataControl(QObject):
         self.ui.relThreshSpin.valueChanged.connect(self.set_rel_thresh)
         self.update_data_signal.connect(self.update_data)
         self.video_controller.loaded_video_signal.connect(self.update_video_info)
+        self.video_controller.player.update_roi_event.connect(self.update_roi)
 
 
     def set_accel_thresh(self, value):
@@ -93,6 +97,27 @@ class DataControl(QObject):
         self.video_path = Path(name)
         self.pixel_scale = reader.pixel_scale if reader.pixel_scale != 1.0 else None
         self.bit_depth = reader.color_bit_depth
+        self.update_roi(None)
+        self.frame_range = None
+        self.video_controller.player.set_roi(None)
+
+    @Slot(object)
+    def update_roi(self, roi):
+        """ sets the row and column window of the region of interest, None clears it """
+        self.roi_rows, self.roi_cols = roi if roi else (None, None)
+        logging.info(f"Region of interest: rows {self.roi_rows}, columns {self.roi_cols}" if roi else "Region of interest cleared")
+
+    def set_frame_range_start(self):
+        """ sets the start of the evaluated frame range to the current frame """
+        stop = self.frame_range[1] if self.frame_range else None
+        self.frame_range = (self.video_controller.current_frame_pos, stop)
+        logging.info(f"Frame range: {self.frame_range}")
+
+    def set_frame_range_stop(self):
+        """ sets the end of the evaluated frame range to the current frame (inclusive) """
+        start = self.frame_range[0] if self.frame_range else 0
+        self.frame_range = (start, self.video_controller.current_frame_pos + 1)
+        logging.info(f"Frame range: {self.frame_range}")
 
     @Slot(float)
     def update_ball_size(self, value):
@@ -120,7 +145,7 @@ class DataControl(QObject):
         # self.eval_data = eval_data
         self.streak_image = streak
 
-        self.ui.tableView.redraw_table_signal.emit(pd.DataFrame.from_dict(asdict(bounce_data)))
+        self.ui.tableView.redraw_table_signal.emit(bounce_data.series_table())
         self.update_plots()
         # TODO add scatter overly for live plot widget, etc, do all datahandling in this datacontrol
         self.ui.tabWidget.setCurrentIndex(1)
@@ -171,31 +196,7 @@ class DataControl(QObject):
         """ saves data as json (can be loaded to view curves again) and as csv (for the extracted parameters). Also saves streak image."""
         if not filename:
             filename = self.video_path.with_suffix(".json")
-        filename = Path(filename).with_suffix(".json")
-
-        if self.bounce_data is not None:
-            self.bounce_data.to_json_file(filename)
-
-            eval_data = pd.DataFrame()
-            eval_data["acceleration_thresh"] = [self.bounce_data.acceleration_thresh]
-            eval_data["impact_idx"] = self.bounce_data.impact_idx
-            eval_data["impact_time"] = self.bounce_data.impact_time    
-            eval_data["release_idx"] = self.bounce_data.release_idx
-            eval_data["release_time"] = self.bounce_data.release_time   
-            eval_data["max_deformation"] = self.bounce_data.max_deformation
-            eval_data["COR"] = self.bounce_data.cor
-            eval_data["speed_in"] = self.bounce_data.speed_in
-            eval_data["speed_out"] = self.bounce_data.speed_out
-            eval_data["max_acceleration"] = self.bounce_data.max_acceleration
-            eval_data["video_framerate"] = self.bounce_data.video_framerate
-            eval_data["video_resolution"] = self.bounce_data.video_resolution#f"{w}x{h}"
-            eval_data["video_num_frames"] = self.bounce_data.video_num_frames
-            eval_data["video_pixel_scale"] = self.bounce_data.video_pixel_scale
-            eval_data["video_name"] = self.bounce_data.video_name
-            eval_data["img_rel_threshold"] = self.rel_threshold
-
-            eval_data.to_csv(filename.parent/(filename.stem + "_eval.csv"), sep='\t', header=True, index=False)
-        if self.streak_image is not None: Image.fromarray(self.streak_image).save(filename.with_stem(filename.stem + "_streak").with_suffix(".png"))
+        save_result(filename, self.bounce_data, self.streak_image, self.rel_threshold)
 
     def save_dialog(self):
         dlg = QFileDialog.getSaveFileName(parent=self.parent(), caption="Save Data", dir=str(self.video_path.with_suffix(".csv")), filter="Comma Separated Values (*.csv)")
@@ -203,8 +204,8 @@ class DataControl(QObject):
             self.save_data(dlg[0])
 
     def load_data(self, file):
-        """ loads previously saved csv and json files
-        will also check if json is in same directory as csv or streak image and then load that additionally
+        """ loads previously saved npz, json and csv files
+        will also check if npz or json is in same directory as csv or streak image and then load that additionally
         """
         file = Path(file)
         self.clear_plots()
@@ -214,13 +215,17 @@ class DataControl(QObject):
             eval_file = file
             file = Path(file.with_stem(file.stem[:-5]))
 
-        if file.exists() and file.suffix == ".json":
-            data = BounceData.from_json_file(file)
+        paths = result_paths(file)
+        data = None
+        # the npz result loads faster than the json
+        result_file = file if file.suffix in (".npz", ".json") else next((p for p in (paths["npz"], paths["json"]) if p.exists()), file)
+        if result_file.exists() and result_file.suffix in (".npz", ".json"):
+            data = load_result(result_file)
             self.plot_graphs(data)
             self.set_info(data)
 
-        streak_path = file.with_stem(file.stem + "_streak").with_suffix(".png")
-        if streak_path.exists():
+        streak_path = paths["png"]
+        if streak_path.exists() and data is not None:
             img = np.asarray(Image.open(streak_path))
             self.plot_image(img, data)
         
@@ -241,7 +246,10 @@ class DataControl(QObject):
             bit_depth=self.bit_depth,
             filename=str(self.video_path),
             ball_size=self.ball_size,
-            rel_threshold=self.rel_threshold
+            rel_threshold=self.rel_threshold,
+            roi_rows=self.roi_rows,
+            roi_cols=self.roi_cols,
+            frame_range=self.frame_range
         )
         return info
     
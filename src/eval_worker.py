@@ -0,0 +1,75 @@
+#     BounceAnalyzer is a program to analyze the bounces of objects
+#     Copyright (C) 2023  Raphael Kriegl
+
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import logging
+import threading
+import traceback
+from PySide6.QtCore import Signal
+
+from qthread_worker import Worker
+from bounce_evaluator import BounceEvaluator, EvaluationCancelled
+from data_classes import VideoInfoPresets
+from result_cache import ResultCache
+
+
+class EvalWorker(Worker):
+    """ runs an evaluation on its own thread, so the GUI stays responsive, can be cancelled between stages """
+    progress_signal = Signal(float)
+    stage_signal = Signal(str)
+    # BounceData, streak image
+    result_signal = Signal(object, object)
+    error_signal = Signal(str)
+
+    def __init__(self, evaluator: BounceEvaluator, info: VideoInfoPresets, result_cache: ResultCache = None):
+        super().__init__(self._evaluate, evaluator, info)
+        self._cancel_event = threading.Event()
+        self.result_cache = result_cache
+
+    def cancel(self):
+        """ stops the evaluation at its next checkpoint, the result of a cancelled evaluation is not emitted """
+        self._cancel_event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel_event.is_set()
+
+    def _evaluate(self, evaluator: BounceEvaluator, info: VideoInfoPresets):
+        try:
+            cached = self.result_cache.load(info.filename, info) if self.result_cache else None
+            if cached is not None:
+                logging.info(f"Using cached result of {info.filename}")
+                self._emit_result(*cached)
+                return
+            # the evaluator is reused for every evaluation of a video, its profile should only describe this one
+            if evaluator.profiler is not None: evaluator.profiler.reset()
+            data, streak = evaluator.evaluate(info, progress_callback=self.progress_signal.emit, cancel_event=self._cancel_event, stage_callback=self.stage_signal.emit)
+            if self.result_cache: self.result_cache.store(info.filename, info, data, streak)
+        except EvaluationCancelled:
+            logging.info("Evaluation cancelled")
+            return
+        except Exception as ex:
+            logging.error(f"Evaluation failed:\n{traceback.format_exc()}")
+            self.error_signal.emit(repr(ex))
+            return
+        logging.info(f"Recomputed {', '.join(evaluator.recomputed) or 'nothing'} in {sum(evaluator.timings.values()):.2f} s")
+        self._emit_result(data, streak)
+
+    def _emit_result(self, data, streak):
+        # the cancel can arrive after the last checkpoint, the result is superseded then
+        if self.cancelled:
+            logging.info("Evaluation cancelled, result dropped")
+            return
+        self.result_signal.emit(data, streak)
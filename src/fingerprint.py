@@ -0,0 +1,67 @@
+#     BounceAnalyzer is a program to analyze the bounces of objects
+#     Copyright (C) 2023  Raphael Kriegl
+
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import os
+import hashlib
+from pathlib import Path
+
+# bytes hashed at the start, middle and end of a file
+FINGERPRINT_SAMPLE_BYTES = 2**20
+
+
+def recording_files(filename) -> list[Path]:
+    """ all files that make up a recording, Photron recordings consist of a header and a mraw file """
+    path = Path(filename)
+    if path.suffix in (".cihx", ".cih", ".mraw"):
+        return [p for p in (path.with_suffix(".cihx"), path.with_suffix(".cih"), path.with_suffix(".mraw")) if p.exists()]
+    return [path]
+
+
+def file_fingerprint(filename, with_mtime: bool = True) -> str:
+    """
+    fast content fingerprint of a file, hashes the size and samples from start, middle and end instead of the whole content
+
+    :param with_mtime: include the modification time, so touched files count as changed, without it copies of a file match
+    """
+    stat = os.stat(filename)
+    h = hashlib.blake2b(digest_size=16)
+    h.update(str(stat.st_size).encode())
+    if with_mtime:
+        h.update(str(stat.st_mtime_ns).encode())
+    with open(filename, "rb") as f:
+        for offset in sorted({0, max(0, stat.st_size // 2 - FINGERPRINT_SAMPLE_BYTES // 2), max(0, stat.st_size - FINGERPRINT_SAMPLE_BYTES)}):
+            f.seek(offset)
+            h.update(f.read(FINGERPRINT_SAMPLE_BYTES))
+    return h.hexdigest()
+
+
+def video_fingerprint(filename, with_mtime: bool = True) -> str:
+    """ fingerprint over all files of a recording """
+    h = hashlib.blake2b(digest_size=16)
+    for f in recording_files(filename):
+        h.update(f.suffix.encode())
+        h.update(file_fingerprint(f, with_mtime).encode())
+    return h.hexdigest()
+
+
+def recording_stat(filename) -> str:
+    """ hash of the sizes and modification times of all files of a recording, only stats the files, so it is cheap on network shares """
+    return hash_values([(f.suffix, st.st_size, st.st_mtime_ns) for f in recording_files(filename) for st in [os.stat(f)]])
+
+
+def hash_values(*values) -> str:
+    """ stable hash of the repr of values, e.g. evaluation parameters """
+    return hashlib.blake2b(repr(values).encode(), digest_size=16).hexdigest()
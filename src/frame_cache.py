@@ -0,0 +1,142 @@
+#     BounceAnalyzer is a program to analyze the bounces of objects
+#     Copyright (C) 2023  Raphael Kriegl
+
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import cv2
+
+from video_reader import IVideoReader
+
+# memory budget for cached display frames in bytes
+FRAME_CACHE_BYTES = 256 * 2**20
+# number of frames that are decoded ahead of the current position in playback direction
+FRAME_READ_AHEAD = 32
+
+
+def to_8bit(img: np.ndarray) -> np.ndarray:
+    """ normalizes images with more than 8 bit to the full 8 bit range """
+    if img.dtype.itemsize > 1:
+        ret = np.zeros(img.shape, dtype=np.uint8)
+        cv2.normalize(img, ret, norm_type=cv2.NORM_MINMAX, alpha=0, beta=255, dtype=cv2.CV_8UC1)
+        return ret
+    else:
+        return np.ascontiguousarray(img)
+
+
+class FrameCache:
+    """
+    bounded LRU cache of display ready 8 bit frames of a video
+
+    Every access prefetches the next frames in the current scrubbing/playback direction on a background thread,
+    so sequential access and scrubbing over the same range mostly hits the cache.
+    """
+    def __init__(self, reader: IVideoReader, max_bytes: int = FRAME_CACHE_BYTES, read_ahead: int = FRAME_READ_AHEAD):
+        self._reader = reader
+        self.max_bytes = max_bytes
+        self.read_ahead = read_ahead
+        self.hits = 0
+        self.misses = 0
+        self._frames: OrderedDict[int, np.ndarray] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._last_index = None
+        self._direction = 1
+        # incremented on every access, so outdated prefetch jobs stop early
+        self._generation = 0
+        self._prefetcher = ThreadPoolExecutor(max_workers=1, thread_name_prefix="frame_prefetch")
+
+    def __len__(self):
+        return len(self._frames)
+
+    def __contains__(self, index):
+        return index in self._frames
+
+    def __getitem__(self, index: int) -> np.ndarray:
+        """ returns the 8 bit frame at index and triggers read-ahead from there """
+        with self._lock:
+            frame = self._frames.get(index)
+            if frame is not None:
+                self._frames.move_to_end(index)
+                self.hits += 1
+            else:
+                self.misses += 1
+        if frame is None:
+            frame = self._load(index)
+
+        if self._last_index is not None and index != self._last_index:
+            self._direction = 1 if index > self._last_index else -1
+        self._last_index = index
+        self.prefetch(index + self._direction, self._direction)
+        return frame
+
+    def get(self, index: int) -> np.ndarray:
+        """ returns the 8 bit frame at index without triggering read-ahead """
+        with self._lock:
+            frame = self._frames.get(index)
+            if frame is not None:
+                self._frames.move_to_end(index)
+                self.hits += 1
+                return frame
+            self.misses += 1
+        return self._load(index)
+
+    def prefetch(self, start: int, direction: int = 1, count: int = None):
+        """ decodes count frames from start in direction on the background thread """
+        count = self.read_ahead if count is None else count
+        if count <= 0: return
+        self._generation += 1
+        stop = start + direction * count
+        indices = [i for i in range(start, stop, direction) if 0 <= i < len(self._reader)]
+        self._prefetcher.submit(self._prefetch_job, indices, self._generation)
+
+    def _prefetch_job(self, indices, generation):
+        for i in indices:
+            if generation != self._generation: return
+            if i not in self._frames:
+                self._load(i)
+
+    def _load(self, index: int) -> np.ndarray:
+        frame = to_8bit(np.asarray(self._reader[index]))
+        with self._lock:
+            if index not in self._frames:
+                self._frames[index] = frame
+                self._bytes += frame.nbytes
+                while self._bytes > self.max_bytes and len(self._frames) > 1:
+                    _, old = self._frames.popitem(last=False)
+                    self._bytes -= old.nbytes
+        return frame
+
+    @property
+    def nbytes(self) -> int:
+        return self._bytes
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def clear(self):
+        self._generation += 1
+        with self._lock:
+            self._frames.clear()
+            self._bytes = 0
+
+    def close(self):
+        """ stops the prefetch thread and releases all frames """
+        self.clear()
+        self._prefetcher.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,145 @@
+#     BounceAnalyzer is a program to analyze the bounces of objects
+#     Copyright (C) 2023  Raphael Kriegl
+
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import os
+import time
+import json
+import logging
+import threading
+import tracemalloc
+from contextlib import contextmanager
+from dataclasses import dataclass, asdict
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+# profile every evaluation, also enabled by setting the environment variable BOUNCE_PROFILE=1
+PROFILE_STAGES = os.environ.get("BOUNCE_PROFILE", "") == "1"
+PROFILE_PERCENTILES = (50, 90, 99)
+
+
+_tracing_lock = threading.Lock()
+_tracing_users = 0
+_tracing_owned = False
+
+
+def _start_tracing():
+    """ starts tracemalloc for the first profiled stage, stages of several threads share one trace """
+    global _tracing_users, _tracing_owned
+    with _tracing_lock:
+        if _tracing_users == 0:
+            # a trace started by someone else is left running
+            _tracing_owned = not tracemalloc.is_tracing()
+            if _tracing_owned: tracemalloc.start()
+        _tracing_users += 1
+
+
+def _stop_tracing():
+    global _tracing_users
+    with _tracing_lock:
+        _tracing_users -= 1
+        if _tracing_users == 0 and _tracing_owned:
+            tracemalloc.stop()
+
+
+@dataclass
+class StageProfile:
+    """ resources used by one stage of an evaluation """
+    stage: str
+    wall: float
+    cpu: float
+    peak_bytes: int
+
+    def __repr__(self):
+        return f"{self.stage}: {self.wall*1000:.1f} ms wall, {self.cpu*1000:.1f} ms cpu, {self.peak_bytes / 2**20:.1f} MiB peak"
+
+
+class StageProfiler:
+    """
+    records wall time, cpu time and peak allocated memory of the stages of an evaluation
+
+    CPU time and memory are measured for the whole process, including the threads building the streak.
+    Stages running at the same time, e.g. in the batch pipeline, are therefore counted in each other's numbers.
+    Memory is traced with tracemalloc, which slows down allocations, so profiling is opt-in.
+    """
+    def __init__(self, trace_memory: bool = True):
+        self.trace_memory = trace_memory
+        self.profiles: list[StageProfile] = []
+
+    @contextmanager
+    def stage(self, name: str):
+        if self.trace_memory:
+            _start_tracing()
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            peak = tracemalloc.get_traced_memory()[1] - base if self.trace_memory else 0
+            self.profiles.append(StageProfile(name, time.perf_counter() - wall, time.process_time() - cpu, max(peak, 0)))
+            logging.info(f"Stage {self.profiles[-1]}")
+            if self.trace_memory:
+                _stop_tracing()
+
+    def reset(self):
+        """ forgets the recorded stages, e.g. before the next evaluation """
+        self.profiles = []
+
+    def to_list(self) -> list[dict]:
+        return [asdict(p) for p in self.profiles]
+
+    def report(self) -> str:
+        return ", ".join(repr(p) for p in self.profiles)
+
+
+def save_profile(filename, profiles: list[dict]) -> Path:
+    """ writes the stage profiles next to the results of a video """
+    path = Path(filename).with_suffix("")
+    path = path.with_name(path.name + "_profile.json")
+    path.write_text(json.dumps(profiles, indent=2))
+    return path
+
+
+def aggregate_profiles(profiles: list[list[dict]], percentiles=PROFILE_PERCENTILES) -> pd.DataFrame:
+    """
+    percentiles of the stage profiles of a batch
+
+    :param profiles: the profiles of each evaluation, as returned by StageProfiler.to_list
+    :returns: table with a row per stage and a column per measure and percentile, e.g. wall_p90
+    """
+    table = pd.DataFrame([p for evaluation in profiles for p in evaluation], columns=["stage", "wall", "cpu", "peak_bytes"])
+    rows = {}
+    for stage, group in table.groupby("stage", sort=False):
+        row = {"count": len(group)}
+        for measure in ("wall", "cpu", "peak_bytes"):
+            for q, value in zip(percentiles, np.percentile(group[measure], percentiles)):
+                row[f"{measure}_p{q}"] = value
+            row[f"{measure}_max"] = group[measure].max()
+        rows[stage] = row
+    return pd.DataFrame.from_dict(rows, orient="index")
+
+
+def log_aggregate(table: pd.DataFrame):
+    """ writes the batch percentiles to the log, times in ms and memory in MiB """
+    lines = []
+    for stage, row in table.iterrows():
+        wall = " / ".join(f"{row[f'wall_p{q}']*1000:.1f}" for q in PROFILE_PERCENTILES)
+        cpu = " / ".join(f"{row[f'cpu_p{q}']*1000:.1f}" for q in PROFILE_PERCENTILES)
+        peak = " / ".join(f"{row[f'peak_bytes_p{q}'] / 2**20:.1f}" for q in PROFILE_PERCENTILES)
+        lines.append(f"{stage} ({int(row['count'])}x): wall {wall} ms, cpu {cpu} ms, peak {peak} MiB")
+    percentiles = "/".join(f"p{q}" for q in PROFILE_PERCENTILES)
+    logging.info(f"Stage profile of batch ({percentiles}):\n" + "\n".join(lines))
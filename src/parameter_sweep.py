@@ -0,0 +1,119 @@
+#     BounceAnalyzer is a program to analyze the bounces of objects
+#     Copyright (C) 2023  Raphael Kriegl
+
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import logging
+from typing import Callable, Union
+import numpy as np
+import pandas as pd
+
+from data_classes import VideoInfoPresets
+from pipeline import process_pool
+from streak_cache import StreakCache
+from video_reader import IVideoReader
+from bounce_evaluator import _get_streak, _invert_streak, _threshold_crossing, _fractional_contour, _get_scale, \
+    _kinematics, _impact, _line_fits, _filter_window, _line_fit_window
+
+# columns of the result table, one row per combination of parameters
+SWEEP_COLUMNS = ["rel_threshold", "accel_thresh", "savgol_window", "pixel_scale", "cor", "max_deformation", "max_acceleration",
+                 "speed_in", "speed_out", "impact_time", "release_time", "error"]
+
+
+def sweep(video: Union[IVideoReader, np.ndarray], info: VideoInfoPresets, rel_thresholds=None, accel_threshs=None, savgol_windows=None,
+          workers: int = 1, streak_cache: StreakCache = None, progress_callback: Callable[[float], None] = None) -> pd.DataFrame:
+    """
+    evaluates the bounce for every combination of the parameter grids, the streak and its inversion are shared by all points
+    and the contours of all thresholds are extracted with one reused mask buffer
+
+    :param info: parameters of the video, grids that are not given use the value in info
+    :param rel_thresholds: relative thresholds of the contour detection
+    :param accel_threshs: acceleration thresholds of the impact detection
+    :param savgol_windows: windows of the Savitzky-Golay filter, None derives it from the frame rate
+    :param workers: number of processes evaluating the contours, 1 evaluates in this process
+    :param progress_callback: called with the fraction of evaluated thresholds
+    :returns: table with one row per parameter combination, points that could not be evaluated have NaN values and an error message
+    """
+    rel_thresholds = list(rel_thresholds if rel_thresholds is not None else [info.rel_threshold])
+    accel_threshs = list(accel_threshs if accel_threshs is not None else [info.accel_thresh])
+    savgol_windows = list(savgol_windows if savgol_windows is not None else [info.savgol_window])
+
+    streak = _get_streak(video, info, None, streak_cache)
+    cvimg = _invert_streak(streak, info.bit_depth)
+    thresholds = [rel * cvimg.max() for rel in rel_thresholds]
+    scratch = np.empty(cvimg.shape, dtype=bool)
+    frame_offset = slice(*(info.frame_range or (None,))).indices(info.length)[0]
+    row_offset = slice(*(info.roi_rows or (None,))).indices(info.shape[0])[0]
+
+    tasks = []
+    for rel, thresh in zip(rel_thresholds, thresholds):
+        thresh_idx = _threshold_crossing(cvimg, thresh, scratch)
+        contour_x, contour_y = _fractional_contour(cvimg, thresh, thresh_idx)
+        pixel_scale, pixel_scale_error = info.pixel_scale, None
+        try:
+            pixel_scale = pixel_scale or _get_scale(streak, contour_y, contour_x[0], info)
+        except (IndexError, ValueError) as ex:
+            pixel_scale_error = repr(ex)
+        tasks.append((rel, contour_x, contour_y, pixel_scale, pixel_scale_error, info.frame_rate, frame_offset, row_offset, accel_threshs, savgol_windows))
+
+    rows = []
+    if workers <= 1 or len(tasks) <= 1:
+        for i, task in enumerate(tasks):
+            rows += _sweep_contour(*task)
+            if progress_callback: progress_callback((i + 1) / len(tasks))
+    else:
+        with process_pool(workers) as pool:
+            for i, result in enumerate(pool.map(_sweep_contour, *zip(*tasks))):
+                rows += result
+                if progress_callback: progress_callback((i + 1) / len(tasks))
+
+    table = pd.DataFrame(rows, columns=SWEEP_COLUMNS)
+    logging.info(f"Swept {len(table)} parameter combinations of {info.filename}, {table['error'].notna().sum()} failed")
+    return table
+
+
+def _sweep_contour(rel_threshold, contour_x, contour_y, pixel_scale, pixel_scale_error, frame_rate, frame_offset, row_offset, accel_threshs, savgol_windows) -> list[dict]:
+    """
+    evaluates all filter windows and acceleration thresholds of one contour, runs in a worker process for parallel sweeps
+
+    :param pixel_scale_error: why the pixel scale could not be determined, all combinations of the contour fail with it
+    """
+    rows = []
+    for savgol_window in savgol_windows:
+        kin = None
+        for accel_thresh in accel_threshs:
+            row = dict(rel_threshold=rel_threshold, accel_thresh=accel_thresh, savgol_window=_filter_window(frame_rate, savgol_window))
+            if pixel_scale_error is not None:
+                row["error"] = pixel_scale_error
+                rows.append(row)
+                continue
+            try:
+                row["pixel_scale"] = pixel_scale
+                kin = kin or _kinematics(contour_x, contour_y, pixel_scale, frame_rate, row["savgol_window"], frame_offset, row_offset)
+                impact = _impact(kin, accel_thresh, frame_rate)
+                fit_down, fit_up = _line_fits(kin, impact, _line_fit_window(frame_rate))
+                row.update(
+                    cor=abs(fit_up.coef[1] / fit_down.coef[1]),
+                    max_deformation=float(impact.max_deformation),
+                    max_acceleration=float(impact.max_acceleration),
+                    speed_in=fit_down.coef[1],
+                    speed_out=fit_up.coef[1],
+                    impact_time=impact.impact_time,
+                    release_time=impact.release_time,
+                    error=None
+                )
+            except (IndexError, ValueError, TypeError, np.linalg.LinAlgError) as ex:
+                row["error"] = repr(ex)
+            rows.append(row)
+    return rows
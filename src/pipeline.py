@@ -0,0 +1,129 @@
+#     BounceAnalyzer is a program to analyze the bounces of objects
+#     Copyright (C) 2023  Raphael Kriegl
+
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import time
+import queue
+import logging
+import threading
+import traceback
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Iterable
+
+# items waiting between two stages, bounds the memory of items decoded ahead
+PIPELINE_QUEUE_SIZE = 2
+
+_DONE = object()
+
+
+def process_pool(workers: int, initializer=None) -> ProcessPoolExecutor:
+    """ pool of worker processes, spawned instead of forked, as forking after numba started its thread pool deadlocks the children """
+    return ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context("spawn"), initializer=initializer)
+
+
+@dataclass
+class StageStats:
+    """ time a stage spent working, waiting for input and waiting for the next stage to take its output """
+    name: str
+    items: int = 0
+    busy: float = 0.0
+    starved: float = 0.0
+    blocked: float = 0.0
+
+    @property
+    def utilization(self) -> float:
+        total = self.busy + self.starved + self.blocked
+        return self.busy / total if total else 0.0
+
+    def __repr__(self):
+        return f"{self.name}: {self.items} items, busy {self.busy:.2f} s ({self.utilization:.0%}), waiting for input {self.starved:.2f} s, for output {self.blocked:.2f} s"
+
+
+@dataclass
+class PipelineItem:
+    """ an item moving through the stages, stages are skipped once an error occurred """
+    key: object
+    value: object = None
+    error: str = None
+    duration: float = 0.0
+
+
+class Pipeline:
+    """
+    runs stages on their own threads connected by bounded queues, so consecutive items are processed by different stages at once,
+    e.g. the next video is decoded while the current one is evaluated and the previous one is saved
+
+    Every stage is a function of the output of the previous stage, the first one gets the input items.
+    The stage with the highest utilization is the bottleneck.
+    """
+    def __init__(self, stages: list[tuple[str, Callable]], queue_size: int = PIPELINE_QUEUE_SIZE):
+        self.stages = stages
+        self.queue_size = queue_size
+        self.stats = [StageStats(name) for name, _ in stages]
+
+    def _run_stage(self, fn: Callable, stats: StageStats, inbox: queue.Queue, outbox: queue.Queue):
+        while True:
+            start = time.perf_counter()
+            item = inbox.get()
+            stats.starved += time.perf_counter() - start
+            if item is _DONE:
+                outbox.put(_DONE)
+                return
+            if item.error is None:
+                start = time.perf_counter()
+                try:
+                    item.value = fn(item.value)
+                except Exception as ex:
+                    logging.error(f"{stats.name} failed for {item.key}:\n{traceback.format_exc()}")
+                    item.value, item.error = None, repr(ex)
+                elapsed = time.perf_counter() - start
+                stats.busy += elapsed
+                item.duration += elapsed
+                stats.items += 1
+            start = time.perf_counter()
+            outbox.put(item)
+            stats.blocked += time.perf_counter() - start
+
+    def run(self, items: Iterable, key: Callable = lambda item: item) -> Iterable[PipelineItem]:
+        """ feeds the items through all stages, yields them in order as they leave the last stage, an error of the items iterable is raised at the end """
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in range(len(self.stages) + 1)]
+        threads = [threading.Thread(target=self._run_stage, args=(fn, stats, queues[i], queues[i + 1]), name=f"pipeline-{name}", daemon=True)
+                   for i, ((name, fn), stats) in enumerate(zip(self.stages, self.stats))]
+        for t in threads: t.start()
+
+        feed_error = []
+
+        def feed():
+            try:
+                for item in items:
+                    queues[0].put(PipelineItem(key(item), item))
+            except Exception as ex:
+                # raised again by run once the items fed so far left the pipeline
+                feed_error.append(ex)
+            finally:
+                queues[0].put(_DONE)
+        feeder = threading.Thread(target=feed, name="pipeline-feed", daemon=True)
+        feeder.start()
+
+        try:
+            while (item := queues[-1].get()) is not _DONE:
+                yield item
+            feeder.join()
+            if feed_error:
+                raise feed_error[0]
+        finally:
+            logging.info("Pipeline stages:\n" + "\n".join(repr(s) for s in self.stats))
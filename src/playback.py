@@ -0,0 +1,106 @@
+#     BounceAnalyzer is a program to analyze the bounces of objects
+#     Copyright (C) 2023  Raphael Kriegl
+
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import time
+from typing import Callable
+
+# rate at which frames are drawn to screen
+DISPLAY_FPS = 30.0
+# playback speed relative to real time, at 30 kfps 1/1000 shows 30 frames per second
+PLAYBACK_SPEED = 1/1000
+
+
+class PlaybackScheduler:
+    """
+    maps wall clock time to video frames, so that high speed recordings play back at a fixed display rate
+    with a chosen speed relative to real time
+
+    If decoding or drawing falls behind, the scheduler skips ahead to the frame that is due instead of showing every frame.
+    Playback stops at the last frame unless loop is set.
+    """
+    def __init__(self, frame_rate: float, num_frames: int, display_fps: float = DISPLAY_FPS, speed: float = PLAYBACK_SPEED, clock: Callable[[], float] = time.perf_counter,
+                 loop: bool = False):
+        self.frame_rate = frame_rate
+        self.num_frames = num_frames
+        self.display_fps = display_fps
+        self.speed = speed
+        self.loop = loop
+        self._clock = clock
+        self._start_time = 0.0
+        self._start_frame = 0
+        self._last_tick = None
+        self._last_frame = None
+        self.displayed_frames = 0
+        self.skipped_frames = 0
+        self.dropped_frames = 0
+        self.achieved_fps = 0.0
+
+    @property
+    def interval_ms(self) -> float:
+        """ timer interval for the display rate """
+        return 1000 / self.display_fps
+
+    @property
+    def frames_per_tick(self) -> float:
+        """ number of video frames that pass between two displayed frames """
+        return self.speed * self.frame_rate / self.display_fps
+
+    def start(self, frame: int = 0):
+        """ (re)starts the schedule at frame """
+        self._start_time = self._clock()
+        self._start_frame = frame
+        self._last_tick = None
+        self._last_frame = None
+        self.displayed_frames = 0
+        self.skipped_frames = 0
+        self.dropped_frames = 0
+        self.achieved_fps = 0.0
+
+    def _frame_at(self, elapsed: float) -> int:
+        # small tolerance so accumulated clock rounding does not fall back a frame
+        frame = self._start_frame + int(elapsed * self.speed * self.frame_rate + 1e-6)
+        return frame % self.num_frames if self.loop else min(frame, self.num_frames - 1)
+
+    @property
+    def at_end(self) -> bool:
+        """ True once the last frame was displayed, never when looping """
+        return not self.loop and self._last_frame == self.num_frames - 1
+
+    def next_frame(self) -> int:
+        """ returns the frame that is due now and updates the statistics, call once per display tick """
+        now = self._clock()
+        elapsed = now - self._start_time
+        frame = self._frame_at(elapsed)
+
+        if self._last_frame is not None:
+            # video frames that were stepped over to keep up with the schedule
+            self.skipped_frames += max(0, (frame - self._last_frame) % self.num_frames - 1)
+            tick = now - self._last_tick
+            if tick > 0:
+                self.achieved_fps = 1 / tick if not self.achieved_fps else 0.9 * self.achieved_fps + 0.1 / tick
+        self.displayed_frames += 1
+        # display deadlines that passed without a frame being shown
+        self.dropped_frames = max(0, int(elapsed * self.display_fps + 1e-6) + 1 - self.displayed_frames)
+        self._last_tick = now
+        self._last_frame = frame
+        return frame
+
+    def upcoming_frame(self) -> int:
+        """ the frame that will be due on the next display tick, can be decoded ahead of time """
+        return self._frame_at(self._clock() - self._start_time + 1 / self.display_fps)
+
+    def __repr__(self):
+        return f"{self.achieved_fps:.1f}/{self.display_fps:.0f} FPS, {self.dropped_frames} dropped, {self.skipped_frames} skipped"
@@ -0,0 +1,70 @@
+#     BounceAnalyzer is a program to analyze the bounces of objects
+#     Copyright (C) 2023  Raphael Kriegl
+
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import json
+import logging
+import zipfile
+import dataclasses
+import numpy as np
+
+from bounce_evaluator import EVALUATOR_VERSION
+from data_classes import BounceData, VideoInfoPresets
+from fingerprint import hash_values, recording_files, video_fingerprint
+from result_io import ResultFile, save_npz
+from streak_cache import CACHE_DIR, STREAK_VERSION, DiskCache
+
+RESULT_CACHE_BYTES = 2**30
+
+
+def params_hash(info: VideoInfoPresets) -> str:
+    """ canonical hash of the evaluation parameters, the file name is left out, so copies of a video share their results """
+    params = {name: value for name, value in dataclasses.asdict(info).items() if name != "filename"}
+    # json makes tuples and lists, and numpy and python numbers hash alike
+    return hash_values(json.dumps(params, sort_keys=True, default=lambda o: o.item()))
+
+
+class ResultCache(DiskCache):
+    """
+    persistent cache of evaluation results and streak images, keyed by the content of the video, the parameters and the evaluator version
+
+    Evaluating an unchanged video with unchanged parameters again, also a copy of it at another path, loads the result from here.
+    """
+    suffix = ".npz"
+
+    def __init__(self, cache_dir=None, max_bytes: int = RESULT_CACHE_BYTES):
+        super().__init__(cache_dir or CACHE_DIR / "results", max_bytes)
+
+    def key(self, filename: str, info: VideoInfoPresets) -> str:
+        # all missing videos would share one fingerprint
+        if not recording_files(filename):
+            raise FileNotFoundError(f"{filename} not found")
+        return hash_values(video_fingerprint(filename, with_mtime=False), params_hash(info), EVALUATOR_VERSION, STREAK_VERSION)
+
+    def load(self, filename: str, info: VideoInfoPresets) -> tuple[BounceData, np.ndarray]:
+        """ returns the cached result and streak of the video, None if it was not cached yet or cannot be read """
+        path = self._lookup(self.key(filename, info))
+        if path is None: return None
+        try:
+            with ResultFile(path) as result:
+                # the cached result may belong to a copy of the video
+                return dataclasses.replace(result.bounce_data(), video_name=info.filename), result.streak()
+        except (OSError, ValueError, KeyError, zipfile.BadZipFile) as ex:
+            logging.warning(f"Removing unreadable cache entry {path.name}: {ex}")
+            path.unlink(missing_ok=True)
+            return None
+
+    def store(self, filename: str, info: VideoInfoPresets, data: BounceData, streak: np.ndarray):
+        self._write(self.key(filename, info), lambda f: save_npz(f, data, info.rel_threshold, streak))
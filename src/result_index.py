@@ -0,0 +1,291 @@
+#     BounceAnalyzer is a program to analyze the bounces of objects
+#     Copyright (C) 2023  Raphael Kriegl
+
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import os
+import re
+import sys
+import csv
+import json
+import logging
+import sqlite3
+import argparse
+import datetime
+from pathlib import Path
+import pandas as pd
+
+from fingerprint import video_fingerprint
+
+# file name of the database in the indexed root
+INDEX_NAME = "bounce_index.sqlite"
+EVAL_SUFFIX = "_eval.csv"
+# rows written per transaction while scanning
+INDEX_BATCH_SIZE = 1000
+# databases with another version are rebuilt on open, raise it when the columns change
+INDEX_SCHEMA_VERSION = 2
+
+# columns of the _eval.csv files, see result_io.eval_table, stored lower case
+RESULT_COLUMNS = {
+    "acceleration_thresh": "REAL",
+    "impact_idx": "INTEGER",
+    "impact_time": "REAL",
+    "release_idx": "INTEGER",
+    "release_time": "REAL",
+    "max_deformation": "REAL",
+    "cor": "REAL",
+    "speed_in": "REAL",
+    "speed_out": "REAL",
+    "max_acceleration": "REAL",
+    "video_framerate": "REAL",
+    "video_resolution": "TEXT",
+    "video_num_frames": "INTEGER",
+    "video_pixel_scale": "REAL",
+    "video_name": "TEXT",
+    "img_rel_threshold": "REAL",
+    "video_roi": "TEXT",
+}
+# path is the _eval.csv file, evaluated its modification time, video_fingerprint the content fingerprint of the evaluated recording
+# as used by the result cache (NULL if the recording is gone), eval_seconds the wall time from the _profile.json, so it is only set
+# for results evaluated with profiling enabled
+FILE_COLUMNS = {
+    "path": "TEXT PRIMARY KEY",
+    "folder": "TEXT",
+    "name": "TEXT",
+    "size": "INTEGER",
+    "mtime_ns": "INTEGER",
+    "video_fingerprint": "TEXT",
+    "evaluated": "REAL",
+    "eval_seconds": "REAL",
+}
+INDEXED_COLUMNS = ("folder", "name", "evaluated", "cor", "video_framerate", "max_deformation", "speed_in", "video_name", "video_fingerprint")
+
+_FILTER_RE = re.compile(r"^\s*(\w+)\s*(<=|>=|!=|=|<|>)\s*(.+?)\s*$")
+
+
+class ResultIndex:
+    """
+    SQLite index of the _eval.csv files written next to the evaluated videos
+
+    Scanning only reads files that are new or changed since the last scan, judged by size and modification time,
+    and removes files that were deleted. Queries use indexes on the commonly filtered columns.
+    """
+    def __init__(self, db_path):
+        self.path = Path(db_path)
+        self.con = sqlite3.connect(self.path)
+        self.con.execute("PRAGMA journal_mode=WAL")
+        if self.con.execute("PRAGMA user_version").fetchone()[0] != INDEX_SCHEMA_VERSION:
+            # an index of an older version is incomplete, all results are read again on the next update
+            self.con.execute("DROP TABLE IF EXISTS results")
+            self.con.execute(f"PRAGMA user_version = {INDEX_SCHEMA_VERSION}")
+        columns = {**FILE_COLUMNS, **RESULT_COLUMNS}
+        self.con.execute(f"CREATE TABLE IF NOT EXISTS results ({', '.join(f'{name} {kind}' for name, kind in columns.items())})")
+        for name in INDEXED_COLUMNS:
+            self.con.execute(f"CREATE INDEX IF NOT EXISTS idx_{name} ON results ({name})")
+        self.con.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.con.close()
+
+    def __len__(self) -> int:
+        return self.con.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def update(self, root) -> tuple[int, int, int]:
+        """
+        indexes the results in root and all its subfolders
+
+        :returns: number of added, updated and removed results
+        """
+        root = Path(root).resolve()
+        prefix = str(root) + os.sep
+        known = {path: (size, mtime) for path, size, mtime in
+                 self.con.execute("SELECT path, size, mtime_ns FROM results WHERE path LIKE ? ESCAPE '\\'", (_like_prefix(prefix),))}
+        added = updated = 0
+        rows = []
+        for path, stat in _scan(root):
+            previous = known.pop(path, None)
+            if previous == (stat.st_size, stat.st_mtime_ns): continue
+            try:
+                rows.append(_read_result(Path(path), stat))
+            except (OSError, ValueError, csv.Error) as ex:
+                logging.warning(f"Cannot index {path}: {ex}")
+                continue
+            if previous is None: added += 1
+            else: updated += 1
+            if len(rows) >= INDEX_BATCH_SIZE:
+                self._write(rows)
+                rows = []
+        self._write(rows)
+        # results that were known but not found anymore were deleted
+        self.con.executemany("DELETE FROM results WHERE path = ?", [(path,) for path in known])
+        self.con.commit()
+        logging.info(f"Indexed {root}: {added} added, {updated} updated, {len(known)} removed")
+        return added, updated, len(known)
+
+    def _write(self, rows: list[dict]):
+        if not rows: return
+        columns = list(FILE_COLUMNS) + list(RESULT_COLUMNS)
+        self.con.executemany(f"INSERT OR REPLACE INTO results ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                             [tuple(row.get(c) for c in columns) for row in rows])
+        self.con.commit()
+
+    def query(self, filters: list[tuple[str, str, object]] = (), folder: str = None, name: str = None,
+              since: float = None, until: float = None, limit: int = None) -> pd.DataFrame:
+        """
+        indexed results matching all conditions
+
+        :param filters: (column, operator, value) conditions, e.g. ("cor", "<", 0.5), see parse_filter
+        :param folder: results of videos in this folder and its subfolders
+        :param name: glob pattern of the video names without suffix, e.g. "ball_*"
+        :param since: evaluated at or after this unix time
+        :param until: evaluated before this unix time
+        """
+        conditions, values = [], []
+        for column, op, value in filters:
+            if column not in FILE_COLUMNS and column not in RESULT_COLUMNS:
+                raise ValueError(f"Unknown column {column}")
+            if op not in ("<", "<=", ">", ">=", "=", "!="):
+                raise ValueError(f"Unknown operator {op}")
+            conditions.append(f"{column} {op} ?")
+            values.append(value)
+        if folder is not None:
+            folder = str(Path(folder).resolve())
+            conditions.append("(folder = ? OR folder LIKE ? ESCAPE '\\')")
+            values += [folder, _like_prefix(folder + os.sep)]
+        if name is not None:
+            conditions.append("name GLOB ?")
+            values.append(name)
+        if since is not None:
+            conditions.append("evaluated >= ?")
+            values.append(since)
+        if until is not None:
+            conditions.append("evaluated < ?")
+            values.append(until)
+        sql = "SELECT * FROM results" + (" WHERE " + " AND ".join(conditions) if conditions else "") + " ORDER BY evaluated"
+        if limit is not None:
+            sql += f" LIMIT {int(limit)}"
+        return pd.read_sql_query(sql, self.con, params=values)
+
+
+def parse_filter(text: str) -> tuple[str, str, object]:
+    """ parses a condition like 'cor<0.5' or 'video_framerate=30000' into (column, operator, value) """
+    match = _FILTER_RE.match(text)
+    if not match:
+        raise ValueError(f"Invalid filter {text!r}, expected e.g. 'cor<0.5'")
+    column, op, value = match.groups()
+    column = column.lower()
+    kind = RESULT_COLUMNS.get(column) or FILE_COLUMNS.get(column, "")
+    return column, op, float(value) if kind in ("REAL", "INTEGER") else value
+
+
+def _like_prefix(prefix: str) -> str:
+    return prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+
+def _scan(root: Path):
+    """ yields path and stat of all result files below root, os.scandir reuses the stat of the directory listing where possible """
+    stack = [root]
+    while stack:
+        try:
+            entries = list(os.scandir(stack.pop()))
+        except OSError as ex:
+            logging.warning(f"Cannot scan {ex.filename}: {ex}")
+            continue
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                stack.append(entry.path)
+            elif entry.name.endswith(EVAL_SUFFIX):
+                yield entry.path, entry.stat()
+
+
+def _read_result(path: Path, stat: os.stat_result) -> dict:
+    with open(path, newline="", encoding="utf-8") as f:
+        values = next(csv.DictReader(f, delimiter="\t"), None)
+    if values is None:
+        raise ValueError("no result row")
+    row = dict(path=str(path), folder=str(path.parent), name=path.name[:-len(EVAL_SUFFIX)], size=stat.st_size, mtime_ns=stat.st_mtime_ns,
+               evaluated=stat.st_mtime)
+    for column, value in values.items():
+        kind = RESULT_COLUMNS.get(column.lower())
+        if kind is None or value in (None, ""): continue
+        row[column.lower()] = value if kind == "TEXT" else int(float(value)) if kind == "INTEGER" else float(value)
+    video = _source_video(path, row.get("video_name"))
+    if video is not None:
+        row["video_fingerprint"] = video_fingerprint(video, with_mtime=False)
+    profile = path.with_name(row["name"] + "_profile.json")
+    if profile.exists():
+        try:
+            row["eval_seconds"] = sum(stage["wall"] for stage in json.loads(profile.read_text()))
+        except (ValueError, KeyError, TypeError):
+            logging.warning(f"Ignoring broken profile {profile}")
+    return row
+
+
+def _source_video(path: Path, video_name: str):
+    """ the evaluated recording, at the stored path or moved together with its result, None if it does not exist anymore """
+    if not video_name: return None
+    video = Path(video_name)
+    # the stored name is absolute unless the evaluation ran on a relative path, moved results are found next to their recording
+    for candidate in (path.parent / video, path.parent / video.name):
+        if candidate.is_file():
+            return candidate
+    return None
+
+
+def _timestamp(text: str) -> float:
+    return datetime.datetime.fromisoformat(text).timestamp()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Index the evaluation results (_eval.csv) below a folder in a SQLite database and query them",
+                                     epilog="eval_seconds is only set for results evaluated with profiling enabled")
+    parser.add_argument("root", help="root directory, searched recursively")
+    parser.add_argument("--db", default=None, help=f"database file (default: ROOT/{INDEX_NAME})")
+    parser.add_argument("--no-update", action="store_true", help="query the database without scanning for new and changed results")
+    parser.add_argument("-f", "--filter", action="append", default=[], help="condition like 'cor<0.5' or 'video_framerate=30000', can be repeated")
+    parser.add_argument("--folder", default=None, help="only results below this folder")
+    parser.add_argument("--name", default=None, help="glob pattern of the video names, e.g. 'ball_*'")
+    parser.add_argument("--since", type=_timestamp, default=None, help="evaluated at or after this date, e.g. 2024-05-01")
+    parser.add_argument("--until", type=_timestamp, default=None, help="evaluated before this date")
+    parser.add_argument("--limit", type=int, default=None)
+    parser.add_argument("-o", "--output", default=None, help="write the matches to this csv file instead of printing them")
+    parser.add_argument("-v", "--verbose", action="store_true")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    filters = [parse_filter(f) for f in args.filter]
+    with ResultIndex(args.db or Path(args.root) / INDEX_NAME) as index:
+        if not args.no_update:
+            index.update(args.root)
+        table = index.query(filters, folder=args.folder, name=args.name, since=args.since, until=args.until, limit=args.limit)
+    if args.output:
+        table.to_csv(args.output, sep="\t", index=False)
+        logging.info(f"{len(table)} results written to {args.output}")
+    else:
+        with pd.option_context("display.max_rows", None, "display.width", None):
+            print(table[["folder", "name", "cor", "speed_in", "max_deformation", "video_framerate", "evaluated"]].to_string(index=False))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,133 @@
+#     BounceAnalyzer is a program to analyze the bounces of objects
+#     Copyright (C) 2023  Raphael Kriegl
+
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import json
+from dataclasses import fields
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from PIL import Image
+
+from data_classes import BounceData, SERIES_FIELDS
+
+# version of the npz result format, files of newer versions are rejected
+RESULT_FORMAT_VERSION = 1
+_HEADER_KEY = "header"
+_STREAK_KEY = "streak"
+
+
+def result_paths(filename) -> dict[str, Path]:
+    """ files written for the result of a video, keyed by kind """
+    filename = Path(filename).with_suffix(".json")
+    return {
+        "json": filename,
+        "npz": filename.with_suffix(".npz"),
+        "csv": filename.parent/(filename.stem + "_eval.csv"),
+        "png": filename.with_stem(filename.stem + "_streak").with_suffix(".png"),
+    }
+
+
+def eval_table(data: BounceData, rel_threshold: float) -> pd.DataFrame:
+    """ single row table of the extracted parameters """
+    eval_data = pd.DataFrame()
+    eval_data["acceleration_thresh"] = [data.acceleration_thresh]
+    eval_data["impact_idx"] = data.impact_idx
+    eval_data["impact_time"] = data.impact_time
+    eval_data["release_idx"] = data.release_idx
+    eval_data["release_time"] = data.release_time
+    eval_data["max_deformation"] = data.max_deformation
+    eval_data["COR"] = data.cor
+    eval_data["speed_in"] = data.speed_in
+    eval_data["speed_out"] = data.speed_out
+    eval_data["max_acceleration"] = data.max_acceleration
+    eval_data["video_framerate"] = data.video_framerate
+    eval_data["video_resolution"] = data.video_resolution#f"{w}x{h}"
+    eval_data["video_num_frames"] = data.video_num_frames
+    eval_data["video_pixel_scale"] = data.video_pixel_scale
+    eval_data["video_name"] = data.video_name
+    eval_data["img_rel_threshold"] = rel_threshold
+    eval_data["video_roi"] = data.video_roi
+    return eval_data
+
+
+def save_result(filename, data: BounceData, streak: np.ndarray, rel_threshold: float):
+    """ saves data as json (can be loaded to view curves again) and as csv (for the extracted parameters). Also saves streak image."""
+    paths = result_paths(filename)
+    if data is not None:
+        data.to_json_file(paths["json"])
+        save_npz(paths["npz"], data, rel_threshold)
+        eval_table(data, rel_threshold).to_csv(paths["csv"], sep='\t', header=True, index=False)
+    if streak is not None: Image.fromarray(streak).save(paths["png"])
+    return paths
+
+
+def save_npz(file, data: BounceData, rel_threshold: float = None, streak: np.ndarray = None):
+    """
+    saves data as uncompressed npz, the scalars are stored as json header, the series as arrays
+
+    :param file: path ending with .npz or a binary file
+    :param streak: optionally stored as well, e.g. for the result cache
+    """
+    header = {"format_version": RESULT_FORMAT_VERSION, "img_rel_threshold": rel_threshold}
+    header.update({f.name: getattr(data, f.name) for f in fields(data) if f.name not in SERIES_FIELDS})
+    # the header is written first, so opening the file only reads the zip directory and the header
+    arrays = {_HEADER_KEY: np.frombuffer(json.dumps(header, default=lambda o: o.item()).encode(), dtype=np.uint8)}
+    arrays.update({name: getattr(data, name) for name in SERIES_FIELDS})
+    if streak is not None:
+        arrays[_STREAK_KEY] = streak
+    np.savez(file, **arrays)
+
+
+class ResultFile:
+    """
+    result saved by save_npz, only the header with the scalars is read on opening,
+    the series are read from the file on access, e.g. to browse many results by their COR
+    """
+    def __init__(self, filename):
+        self.path = Path(filename)
+        self._npz = np.load(self.path, allow_pickle=False)
+        self.header: dict = json.loads(self._npz[_HEADER_KEY].tobytes())
+        if self.header.get("format_version", 0) > RESULT_FORMAT_VERSION:
+            self.close()
+            raise ValueError(f"{self.path} has result format {self.header['format_version']}, only {RESULT_FORMAT_VERSION} is supported")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self._npz.close()
+
+    def series(self, name: str) -> np.ndarray:
+        return self._npz[name]
+
+    def streak(self) -> np.ndarray:
+        """ the streak image, None if it was not saved """
+        return self._npz[_STREAK_KEY] if _STREAK_KEY in self._npz.files else None
+
+    def bounce_data(self) -> BounceData:
+        scalars = {f.name: self.header[f.name] for f in fields(BounceData) if f.name not in SERIES_FIELDS and f.name in self.header}
+        return BounceData(**scalars, **{name: self.series(name) for name in SERIES_FIELDS})
+
+
+def load_result(filename) -> BounceData:
+    """ loads a result saved as npz or json """
+    if Path(filename).suffix == ".npz":
+        with ResultFile(filename) as result:
+            return result.bounce_data()
+    return BounceData.from_json_file(filename)
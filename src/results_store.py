@@ -0,0 +1,139 @@
+#     BounceAnalyzer is a program to analyze the bounces of objects
+#     Copyright (C) 2023  Raphael Kriegl
+
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import os
+import time
+import fnmatch
+import tempfile
+from dataclasses import fields
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+from data_classes import BounceData, SERIES_FIELDS
+
+# folder of the store in the batch root
+RESULTS_DIR_NAME = "bounce_results"
+# number of results per chunk file
+RESULTS_CHUNK_SIZE = 256
+
+SCALAR_FIELDS = [f.name for f in fields(BounceData) if f.name not in SERIES_FIELDS]
+
+
+class ResultsStore:
+    """
+    columnar store of the results of a whole batch, a folder of chunked npz files
+
+    Every chunk holds one array per scalar column and the per frame series of every result as separate members,
+    so aggregating a batch reads a few chunk files instead of one json and csv per video, and loading the series
+    of one result only reads its own arrays.
+    Results are buffered and written as a new chunk on flush, existing chunks are never rewritten.
+    """
+    def __init__(self, root, chunk_size: int = RESULTS_CHUNK_SIZE):
+        self.path = Path(root) / RESULTS_DIR_NAME
+        self.chunk_size = chunk_size
+        self._rows: list[dict] = []
+        self._series: list[dict] = []
+
+    def _chunks(self) -> list[Path]:
+        return sorted(self.path.glob("chunk_*.npz")) if self.path.exists() else []
+
+    def append(self, data: BounceData, params_hash: str = "", **extra):
+        """
+        buffers a result, a full buffer is written as chunk
+
+        :param params_hash: identifies the evaluation parameters, see BatchLedger.params_hash
+        :param extra: additional scalar columns, e.g. the image threshold
+        """
+        video = Path(data.video_name)
+        row = dict(folder=str(video.parent), name=video.stem, params_hash=params_hash, evaluated=time.time())
+        row.update({name: getattr(data, name) for name in SCALAR_FIELDS})
+        row.update(extra)
+        self._rows.append(row)
+        self._series.append({name: getattr(data, name) for name in SERIES_FIELDS})
+        if len(self._rows) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        """ writes the buffered results as new chunk """
+        if not self._rows: return
+        table = pd.DataFrame(self._rows)
+        lengths = np.array([len(s[SERIES_FIELDS[0]]) for s in self._series])
+        arrays = {"scalar/" + col: _column_array(table[col]) for col in table.columns}
+        arrays["series_length"] = lengths
+        for row, series in enumerate(self._series):
+            for name in SERIES_FIELDS:
+                arrays[f"series/{row}/{name}"] = np.asarray(series[name])
+
+        self.path.mkdir(parents=True, exist_ok=True)
+        chunks = self._chunks()
+        index = int(chunks[-1].stem.split("_")[1]) + 1 if chunks else 0
+        fd, tmp = tempfile.mkstemp(dir=self.path, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(tmp, self.path / f"chunk_{index:05d}.npz")
+        self._rows, self._series = [], []
+
+    def query(self, folder: str = None, name: str = None, params_hash: str = None, latest: bool = True) -> pd.DataFrame:
+        """
+        scalar results of all flushed chunks, only the scalar columns are read
+
+        :param folder: results of videos in this folder and its subfolders
+        :param name: file name pattern of the videos without suffix, e.g. "ball_*"
+        :param params_hash: results evaluated with these parameters
+        :param latest: only the last result of every video and parameter set
+        :returns: table with a row per result, chunk and row locate the series for load_series
+        """
+        tables = []
+        for chunk in self._chunks():
+            with np.load(chunk, allow_pickle=False) as npz:
+                table = pd.DataFrame({key.split("/", 1)[1]: npz[key] for key in npz.files if key.startswith("scalar/")})
+            table["chunk"] = chunk.name
+            table["row"] = np.arange(len(table))
+            mask = np.ones(len(table), dtype=bool)
+            if folder is not None:
+                folder = str(Path(folder))
+                mask &= (table["folder"] == folder) | table["folder"].str.startswith(folder + os.sep)
+            if name is not None:
+                mask &= np.array([fnmatch.fnmatch(n, name) for n in table["name"]], dtype=bool)
+            if params_hash is not None:
+                mask &= table["params_hash"] == params_hash
+            tables.append(table[mask])
+        if not tables:
+            return pd.DataFrame(columns=["folder", "name", "params_hash", "evaluated", *SCALAR_FIELDS, "chunk", "row"])
+        result = pd.concat(tables, ignore_index=True)
+        if latest:
+            result = result.sort_values("evaluated").drop_duplicates(["folder", "name", "params_hash"], keep="last").sort_index()
+        return result.reset_index(drop=True)
+
+    def load_series(self, row) -> dict[str, np.ndarray]:
+        """ per frame arrays of one result, row is a row of the query result """
+        with np.load(self.path / row["chunk"], allow_pickle=False) as npz:
+            return {name: npz[f"series/{int(row['row'])}/{name}"] for name in SERIES_FIELDS}
+
+    def __len__(self) -> int:
+        count = len(self._rows)
+        for chunk in self._chunks():
+            with np.load(chunk, allow_pickle=False) as npz:
+                count += len(npz["series_length"])
+        return count
+
+
+def _column_array(column: pd.Series) -> np.ndarray:
+    """ numeric columns as they are, everything else as unicode strings, so no pickling is needed """
+    if pd.api.types.is_numeric_dtype(column) or pd.api.types.is_bool_dtype(column):
+        return column.to_numpy()
+    return column.fillna("").astype(str).to_numpy(dtype=str)
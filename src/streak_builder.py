@@ -0,0 +1,78 @@
+#     BounceAnalyzer is a program to analyze the bounces of objects
+#     Copyright (C) 2023  Raphael Kriegl
+
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Union
+import numpy as np
+
+from video_reader import IVideoReader
+
+# number of frames that are read and reduced at once, limits peak memory to roughly one chunk per worker
+STREAK_CHUNK_SIZE = 256
+# number of threads reducing frame blocks in parallel, numpy releases the GIL during the reduction
+STREAK_WORKERS = os.cpu_count() or 1
+
+
+def build_streak(video: Union[IVideoReader, np.ndarray], chunk_size: int = STREAK_CHUNK_SIZE, progress_callback: Callable[[float], None] = None, workers: int = None) -> np.ndarray:
+    """
+    builds the streak image by reducing every frame row to its minimum, the frames are pulled from the video in chunks
+    so only one chunk per worker has to be in memory at a time, readers without random access are streamed on one thread
+
+    :param video: video reader or array of shape (N, H, W)
+    :param chunk_size: number of frames per chunk
+    :param progress_callback: called with the processed fraction of frames after each chunk
+    :param workers: number of threads reducing chunks in parallel, defaults to STREAK_WORKERS
+    :returns: streak image of shape (H, N)
+    """
+    workers = workers or STREAK_WORKERS
+    num_frames = len(video)
+    first = np.asarray(video[0])
+    # every chunk writes to a contiguous block of rows, the transpose is returned
+    streak = np.empty((num_frames, first.shape[0]), dtype=first.dtype)
+    blocks = [(start, min(start + chunk_size, num_frames)) for start in range(0, num_frames, chunk_size)]
+
+    def reduce_block(start, stop):
+        if isinstance(video, IVideoReader):
+            video.read_row_min(start, stop, out=streak[start:stop])
+        else:
+            np.min(video[start:stop], axis=2, out=streak[start:stop])
+        return stop - start
+
+    if not getattr(video, "random_access", True):
+        # sequential readers stream their chunks on one thread, e.g. compressed videos decode at constant memory
+        for start, chunk in video.iter_chunks(chunk_size):
+            stop = start + len(chunk)
+            np.min(chunk, axis=2, out=streak[start:stop])
+            if progress_callback: progress_callback(stop / num_frames)
+    elif workers <= 1 or len(blocks) <= 1:
+        for start, stop in blocks:
+            reduce_block(start, stop)
+            if progress_callback: progress_callback(stop / num_frames)
+    else:
+        done = 0
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(reduce_block, start, stop) for start, stop in blocks]
+            try:
+                for future in as_completed(futures):
+                    done += future.result()
+                    if progress_callback: progress_callback(done / num_frames)
+            except BaseException:
+                # e.g. a cancelled evaluation raising in the progress callback, do not wait for the remaining chunks
+                for future in futures: future.cancel()
+                raise
+
+    return streak.T
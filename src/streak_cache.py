@@ -0,0 +1,126 @@
+#     BounceAnalyzer is a program to analyze the bounces of objects
+#     Copyright (C) 2023  Raphael Kriegl
+
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import os
+import logging
+import tempfile
+from pathlib import Path
+import numpy as np
+
+from data_classes import VideoInfoPresets
+from fingerprint import hash_values, video_fingerprint
+
+# root of all caches, can be changed with the BOUNCE_CACHE_DIR environment variable
+CACHE_DIR = Path(os.environ.get("BOUNCE_CACHE_DIR", Path.home() / ".cache" / "BounceAnalyzer"))
+STREAK_CACHE_BYTES = 2 * 2**30
+# part of the cache key, change when the streak reduction changes
+STREAK_VERSION = "row_min_1"
+
+
+class DiskCache:
+    """ directory of cache files with size based eviction, the least recently used files are removed first """
+    suffix = ".npy"
+
+    def __init__(self, cache_dir, max_bytes: int):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+    def path(self, key: str) -> Path:
+        return self.cache_dir / (key + self.suffix)
+
+    def _lookup(self, key: str):
+        """ returns the path of the cached entry and marks it as used, None if there is no entry """
+        path = self.path(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            # also if another process evicted it just now
+            self.misses += 1
+            return None
+        self.hits += 1
+        return path
+
+    def _write(self, key: str, write_fn):
+        """ writes an entry atomically with write_fn(file), then evicts old entries """
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                write_fn(f)
+            os.replace(tmp, self.path(key))
+        except BaseException:
+            os.remove(tmp)
+            raise
+        self.evict()
+
+    def evict(self):
+        """ removes the least recently used entries until the cache fits into max_bytes """
+        if not self.cache_dir.exists(): return
+        entries = self._entries()
+        total = sum(st.st_size for st, _ in entries)
+        for st, p in sorted(entries, key=lambda e: e[0].st_mtime):
+            if total <= self.max_bytes: break
+            p.unlink(missing_ok=True)
+            total -= st.st_size
+            logging.debug(f"Evicted {p.name} from cache")
+
+    def _entries(self) -> list:
+        """ stat and path of all entries, entries removed by another process in the meantime are left out """
+        entries = []
+        for p in self.cache_dir.glob("*" + self.suffix):
+            try:
+                entries.append((p.stat(), p))
+            except FileNotFoundError:
+                pass
+        return entries
+
+    @property
+    def nbytes(self) -> int:
+        return sum(st.st_size for st, _ in self._entries()) if self.cache_dir.exists() else 0
+
+    def clear(self):
+        for p in self.cache_dir.glob("*" + self.suffix):
+            p.unlink(missing_ok=True)
+
+
+class StreakCache(DiskCache):
+    """
+    persistent cache of streak images, keyed by the content of the video file and the region of interest
+
+    Re-evaluating a video with other thresholds loads the streak from here instead of decoding the video again.
+    """
+    def __init__(self, cache_dir=None, max_bytes: int = STREAK_CACHE_BYTES):
+        super().__init__(cache_dir or CACHE_DIR / "streaks", max_bytes)
+
+    def key(self, filename: str, info: VideoInfoPresets) -> str:
+        return hash_values(video_fingerprint(filename), info.roi, STREAK_VERSION)
+
+    def load(self, filename: str, info: VideoInfoPresets) -> np.ndarray:
+        """ returns the cached streak of the video, None if it was not cached yet """
+        path = self._lookup(self.key(filename, info))
+        if path is None: return None
+        try:
+            return np.load(path)
+        except (OSError, ValueError) as ex:
+            # truncated, corrupt or evicted by another process since the lookup
+            logging.warning(f"Removing unreadable cache entry {path.name}: {ex}")
+            path.unlink(missing_ok=True)
+            return None
+
+    def store(self, filename: str, info: VideoInfoPresets, streak: np.ndarray):
+        self._write(self.key(filename, info), lambda f: np.save(f, streak))
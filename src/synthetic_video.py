@@ -0,0 +1,267 @@
+#     BounceAnalyzer is a program to analyze the bounces of objects
+#     Copyright (C) 2023  Raphael Kriegl
+
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import os
+import datetime
+from dataclasses import dataclass
+from typing import Callable, Union
+import numpy as np
+import av
+
+from video_reader import IVideoReader, pack_uint12
+
+# frames rendered at once by the writers
+SYNTHETIC_CHUNK_SIZE = 256
+
+# shape of the deformation over the contact time, maps the phase 0..1 to the fraction 0..1 of the maximum deformation
+DEFORMATION_PROFILES = {
+    "sine": lambda phase: np.sin(np.pi * phase),
+    "triangle": lambda phase: 1 - np.abs(2 * phase - 1),
+    "hertz": lambda phase: np.sin(np.pi * phase) ** 0.8,
+}
+
+_CIHX_TEMPLATE = """<?xml version="1.0" encoding="UTF-8" standalone="yes" ?>
+<cih>
+<fileInfo><date>{date}</date></fileInfo>
+<deviceInfo><deviceName>BounceAnalyzer synthetic</deviceName></deviceInfo>
+<basicInfo><comment>{comment}</comment></basicInfo>
+<recordInfo><recordRate>{frame_rate:g}</recordRate><shutterSpeed>{shutter:g}</shutterSpeed></recordInfo>
+<frameInfo><totalFrame>{num_frames}</totalFrame><recordedFrame>{num_frames}</recordedFrame></frameInfo>
+<imageDataInfo>
+<resolution><width>{width}</width><height>{height}</height></resolution>
+<colorInfo><type>Mono</type><bit>{bit_depth}</bit></colorInfo>
+<effectiveBit><depth>{bit_depth}</depth><side>Lower</side></effectiveBit>
+</imageDataInfo>
+<imageFileInfo><fileFormat>MRaw</fileFormat></imageFileInfo>
+</cih>
+"""
+
+
+@dataclass
+class SyntheticBounce:
+    """
+    parameters of a synthetic video of a dark ball falling onto a surface and bouncing back, seen from the side
+
+    The ball moves along the rows (down is positive), it touches the surface at impact_time, is deformed following
+    the deformation profile for contact_time and leaves with cor times the impact speed.
+    """
+    num_frames: int = 600
+    height: int = 128
+    width: int = 64
+    frame_rate: float = 30000.0
+    bit_depth: int = 12
+    # standard deviation of the gaussian pixel noise, in counts
+    noise: float = 0.0
+    ball_size: float = 3e-3 # m
+    pixel_scale: float = 1e-4 # m/px
+    speed_in: float = 1.0 # m/s
+    cor: float = 0.6
+    max_deformation: float = 3e-4 # m
+    contact_time: float = 5e-4 # s
+    deformation_profile: Union[str, Callable] = "sine"
+    # None centers the impact in the video
+    impact_time: float = None # s
+    # row of the surface, the lowest row the ball touches without deformation, None puts it 10 % above the bottom
+    surface_row: float = None
+    gravity: float = 0.0 # m/s^2
+    seed: int = 0
+
+    @property
+    def ball_px(self) -> float:
+        return self.ball_size / self.pixel_scale
+
+    @property
+    def levels(self) -> tuple[int, int]:
+        """ intensity of the background and of the ball """
+        full = 2**self.bit_depth - 1
+        return int(0.95 * full), int(0.05 * full)
+
+    @property
+    def dtype(self):
+        return np.uint8 if self.bit_depth <= 8 else np.uint16
+
+
+@dataclass
+class GroundTruth:
+    """ true values of a synthetic bounce, position is the top of the ball in m for every frame """
+    cor: float
+    speed_in: float
+    speed_out: float
+    max_deformation: float
+    impact_time: float
+    release_time: float
+    pixel_scale: float
+    time: np.ndarray
+    position: np.ndarray
+
+
+def _impact_time(params: SyntheticBounce) -> float:
+    return params.impact_time if params.impact_time is not None else params.num_frames / 2 / params.frame_rate
+
+
+def _surface_row(params: SyntheticBounce) -> float:
+    return params.surface_row if params.surface_row is not None else 0.9 * params.height
+
+
+def ball_top(params: SyntheticBounce, time: np.ndarray) -> np.ndarray:
+    """ row of the top of the ball at the given times """
+    profile = DEFORMATION_PROFILES[params.deformation_profile] if isinstance(params.deformation_profile, str) else params.deformation_profile
+    t0, tc = _impact_time(params), params.contact_time
+    top0 = _surface_row(params) - params.ball_px
+    before = t0 - time
+    after = time - t0 - tc
+    fall = params.speed_in * before - 0.5 * params.gravity * before**2
+    rise = params.cor * params.speed_in * after - 0.5 * params.gravity * after**2
+    deformation = params.max_deformation * profile(np.clip((time - t0) / tc, 0, 1))
+    meters = np.where(time < t0, -fall, np.where(time < t0 + tc, deformation, -rise))
+    return top0 + meters / params.pixel_scale
+
+
+def ground_truth(params: SyntheticBounce) -> GroundTruth:
+    time = np.arange(params.num_frames) / params.frame_rate
+    t0 = _impact_time(params)
+    return GroundTruth(
+        cor=params.cor,
+        speed_in=params.speed_in,
+        speed_out=-params.cor * params.speed_in,
+        max_deformation=params.max_deformation,
+        impact_time=t0,
+        release_time=t0 + params.contact_time,
+        pixel_scale=params.pixel_scale,
+        time=time,
+        position=ball_top(params, time) * params.pixel_scale
+    )
+
+
+def render_frames(params: SyntheticBounce, start: int, stop: int) -> np.ndarray:
+    """ renders frames start:stop, the edge of the ball is anti-aliased and the noise of every frame only depends on the seed and the frame index """
+    radius = params.ball_px / 2
+    center = ball_top(params, np.arange(start, stop) / params.frame_rate) + radius
+    rows = np.arange(params.height, dtype=np.float32)
+    dx2 = (np.arange(params.width, dtype=np.float32) - params.width / 2) ** 2
+    dist = np.sqrt((rows[None, :] - center[:, None].astype(np.float32))[:, :, None] ** 2 + dx2[None, None, :])
+    coverage = np.clip(radius - dist + 0.5, 0, 1)
+    background, ball = params.levels
+    frames = background - (background - ball) * coverage
+    if params.noise:
+        for i, frame in enumerate(frames):
+            frame += np.random.default_rng([params.seed, start + i]).normal(0, params.noise, frame.shape).astype(np.float32)
+    return np.clip(np.rint(frames), 0, 2**params.bit_depth - 1).astype(params.dtype)
+
+
+def render(params: SyntheticBounce) -> tuple[np.ndarray, GroundTruth]:
+    """ renders the whole video in memory, use SyntheticVideoReader or the writers for long videos """
+    return render_frames(params, 0, params.num_frames), ground_truth(params)
+
+
+class SyntheticVideoReader(IVideoReader):
+    """ reader that renders the frames of a synthetic bounce on access, so videos of any length need no memory or disk """
+    def __init__(self, params: SyntheticBounce):
+        self.params = params
+
+    def __len__(self):
+        return self.params.num_frames
+
+    def _read_frames(self, start: int, stop: int) -> np.ndarray:
+        return render_frames(self.params, start, stop)
+
+    def __repr__(self):
+        return f"Synthetic bounce {self.params}"
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def _reset(self):
+        pass
+
+    @property
+    def image_array(self) -> np.ndarray:
+        return self[:]
+
+    @property
+    def frame_width(self):
+        return self.params.width
+
+    @property
+    def frame_height(self):
+        return self.params.height
+
+    @property
+    def frame_shape(self):
+        return (self.params.height, self.params.width)
+
+    @property
+    def color_channels(self):
+        return 1
+
+    @property
+    def color_bit_depth(self):
+        return self.params.bit_depth
+
+    @property
+    def frame_rate(self):
+        return self.params.frame_rate
+
+    @property
+    def pixel_scale(self):
+        return self.params.pixel_scale
+
+    @property
+    def filename(self):
+        return "synthetic"
+
+
+def write_mraw(params: SyntheticBounce, filename: str, chunk_size: int = SYNTHETIC_CHUNK_SIZE) -> str:
+    """
+    writes a Photron recording, a mraw file and a cihx header, the frames are rendered and written in chunks
+
+    :param filename: path of the recording, the suffix is replaced
+    :returns: path of the cihx file
+    """
+    if params.bit_depth not in (8, 12, 16):
+        raise ValueError(f"Photron recordings have 8, 12 or 16 bit, not {params.bit_depth}")
+    root = os.path.splitext(filename)[0]
+    with open(root + ".cihx", "w", encoding="utf-8") as f:
+        f.write(_CIHX_TEMPLATE.format(date=datetime.date.today().strftime("%Y/%m/%d"), comment="synthetic bounce", shutter=1 / params.frame_rate,
+                                      frame_rate=params.frame_rate, num_frames=params.num_frames, width=params.width, height=params.height,
+                                      bit_depth=params.bit_depth))
+    with open(root + ".mraw", "wb") as f:
+        for start in range(0, params.num_frames, chunk_size):
+            frames = render_frames(params, start, min(start + chunk_size, params.num_frames))
+            (pack_uint12(frames) if params.bit_depth == 12 else frames).tofile(f)
+    return root + ".cihx"
+
+
+def write_mp4(params: SyntheticBounce, filename: str, codec: str = "mpeg4", chunk_size: int = SYNTHETIC_CHUNK_SIZE) -> str:
+    """ encodes the video as 8 bit, e.g. to test compressed videos, the frames are rendered and encoded in chunks """
+    shift = max(params.bit_depth - 8, 0)
+    with av.open(filename, "w") as container:
+        stream = container.add_stream(codec, rate=int(round(params.frame_rate)))
+        stream.width, stream.height, stream.pix_fmt = params.width, params.height, "yuv420p"
+        stream.codec_context.bit_rate = 8 * params.width * params.height * int(round(params.frame_rate))
+        for start in range(0, params.num_frames, chunk_size):
+            for frame in render_frames(params, start, min(start + chunk_size, params.num_frames)):
+                img = (frame >> shift).astype(np.uint8)
+                container.mux(stream.encode(av.VideoFrame.from_ndarray(img, format="gray")))
+        container.mux(stream.encode())
+    return filename
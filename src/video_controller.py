@@ -17,7 +17,9 @@
 import os
 from pathlib import Path
 from video_preview import VideoPreview
-from video_reader import IVideoReader, VideoReaderMem
+from video_reader import IVideoReader, open_video
+from frame_cache import FrameCache
+from playback import PlaybackScheduler, DISPLAY_FPS, PLAYBACK_SPEED
 
 import numpy as np
 import pandas as pd
@@ -41,6 +43,10 @@ class VideoController(QObject):
         self.player.update_contact_pos_event.connect(self.update_contact_pos)
         # self.reader: VideoReader = None
         self.reader: IVideoReader = None
+        self.frame_cache: FrameCache = None
+        self.scheduler: PlaybackScheduler = None
+        self.display_fps = DISPLAY_FPS
+        self.playback_speed = PLAYBACK_SPEED
         self._play_timer = QTimer()
         self._play_timer.timeout.connect(self.timer_handler)
         self._video_limits = [0,None]
@@ -52,26 +58,34 @@ class VideoController(QObject):
 
     @Slot()
     def play(self):
-        logging.debug(f"Start playback of video @ {self.reader.frame_rate} FPS")
-        self._play_timer.setInterval(1000/self.reader.frame_rate)
+        logging.debug(f"Start playback of video @ {self.display_fps} FPS, {self.playback_speed:g}x real time")
+        # playing again after the end starts over
+        self.scheduler.start(0 if self.current_frame_pos >= len(self.reader) - 1 else self.current_frame_pos)
+        self._play_timer.setInterval(int(round(self.scheduler.interval_ms)))
         self._play_timer.start()
         #self.media_player.play()
 
     @Slot()
     def pause(self):
-        logging.debug("Pause playback of video")
+        logging.debug(f"Pause playback of video, {self.scheduler}")
         self._play_timer.stop()
         #self.media_player.play()
 
     @Slot()
     def play_pause(self):
         if self._play_timer.isActive():
-            logging.debug("Pause playback of video")
-            self._play_timer.stop()
+            self.pause()
         else:
-            logging.debug(f"Start playback of video @ {self.reader.frame_rate} FPS")
-            self._play_timer.setInterval(1000/self.reader.frame_rate)
-            self._play_timer.start()
+            self.play()
+
+    def set_playback_speed(self, speed: float, display_fps: float = None):
+        """ sets playback speed relative to real time and optionally the display rate """
+        self.playback_speed = speed
+        if display_fps: self.display_fps = display_fps
+        if self.scheduler is not None:
+            self.scheduler.speed = self.playback_speed
+            self.scheduler.display_fps = self.display_fps
+            if self._play_timer.isActive(): self.play()
 
     @Slot()
     def on_eval_btn_clicked(self):
@@ -93,13 +107,18 @@ class VideoController(QObject):
 
     @Slot()
     def open_file(self):
-        path,_ = QFileDialog.getOpenFileName(self.ui.centralwidget, "Select Video File", r"G:\Messungen", "Video Files (*.cihx *.avi *.mp4 *.mkv *.m4a *.webm *.flv *.wmv)")
+        path,_ = QFileDialog.getOpenFileName(self.ui.centralwidget, "Select Video File", r"G:\Messungen", "Video Files (*.cihx *.mraw *.avi *.mp4 *.mkv *.m4a *.webm *.flv *.wmv)")
         if path:
             self.load_video(path)
 
     def load_video(self, path):
         # self.reader = VideoReader(str(path))
-        self.reader = VideoReaderMem(str(path))
+        self.reader = open_video(str(path))
+        if self.frame_cache is not None:
+            logging.debug(f"Frame cache of {self.video_name}: {self.frame_cache.hits} hits, {self.frame_cache.misses} misses")
+            self.frame_cache.close()
+        self.frame_cache = FrameCache(self.reader)
+        self.scheduler = PlaybackScheduler(self.reader.frame_rate, len(self.reader), self.display_fps, self.playback_speed)
         self.video_name = Path(path).stem
         self.ui.seekBar.setMaximum(len(self.reader) - 1)
         self.ui.seekBar.setMinimum(0)
@@ -108,32 +127,31 @@ class VideoController(QObject):
         self.loaded_video_signal.emit(str(path), self.reader)
 
     
-    def read_image(self, pos):
-        frame = self.reader[pos]
+    def read_image(self, pos, read_ahead=True):
+        frame = self.frame_cache[pos] if read_ahead else self.frame_cache.get(pos)
         self._raw_image = frame
         self.player.update_image(frame)
         
 
     @Slot()
     def timer_handler(self):
-        if not self.advance_image():
-            self._play_timer.stop()
+        frame = self.scheduler.next_frame()
+        if frame != self.current_frame_pos:
+            self.read_image(frame, read_ahead=False)
+            self.current_frame_pos = frame
+        # decode the next displayed frame while waiting for the timer
+        self.frame_cache.prefetch(self.scheduler.upcoming_frame(), count=1)
         self.ui.seekBar.setValue(self.current_frame_pos)
-
-    def advance_image(self):
-        if self.current_frame_pos < len(self.reader) - 1:
-            self.read_image(self.current_frame_pos + 1)
-            self.current_frame_pos += 1
-            return True
-        else:
-            self.read_image(0)
-            self.current_frame_pos = 0
-            return True
+        self.ui.statusLbl.setText(repr(self.scheduler))
+        if self.scheduler.at_end:
+            self.pause()
 
     @Slot(int)
     def update_position(self, pos):
         self.read_image(pos)
         self.current_frame_pos = pos
+        if self._play_timer.isActive():
+            self.scheduler.start(pos)
 
 
     def save_current_frame(self, raw=True):
@@ -22,8 +22,12 @@ from PySide6.QtOpenGLWidgets import QOpenGLWidget
 from PySide6.QtCore import  Qt, Slot, Signal
 from PySide6.QtGui import QBrush, QImage, QPainter, QPen, QPixmap
 
+from frame_cache import to_8bit
+
 class VideoPreview(QOpenGLWidget):
     update_contact_pos_event = Signal(int,int)
+    # emits ((row_start, row_stop), (col_start, col_stop)) or None if the region of interest was cleared
+    update_roi_event = Signal(object)
     def __init__(self, parent=None):
         super().__init__(parent)
         self._double_buffer: QImage = None
@@ -34,6 +38,8 @@ class VideoPreview(QOpenGLWidget):
         self._first_show = True
         self._has_mouse = False
         self._contact_pos = None
+        self._roi_start = None
+        self._roi = None
 
 
     def update_image(self, im: np.ndarray):
@@ -63,12 +69,7 @@ class VideoPreview(QOpenGLWidget):
 
     def ensure_8bit_image(self, img: np.ndarray):
         """ checks bit count of inut and normalizes to 8 bit if nessecary, also tries to do contrast enhancement from additional info """
-        if img.dtype.itemsize > 1:
-            ret = np.zeros(img.shape, dtype=np.uint8)
-            cv2.normalize(img, ret, norm_type=cv2.NORM_MINMAX, alpha=0, beta=255, dtype=cv2.CV_8UC1)
-            return ret
-        else:
-            return img
+        return to_8bit(img)
 
     def update_shape(self, shape):
         self._image_shape = shape
@@ -88,19 +89,53 @@ class VideoPreview(QOpenGLWidget):
         return evt_ret
     
     def mousePressEvent(self, event: QtGui.QMouseEvent):
-        self._has_mouse = True
+        if event.button() == Qt.RightButton:
+            # right button drags the region of interest
+            self._roi_start = self.mapToImage(*self.mapFromGlobal(event.globalPos()).toTuple())
+            self._roi = None
+        else:
+            self._has_mouse = True
 
-    def mosueMoveEvent(self, event: QtGui.QMouseEvent):
-        if self._has_mouse:
-            self._contact_pos = self.mapToImage(*self.mapFromGlobal(event.globalPos()).toTuple())
+    def mouseMoveEvent(self, event: QtGui.QMouseEvent):
+        pos = self.mapToImage(*self.mapFromGlobal(event.globalPos()).toTuple())
+        if self._roi_start is not None:
+            self._roi = self._make_roi(self._roi_start, pos)
+            self.update()
+        elif self._has_mouse:
+            self._contact_pos = pos
             self.update()
 
     def mouseReleaseEvent(self, event: QtGui.QMouseEvent):
+        pos = self.mapToImage(*self.mapFromGlobal(event.globalPos()).toTuple())
+        if event.button() == Qt.RightButton and self._roi_start is not None:
+            self._roi = self._make_roi(self._roi_start, pos)
+            self._roi_start = None
+            self.update_roi_event.emit(self._roi)
+            self.update()
+            return
         self._has_mouse = False
-        self._contact_pos = self.mapToImage(*self.mapFromGlobal(event.globalPos()).toTuple())
+        self._contact_pos = pos
         self.update_contact_pos_event.emit(*self._contact_pos)
         self.update()
 
+    def _make_roi(self, start, end):
+        """ region of interest spanned by two image points, clipped to the image, None if it is too small """
+        height, width = self._image_shape[:2]
+        (x0, x1), (y0, y1) = sorted((start[0], end[0])), sorted((start[1], end[1]))
+        rows = (max(0, y0), min(height, y1))
+        cols = (max(0, x0), min(width, x1))
+        if rows[1] - rows[0] < 2 or cols[1] - cols[0] < 2:
+            return None
+        return rows, cols
+
+    def set_roi(self, roi):
+        """ sets the displayed region of interest, ((row_start, row_stop), (col_start, col_stop)) or None """
+        self._roi = roi
+        self.update()
+
+    def get_roi(self):
+        return self._roi
+
 
     def get_transform(self):
         """ 
@@ -173,6 +208,12 @@ class VideoPreview(QOpenGLWidget):
             x,y = self.mapFromImage(*self._contact_pos)
             db_painter.drawLine(0, y, w , y)
             db_painter.drawLine(x, 0, x, h)
+
+        if self._roi:
+            (r0, r1), (c0, c1) = self._roi
+            x, y, rw, rh = *self.mapFromImage(c0, r0), *self.mapFromImage(w=c1 - c0, h=r1 - r0)
+            db_painter.setPen(pen_contour)
+            db_painter.drawRect(x, y, rw, rh)
              
         db_painter.end()
         self.blockSignals(False)
@@ -0,0 +1,138 @@
+#     BounceAnalyzer is a program to analyze the bounces of objects
+#     Copyright (C) 2023  Raphael Kriegl
+
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import os
+import logging
+from dataclasses import dataclass
+from pathlib import Path
+import pyMRAW
+import av
+
+PHOTRON_SUFFIXES = (".cihx", ".cih", ".mraw")
+
+# rough decoding throughput in pixels per second, used to estimate the cost of a file before loading it
+PIXEL_THROUGHPUT = {
+    "mraw": 1.0e9,
+    "mraw12": 4.0e8,
+    "av": 1.5e8,
+}
+
+
+@dataclass
+class VideoProbe:
+    """ metadata of a video file read from its header only """
+    filename: str
+    num_frames: int
+    width: int
+    height: int
+    bit_depth: int
+    frame_rate: float
+    pixel_scale: float
+    file_size: int
+    format: str
+
+    @property
+    def frame_bytes(self) -> int:
+        """ bytes of one decoded frame """
+        return self.width * self.height * (1 if self.bit_depth <= 8 else 2)
+
+    @property
+    def memory_bytes(self) -> int:
+        """ bytes needed to hold the whole decoded video in memory """
+        return self.num_frames * self.frame_bytes
+
+    @property
+    def decode_seconds(self) -> float:
+        """ rough estimate of the time needed to decode all frames """
+        kind = "mraw12" if self.format == "mraw" and self.bit_depth == 12 else self.format
+        return self.num_frames * self.width * self.height / PIXEL_THROUGHPUT.get(kind, PIXEL_THROUGHPUT["av"])
+
+    def __repr__(self):
+        return f"{self.filename}: {self.num_frames} frames of {self.width}x{self.height} @ {self.bit_depth} bit, {self.frame_rate:g} fps, ~{self.memory_bytes / 2**20:.0f} MiB"
+
+
+def probe_video(filename: str) -> VideoProbe:
+    """ reads frame count, resolution, bit depth, frame rate and pixel scale from the header of a video without decoding any pixels """
+    if not os.path.exists(filename):
+        raise FileNotFoundError(f'{filename} not found.')
+    root, ext = os.path.splitext(filename)
+    if ext in PHOTRON_SUFFIXES:
+        cih_file = filename if ext != ".mraw" else next((root + e for e in (".cihx", ".cih") if os.path.exists(root + e)), None)
+        mraw_file = root + ".mraw"
+        if cih_file is None or not os.path.exists(mraw_file):
+            raise FileNotFoundError(f'Recording {filename} is incomplete, cih(x) and mraw file are needed.')
+        info = pyMRAW.get_cih(cih_file)
+        probe = VideoProbe(
+            filename=filename,
+            num_frames=int(info["Total Frame"]),
+            width=int(info["Image Width"]),
+            height=int(info["Image Height"]),
+            bit_depth=int(info["Color Bit"]),
+            frame_rate=float(info["Record Rate(fps)"]),
+            pixel_scale=float(info.get("Pixel Scale", 1.0)),
+            file_size=os.path.getsize(mraw_file),
+            format="mraw"
+        )
+        if probe.file_size < probe.num_frames * probe.width * probe.height * probe.bit_depth // 8:
+            raise ValueError(f"{mraw_file} is smaller than the {probe.num_frames} frames announced in {cih_file}.")
+        return probe
+
+    try:
+        with av.open(filename) as container:
+            stream = container.streams.video[0]
+            frame_rate = float(stream.average_rate or stream.guessed_rate or 0)
+            num_frames = stream.frames
+            if not num_frames and stream.duration:
+                num_frames = int(round(float(stream.duration * stream.time_base) * frame_rate))
+            return VideoProbe(
+                filename=filename,
+                num_frames=num_frames,
+                width=stream.codec_context.width,
+                height=stream.codec_context.height,
+                bit_depth=8,
+                frame_rate=frame_rate,
+                pixel_scale=1.0,
+                file_size=os.path.getsize(filename),
+                format="av"
+            )
+    except (av.error.FFmpegError, IndexError) as ex:
+        raise ValueError(f"Cannot probe video {filename}:\n{ex}")
+
+
+def plan_batch(files: list, largest_first: bool = False) -> list[VideoProbe]:
+    """
+    probes all files of a batch, drops files that cannot be read and recordings that were matched twice (cihx and mraw)
+
+    :param files: paths of the videos
+    :param largest_first: sort by decoded size instead of by path
+    :returns: the probes of all valid videos
+    """
+    probes = {}
+    for f in files:
+        path = Path(f)
+        key = path.with_suffix("") if path.suffix in PHOTRON_SUFFIXES else path
+        if key in probes: continue
+        try:
+            probes[key] = probe_video(str(path))
+        except (FileNotFoundError, ValueError) as ex:
+            logging.warning(f"Skipping {path}: {ex}")
+
+    if largest_first:
+        plan = sorted(probes.values(), key=lambda p: p.memory_bytes, reverse=True)
+    else:
+        plan = sorted(probes.values(), key=lambda p: p.filename)
+    logging.info(f"Batch of {len(plan)} videos, {sum(p.memory_bytes for p in plan) / 2**30:.2f} GiB decoded, est. {sum(p.decode_seconds for p in plan):.0f} s decoding")
+    return plan
@@ -16,6 +16,8 @@
 
 
 import os,sys
+import logging
+import threading
 import pyMRAW
 import imageio.v3 as iio
 from imageio.core.request import InitializationError
@@ -23,13 +25,41 @@ import av # for pipreqs
 import numpy as np
 from abc import ABC
 
+from video_probe import probe_video
+
 class IVideoReader(ABC):
+    # False for readers that have to decode sequentially, e.g. compressed videos, these should not be read from multiple threads
+    random_access = True
+
     def __len__(self):
         """Length is number of frames."""
         raise NotImplementedError()
 
     def __getitem__(self, index):
-        """Now we can get frame via self[index] and self[start:stop:step]."""
+        """Get single frames via self[index], or stacks of frames via self[start:stop:step], self[range] or self[list]."""
+        frames, single = self._normalize_index(index)
+        if single:
+            return self._read_frames(frames.start, frames.stop)[0]
+        if isinstance(frames, range) and frames.step == 1:
+            return self._read_frames(frames.start, max(frames.start, frames.stop))
+        if not len(frames):
+            return self._read_frames(0, 0)
+        return np.stack([self._read_frames(i, i + 1)[0] for i in frames])
+
+    def _normalize_index(self, index) -> tuple[range | list[int], bool]:
+        """ the frames selected by an int, slice, range or list as range or list of non negative indices, and whether a single frame was selected """
+        frames = range(len(self))
+        if isinstance(index, (int, np.integer)):
+            if not -len(frames) <= index < len(frames):
+                raise IndexError(f"frame {index} out of range for video with {len(frames)} frames")
+            index = frames[index]
+            return range(index, index + 1), True
+        if isinstance(index, slice):
+            return frames[index], False
+        return [frames[int(i)] for i in index], False
+
+    def _read_frames(self, start: int, stop: int) -> np.ndarray:
+        """Read the contiguous frames start:stop, the only method readers have to implement for indexing."""
         raise NotImplementedError()
 
     def __repr__(self):
@@ -48,6 +78,20 @@ class IVideoReader(ABC):
     def _reset(self):
         """Re-initialize object."""
         raise NotImplementedError()
+
+    def read_region(self, start: int, stop: int, rows: slice = slice(None), cols: slice = slice(None)) -> np.ndarray:
+        """Read frames start:stop cropped to rows and cols, readers that can avoid reading the cropped pixels override this."""
+        return np.asarray(self[start:stop])[:, rows, cols]
+
+    def read_row_min(self, start: int, stop: int, out: np.ndarray = None) -> np.ndarray:
+        """Minimum of every row of the frames start:stop, shape (stop-start, h). Readers can fuse this with decoding."""
+        return np.min(self[start:stop], axis=2, out=out)
+
+    def iter_chunks(self, chunk_size: int, start: int = 0, stop: int = None):
+        """Generator of (first_index, frames) tuples with up to chunk_size frames each, from start to stop."""
+        stop = len(self) if stop is None else min(stop, len(self))
+        for first in range(start, stop, chunk_size):
+            yield first, self[first:min(first + chunk_size, stop)]
     
     @property
     def image_array(self) -> np.ndarray:
@@ -97,7 +141,7 @@ class VideoReaderMem(IVideoReader):
             self._number_of_frames = int(info["Total Frame"])
             self._bit_per_channel = int(info["Color Bit"])
             self._frame_rate = float(info["Record Rate(fps)"])
-            self._pixel_scale = float(info["Pixel Scale"])
+            self._pixel_scale = float(info.get("Pixel Scale", 1.0))
         elif filename.endswith("mraw"):
             meta_data_file = filename.replace("mraw", "cihx")
             if os.path.exists(meta_data_file):
@@ -106,7 +150,7 @@ class VideoReaderMem(IVideoReader):
                 self._number_of_frames = int(info["Total Frame"])
                 self._bit_per_channel = int(info["Color Bit"])
                 self._frame_rate = float(info["Record Rate(fps)"])
-                self._pixel_scale = float(info["Pixel Scale"])
+                self._pixel_scale = float(info.get("Pixel Scale", 1.0))
         else:
             try:
                 self._vr = iio.imread(filename, plugin="pyav", format="gray")
@@ -190,3 +234,450 @@ class VideoReaderMem(IVideoReader):
     @property
     def filename(self) -> str:
         return self._filename
+
+
+def unpack_uint12(packed: np.ndarray, out: np.ndarray = None) -> np.ndarray:
+    """
+    unpacks 12bit packed pixel data (3 bytes -> 2 pixels) into a flat uint16 array, without intermediate uint16 copies
+
+    Adapted from https://stackoverflow.com/a/51967333/9173710
+
+    :param packed: uint8 array, its size has to be a multiple of 3
+    :param out: optional uint16 buffer with 2/3 of the elements of packed, e.g. a chunk buffer that is reused
+    :returns: out, or a new array if no buffer was given
+    """
+    triplets = packed.reshape(-1, 3)
+    if out is None:
+        out = np.empty(triplets.shape[0] * 2, dtype=np.uint16)
+    pairs = out.reshape(-1, 2)
+    fst, snd = pairs[:, 0], pairs[:, 1]
+    np.left_shift(triplets[:, 0], 4, out=fst, dtype=np.uint16)
+    np.bitwise_or(fst, triplets[:, 1] >> 4, out=fst)
+    np.bitwise_and(triplets[:, 1], 0xF, out=snd, dtype=np.uint16)
+    np.left_shift(snd, 8, out=snd)
+    np.bitwise_or(snd, triplets[:, 2], out=snd)
+    return out
+
+
+def pack_uint12(pixels: np.ndarray) -> np.ndarray:
+    """ packs pixels with values below 4096 into 12bit packed data (2 pixels -> 3 bytes), the inverse of unpack_uint12 """
+    pairs = np.asarray(pixels, dtype=np.uint16).reshape(-1, 2)
+    packed = np.empty((pairs.shape[0], 3), dtype=np.uint8)
+    packed[:, 0] = pairs[:, 0] >> 4
+    packed[:, 1] = ((pairs[:, 0] & 0xF) << 4) | (pairs[:, 1] >> 8)
+    packed[:, 2] = pairs[:, 1] & 0xFF
+    return packed.ravel()
+
+
+def unpack_uint12_row_min(packed: np.ndarray, shape: tuple[int,int,int], out: np.ndarray = None, scratch: np.ndarray = None) -> np.ndarray:
+    """
+    fuses 12bit unpacking with the minimum over every frame row, so the unpacked frames are never stored
+
+    :param packed: uint8 array holding the frames of shape (n, h, w), w has to be even
+    :param shape: (n, h, w) of the packed frames
+    :param out: optional uint16 buffer of shape (n, h) for the row minima
+    :param scratch: optional uint16 buffer of shape (n, h, w/2) that is reused for the even and odd pixels
+    :returns: row minima of shape (n, h)
+    """
+    n, h, w = shape
+    triplets = packed.reshape(n, h, w // 2, 3)
+    if scratch is None:
+        scratch = np.empty((n, h, w // 2), dtype=np.uint16)
+    if out is None:
+        out = np.empty((n, h), dtype=np.uint16)
+    # first pixel of every pair
+    np.left_shift(triplets[..., 0], 4, out=scratch, dtype=np.uint16)
+    np.bitwise_or(scratch, triplets[..., 1] >> 4, out=scratch)
+    np.min(scratch, axis=2, out=out)
+    # second pixel of every pair
+    np.bitwise_and(triplets[..., 1], 0xF, out=scratch, dtype=np.uint16)
+    np.left_shift(scratch, 8, out=scratch)
+    np.bitwise_or(scratch, triplets[..., 2], out=scratch)
+    np.minimum(out, scratch.min(axis=2), out=out)
+    return out
+
+
+class VideoReaderMraw(IVideoReader):
+    """ Reader for Photron mraw recordings that memory-maps the raw file and only decodes frames on access.
+
+    Unlike :class:`VideoReaderMem` the recording never has to fit in memory, opening a file only parses the cihx header.
+    Supports indexing with ints, slices, ranges and sequences of frame indices.
+    """
+    def __init__(self, filename: str):
+        """Open video in filename, can be either the cih(x) or the mraw file."""
+        if not os.path.exists(filename):
+            raise FileNotFoundError(f'{filename} not found.')
+        root, ext = os.path.splitext(filename)
+        if ext == ".mraw":
+            cih_file = next((root + e for e in (".cihx", ".cih") if os.path.exists(root + e)), None)
+            if cih_file is None:
+                raise FileNotFoundError(f'No metadata file found for {filename}.')
+        else:
+            cih_file = filename
+        mraw_file = root + ".mraw"
+        if not os.path.exists(mraw_file):
+            raise FileNotFoundError(f'{mraw_file} not found.')
+
+        info = pyMRAW.get_cih(cih_file)
+        self._number_of_frames = int(info["Total Frame"])
+        self._height = int(info["Image Height"])
+        self._width = int(info["Image Width"])
+        self._bit_per_channel = int(info["Color Bit"])
+        self._color_channels = 1
+        self._frame_rate = float(info["Record Rate(fps)"])
+        self._pixel_scale = float(info.get("Pixel Scale", 1.0))
+
+        if self._bit_per_channel not in (8, 12, 16):
+            raise ValueError(f"Unsupported bit depth: {self._bit_per_channel}")
+        self._frame_bytes = self._height * self._width * self._bit_per_channel // 8
+        self._raw = np.memmap(mraw_file, dtype=np.uint8, mode="r")
+        if self._raw.shape[0] < self._number_of_frames * self._frame_bytes:
+            raise ValueError(f"{mraw_file} is smaller than the {self._number_of_frames} frames announced in {cih_file}.")
+
+        self._filename = filename
+
+    def __del__(self):
+        try:
+            del self._raw
+        except AttributeError:
+            pass
+
+    def __len__(self):
+        """Length is number of frames."""
+        return self._number_of_frames
+
+    def _read_frames(self, start: int, stop: int) -> np.ndarray:
+        return self.read_region(start, stop)
+
+    def read_region(self, start: int, stop: int, rows: slice = slice(None), cols: slice = slice(None)) -> np.ndarray:
+        """ decodes the contiguous frames start:stop cropped to rows and cols, only the bytes of the region are touched """
+        n = stop - start
+        packed = self._raw[start * self._frame_bytes : stop * self._frame_bytes]
+        if self._bit_per_channel == 8:
+            return packed.reshape((n, self._height, self._width))[:, rows, cols]
+        elif self._bit_per_channel == 16:
+            return packed.view(np.uint16).reshape((n, self._height, self._width))[:, rows, cols]
+
+        # 12 bit: 3 bytes hold 2 pixels, so decode the byte columns of all pixel pairs overlapping the region
+        col_start, col_stop, _ = cols.indices(self._width)
+        pair_start, pair_stop = col_start // 2, (col_stop + 1) // 2
+        packed = packed.reshape((n, self._height, self._width * 3 // 2))[:, rows, 3 * pair_start : 3 * pair_stop]
+        frames = np.empty(packed.shape[:2] + (2 * (pair_stop - pair_start),), dtype=np.uint16)
+        unpack_uint12(np.ascontiguousarray(packed), out=frames.reshape(-1))
+        offset = col_start - 2 * pair_start
+        return frames[:, :, offset : offset + col_stop - col_start]
+
+    def read_row_min(self, start: int, stop: int, out: np.ndarray = None) -> np.ndarray:
+        """ row minima of frames start:stop, 12 bit frames are reduced while unpacking """
+        if self._bit_per_channel != 12:
+            return np.min(self.read_region(start, stop), axis=2, out=out)
+        packed = self._raw[start * self._frame_bytes : stop * self._frame_bytes]
+        return unpack_uint12_row_min(packed, (stop - start, self._height, self._width), out=out)
+
+    def __repr__(self):
+        return f"{self._filename} with {len(self)} frames of size {self.frame_shape} at {self.frame_rate:1.2f} fps"
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        """Release video file."""
+        del self._raw
+
+    def _reset(self):
+        """Re-initialize object."""
+        self.__init__(self._filename)
+
+    @property
+    def dtype(self):
+        return np.uint8 if self._bit_per_channel == 8 else np.uint16
+
+    @property
+    def image_array(self) -> np.ndarray:
+        """ entire video as array, this is a memory map for 8 and 16 bit, 12 bit videos have to be decoded into memory! """
+        return self[:]
+
+    @property
+    def frame_width(self):
+        return self._width
+
+    @property
+    def frame_height(self):
+        return self._height
+
+    @property
+    def frame_shape(self):
+        return (self._height, self._width)
+
+    @property
+    def color_channels(self):
+        return self._color_channels
+
+    @property
+    def color_bit_depth(self):
+        return self._bit_per_channel
+
+    @property
+    def frame_rate(self):
+        return self._frame_rate
+
+    @property
+    def pixel_scale(self):
+        return self._pixel_scale
+
+    @property
+    def filename(self) -> str:
+        return self._filename
+
+
+class RegionReader(IVideoReader):
+    """ view on a region of interest of another reader, the region is cropped while reading
+
+    :param reader: the underlying reader
+    :param rows: (start, stop) of the row window, None for all rows
+    :param cols: (start, stop) of the column window, None for all columns
+    :param frames: (start, stop) of the frame range, None for all frames
+    """
+    def __init__(self, reader: IVideoReader, rows: tuple[int,int] = None, cols: tuple[int,int] = None, frames: tuple[int,int] = None):
+        self._reader = reader
+        height, width = reader.frame_shape[:2]
+        self._rows = slice(*slice(*(rows or (None,))).indices(height)[:2])
+        self._cols = slice(*slice(*(cols or (None,))).indices(width)[:2])
+        self._frames = range(len(reader))[slice(*(frames or (None,)))]
+
+    def __len__(self):
+        """Length is number of frames in the frame range."""
+        return len(self._frames)
+
+    def _read_frames(self, start: int, stop: int) -> np.ndarray:
+        """Frames are indexed relative to the start of the frame range."""
+        offset = self._frames.start
+        return self._reader.read_region(offset + start, offset + stop, self._rows, self._cols)
+
+    def read_region(self, start: int, stop: int, rows: slice = slice(None), cols: slice = slice(None)) -> np.ndarray:
+        return self[start:stop][:, rows, cols]
+
+    @property
+    def random_access(self):
+        return self._reader.random_access
+
+    def __repr__(self):
+        return f"Region rows {self._rows.start}:{self._rows.stop}, cols {self._cols.start}:{self._cols.stop}, frames {self.frame_offset}:{self.frame_offset + len(self)} of {self._reader!r}"
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def _reset(self):
+        pass
+
+    @property
+    def frame_offset(self) -> int:
+        """ index of the first frame of the region in the underlying video """
+        return self._frames.start
+
+    @property
+    def row_offset(self) -> int:
+        """ index of the first row of the region in the underlying video """
+        return self._rows.start
+
+    @property
+    def image_array(self) -> np.ndarray:
+        return self[:]
+
+    @property
+    def frame_width(self):
+        return self._cols.stop - self._cols.start
+
+    @property
+    def frame_height(self):
+        return self._rows.stop - self._rows.start
+
+    @property
+    def frame_shape(self):
+        return (self.frame_height, self.frame_width)
+
+    @property
+    def color_channels(self):
+        return self._reader.color_channels
+
+    @property
+    def color_bit_depth(self):
+        return self._reader.color_bit_depth
+
+    @property
+    def frame_rate(self):
+        return self._reader.frame_rate
+
+    @property
+    def pixel_scale(self):
+        return self._reader.pixel_scale
+
+    @property
+    def filename(self) -> str:
+        return self._reader.filename
+
+
+def crop_video(video, rows: tuple[int,int] = None, cols: tuple[int,int] = None, frames: tuple[int,int] = None):
+    """ applies a region of interest to a video reader or (N, H, W) array, returns the video unchanged if no region is given """
+    if not (rows or cols or frames):
+        return video
+    if isinstance(video, np.ndarray):
+        return video[slice(*(frames or (None,))), slice(*(rows or (None,))), slice(*(cols or (None,)))]
+    return RegionReader(video, rows, cols, frames)
+
+
+class VideoReaderAV(IVideoReader):
+    """ Streaming reader for compressed videos (mp4, avi, mkv, ...) that decodes grayscale frames on demand with PyAV.
+
+    Sequential reads continue decoding where the last read stopped, random access seeks to the closest keyframe
+    before the requested frame and decodes forward from there. Memory use is independent of the video length.
+    """
+    random_access = False
+
+    def __init__(self, filename: str):
+        """Open video in filename."""
+        if not os.path.exists(filename):
+            raise FileNotFoundError(f'{filename} not found.')
+        try:
+            self._container = av.open(filename)
+            self._stream = self._container.streams.video[0]
+        except (av.error.FFmpegError, IndexError) as ex:
+            raise ValueError("Cannot open video due to the following error:\n" + str(ex))
+        self._stream.thread_type = "AUTO"
+        probe = probe_video(filename)
+        self._number_of_frames = probe.num_frames
+        self._frame_rate = probe.frame_rate
+        self._height = probe.height
+        self._width = probe.width
+        self._start_pts = self._stream.start_time or 0
+        self._decoder = None
+        self._next_index = 0
+        self._last_frame = None
+        self._lock = threading.Lock()
+        self._filename = filename
+
+    def __del__(self):
+        try:
+            self._container.close()
+        except AttributeError:
+            pass
+
+    def __len__(self):
+        """Length is number of frames."""
+        return self._number_of_frames
+
+    def _frame_index(self, frame: av.VideoFrame, previous: int) -> int:
+        if frame.pts is None:
+            return previous + 1
+        return int(round(float((frame.pts - self._start_pts) * self._stream.time_base) * self._frame_rate))
+
+    def _decode_from(self, start: int):
+        """ generator of (index, frame) that seeks to the keyframe before start and skips frames up to start """
+        target = self._start_pts + int(start / self._frame_rate / self._stream.time_base)
+        self._container.seek(target, stream=self._stream, backward=True, any_frame=False)
+        index = -1
+        for frame in self._container.decode(self._stream):
+            index = self._frame_index(frame, index)
+            if index < start: continue
+            yield index, frame.to_ndarray(format="gray")
+
+    def _read_frames(self, start: int, stop: int) -> np.ndarray:
+        """ decodes frames start:stop, continuing the running decoder if the read is sequential """
+        frames = np.empty((stop - start, self._height, self._width), dtype=np.uint8)
+        with self._lock:
+            if self._decoder is None or start != self._next_index:
+                self._decoder = self._decode_from(start)
+            n = 0
+            while n < stop - start:
+                try:
+                    _, frames[n] = next(self._decoder)
+                except StopIteration:
+                    if n == 0 and self._last_frame is None:
+                        raise IndexError(f"no frames could be decoded from {self._filename}")
+                    # the header announced more frames than the stream holds, repeat the last one
+                    logging.warning(f"{self._filename} ended after frame {start + n - 1}, expected {len(self)} frames")
+                    self._decoder = None
+                    frames[n:] = frames[n - 1] if n else self._last_frame
+                    break
+                n += 1
+            self._next_index = stop
+            if stop > start: self._last_frame = frames[-1]
+        return frames
+
+    def iter_frames(self, start: int = 0, stop: int = None):
+        """Generator of grayscale frames from start to stop, decoding sequentially."""
+        for _, chunk in self.iter_chunks(1, start, stop):
+            yield chunk[0]
+
+    def __repr__(self):
+        return f"{self._filename} with {len(self)} frames of size {self.frame_shape} at {self.frame_rate:1.2f} fps"
+
+    def __iter__(self):
+        return self.iter_frames()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        """Release video file."""
+        self._container.close()
+
+    def _reset(self):
+        """Re-initialize object."""
+        self._container.close()
+        self.__init__(self._filename)
+
+    @property
+    def image_array(self) -> np.ndarray:
+        """ entire video decoded into memory """
+        return self[:]
+
+    @property
+    def frame_width(self):
+        return self._width
+
+    @property
+    def frame_height(self):
+        return self._height
+
+    @property
+    def frame_shape(self):
+        return (self._height, self._width)
+
+    @property
+    def color_channels(self):
+        return 1
+
+    @property
+    def color_bit_depth(self):
+        return 8
+
+    @property
+    def frame_rate(self):
+        return self._frame_rate
+
+    @property
+    def pixel_scale(self):
+        return 1.0
+
+    @property
+    def filename(self) -> str:
+        return self._filename
+
+
+def open_video(filename: str) -> IVideoReader:
+    """ opens filename with the most suitable reader, Photron recordings are memory mapped, everything else is decoded on demand """
+    if os.path.splitext(filename)[1] in (".cihx", ".cih", ".mraw"):
+        return VideoReaderMraw(filename)
+    return VideoReaderAV(filename)
@@ -0,0 +1,128 @@
+"""
+benchmark of the evaluation hot path with a regression gate, run with `python test/benchmark_eval.py` from the repo root
+
+`--save-baseline` stores the results of this machine, later runs are compared against it and exit with 1
+if a benchmark got slower or needs more memory than the tolerance allows, or if there is no baseline to compare against.
+"""
+import sys
+sys.path.append("src")
+import warnings
+warnings.filterwarnings('ignore', module='pyMRAW')
+import argparse
+import json
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+import numpy as np
+
+from bounce_evaluator import bounce_eval, _find_contour, _clean_contour, _get_scale, _threshold_crossing
+from data_classes import BounceData, VideoInfoPresets
+from streak_builder import build_streak
+from synthetic_video import SyntheticBounce, write_mraw
+from video_reader import VideoReaderMem
+
+BASELINE_FILE = Path(__file__).with_name("benchmark_baseline.json")
+# frames, height, width
+DEFAULT_SIZES = ["1000x256x128", "4000x256x128", "4000x512x256"]
+# differences below this are timer noise and never count as regression
+MIN_TIME_DELTA = 2e-3 # s
+MIN_MEMORY_DELTA = 1 << 20 # bytes
+
+
+def benchmarks(folder: Path, params: SyntheticBounce) -> dict:
+    """ the benchmarked steps as functions without arguments, each with the number of bytes it processes """
+    cihx = write_mraw(params, str(folder / f"bench_{params.num_frames}x{params.height}x{params.width}"))
+    video = VideoReaderMem(cihx).image_array
+    info = VideoInfoPresets(length=params.num_frames, shape=video.shape[1:], pixel_scale=None, frame_rate=params.frame_rate,
+                            bit_depth=params.bit_depth, accel_thresh=1500.0, filename=cihx, ball_size=params.ball_size, rel_threshold=0.5)
+    streak = build_streak(video)
+    contour_x, contour_y, cvimg = _find_contour(streak, info)
+    crossings = np.array([np.arange(streak.shape[1]), _threshold_crossing(cvimg, info.rel_threshold * cvimg.max())])
+    data, _ = bounce_eval(video, info)
+    json_data = data.to_json()
+    mraw_bytes = Path(cihx).with_suffix(".mraw").stat().st_size
+
+    return {
+        "load": (lambda: VideoReaderMem(cihx).image_array, mraw_bytes),
+        "streak": (lambda: build_streak(video), video.nbytes),
+        "find_contour": (lambda: _find_contour(streak, info), streak.nbytes),
+        "clean_contour": (lambda: _clean_contour(crossings, streak.shape[1]), crossings.nbytes),
+        "get_scale": (lambda: _get_scale(streak, contour_y, contour_x[0], info), streak.nbytes),
+        "bounce_eval": (lambda: bounce_eval(video, info), video.nbytes),
+        "json_roundtrip": (lambda: BounceData.from_json(data.to_json()), len(json_data)),
+    }
+
+
+def measure(fn, repeats: int) -> tuple[float, int]:
+    """ best time of the repeats and the peak memory allocated by one extra traced run, tracing slows down the timed runs otherwise """
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        fn()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return best, peak
+
+
+def run(sizes: list[str], repeats: int) -> dict:
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in sizes:
+            frames, height, width = (int(v) for v in size.split("x"))
+            # keep the ball at the same share of the frame for all sizes
+            params = SyntheticBounce(num_frames=frames, height=height, width=width, ball_size=height / 4 * 1e-4, noise=5)
+            print(f"\n{size} (frames x height x width)")
+            print(f"{'benchmark':>16} {'time [ms]':>10} {'frames/s':>12} {'MB/s':>10} {'peak [MiB]':>11}")
+            for name, (fn, nbytes) in benchmarks(Path(tmp), params).items():
+                elapsed, peak = measure(fn, repeats)
+                results[f"{size}/{name}"] = {"time": elapsed, "peak_bytes": peak, "frames_per_s": frames / elapsed, "mb_per_s": nbytes / elapsed / 1e6}
+                print(f"{name:>16} {elapsed*1000:>10.2f} {frames / elapsed:>12.0f} {nbytes / elapsed / 1e6:>10.1f} {peak / 2**20:>11.1f}")
+    return results
+
+
+def regressions(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    """ benchmarks that are slower or use more memory than the baseline allows, benchmarks missing in the baseline are ignored """
+    found = []
+    for key, result in results.items():
+        if key not in baseline: continue
+        base = baseline[key]
+        if result["time"] > base["time"] * (1 + tolerance) and result["time"] - base["time"] > MIN_TIME_DELTA:
+            found.append(f"{key}: {result['time']*1000:.2f} ms, baseline {base['time']*1000:.2f} ms")
+        if result["peak_bytes"] > base["peak_bytes"] * (1 + tolerance) and result["peak_bytes"] - base["peak_bytes"] > MIN_MEMORY_DELTA:
+            found.append(f"{key}: {result['peak_bytes'] / 2**20:.1f} MiB peak, baseline {base['peak_bytes'] / 2**20:.1f} MiB")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the evaluation steps on synthetic videos and compare them to a baseline")
+    parser.add_argument("--sizes", nargs="+", default=DEFAULT_SIZES, help="videos as FRAMESxHEIGHTxWIDTH")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--baseline", type=Path, default=BASELINE_FILE)
+    parser.add_argument("--save-baseline", action="store_true", help="store the results as new baseline instead of comparing")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative increase of time and peak memory")
+    args = parser.parse_args()
+
+    results = run(args.sizes, args.repeats)
+    if args.save_baseline:
+        args.baseline.write_text(json.dumps(results, indent=2))
+        print(f"\nbaseline saved to {args.baseline}")
+        return 0
+    if not args.baseline.exists():
+        print(f"\nno baseline at {args.baseline}, run with --save-baseline first")
+        return 1
+    found = regressions(results, json.loads(args.baseline.read_text()), args.tolerance)
+    if found:
+        print(f"\nregressions beyond {args.tolerance:.0%}:\n" + "\n".join(found))
+        return 1
+    print(f"\nno regressions beyond {args.tolerance:.0%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,60 @@
+""" benchmark for the parallel streak reduction, run with `python test/benchmark_streak.py` from the repo root """
+import sys
+sys.path.append("src")
+import warnings
+warnings.filterwarnings('ignore', module='pyMRAW')
+import argparse
+import os
+import time
+from pathlib import Path
+import numpy as np
+
+from streak_builder import build_streak
+from video_reader import open_video
+
+BUNDLED_VIDEO = "data/ball_12bit_full.cihx"
+
+
+def time_streak(video, workers, repeats):
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        build_streak(video, workers=workers)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def report(name, video, worker_counts, repeats):
+    n = len(video)
+    print(f"\n{name}: {n} frames of {tuple(np.asarray(video[0]).shape)}")
+    print(f"{'workers':>8} {'time [s]':>10} {'frames/s':>12} {'speedup':>8}")
+    base = None
+    for workers in worker_counts:
+        t = time_streak(video, workers, repeats)
+        base = base or t
+        print(f"{workers:>8} {t:>10.3f} {n / t:>12.0f} {base / t:>8.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark streak reduction scaling over worker threads")
+    parser.add_argument("--frames", type=int, nargs="+", default=[2000, 8000], help="frame counts of the synthetic videos")
+    parser.add_argument("--size", type=int, default=384, help="width and height of the synthetic videos")
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    cpus = os.cpu_count() or 1
+    worker_counts = sorted({1, 2, 4, 8, cpus} & set(range(1, cpus + 1)))
+
+    if Path(BUNDLED_VIDEO).with_suffix(".mraw").exists():
+        report(BUNDLED_VIDEO, open_video(BUNDLED_VIDEO), worker_counts, args.repeats)
+    else:
+        print(f"skipping {BUNDLED_VIDEO}, recording data (.mraw) not available")
+
+    rng = np.random.default_rng(0)
+    for frames in args.frames:
+        video = rng.integers(0, 4096, size=(frames, args.size, args.size), dtype=np.uint16)
+        report("synthetic", video, worker_counts, args.repeats)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+""" benchmark of the 12 bit mraw decoding paths, run with `python test/benchmark_unpack.py` from the repo root """
+import sys
+sys.path.append("src")
+import warnings
+warnings.filterwarnings('ignore', module='pyMRAW')
+import argparse
+import re
+import tempfile
+import time
+from pathlib import Path
+import numpy as np
+import pyMRAW
+
+from pipeline import process_pool
+from streak_builder import build_streak
+from video_reader import VideoReaderMraw
+
+try:
+    import resource
+except ImportError:  # not available on windows
+    resource = None
+
+
+def write_recording(folder: Path, frames: int, height: int, width: int) -> str:
+    """ writes random 12 bit packed data and a matching copy of the bundled cihx """
+    header = Path("data/ball_12bit_full.cihx").read_bytes()
+    header = re.sub(rb"<width>384</width>", b"<width>%d</width>" % width, header)
+    header = re.sub(rb"<height>384</height>", b"<height>%d</height>" % height, header)
+    header = re.sub(rb"<totalFrame>\d+</totalFrame>", b"<totalFrame>%d</totalFrame>" % frames, header)
+    cihx = folder / "bench.cihx"
+    cihx.write_bytes(header)
+    rng = np.random.default_rng(0)
+    frame_bytes = height * width * 3 // 2
+    with open(folder / "bench.mraw", "wb") as f:
+        for _ in range(frames):
+            f.write(rng.integers(0, 256, frame_bytes, dtype=np.uint8).tobytes())
+    return str(cihx)
+
+
+def pymraw_streak(cihx):
+    """ current path: pyMRAW unpacks the whole video, then the streak is reduced """
+    images, _ = pyMRAW.load_video(cihx)
+    return images.min(axis=2).T
+
+
+def fused_streak(cihx):
+    """ chunked path: unpacking is fused with the row minimum """
+    return build_streak(VideoReaderMraw(cihx), workers=1)
+
+
+def parallel_fused_streak(cihx):
+    return build_streak(VideoReaderMraw(cihx))
+
+
+def unpack_only(cihx):
+    """ chunked unpacking into one reused buffer, without reduction """
+    reader = VideoReaderMraw(cihx)
+    buffer = None
+    for start in range(0, len(reader), 256):
+        stop = min(start + 256, len(reader))
+        buffer = reader.read_region(start, stop)
+    return buffer
+
+
+def _run(method, cihx):
+    start = time.perf_counter()
+    method(cihx)
+    elapsed = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 if resource else float("nan")
+    return elapsed, peak
+
+
+def measure(method, cihx):
+    """ runs method in a fresh process, so the peak memory of each method is measured separately """
+    with process_pool(1) as pool:
+        return pool.submit(_run, method, cihx).result()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare 12 bit mraw decoding against the pyMRAW path")
+    parser.add_argument("--frames", type=int, default=1000)
+    parser.add_argument("--height", type=int, default=384)
+    parser.add_argument("--width", type=int, default=384)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cihx = write_recording(Path(tmp), args.frames, args.height, args.width)
+        mbytes = args.frames * args.height * args.width * 1.5 / 1e6
+        print(f"{args.frames} frames of {args.height}x{args.width} @ 12 bit, {mbytes:.0f} MB packed")
+        print(f"{'method':>22} {'time [s]':>10} {'MB/s':>10} {'peak RSS [MiB]':>16}")
+        for method in (pymraw_streak, unpack_only, fused_streak, parallel_fused_streak):
+            elapsed, peak = measure(method, cihx)
+            print(f"{method.__name__:>22} {elapsed:>10.3f} {mbytes / elapsed:>10.0f} {peak:>16.0f}")
+        # the measurements run in their own processes, decoding here for the check does not affect them
+        np.testing.assert_array_equal(fused_streak(cihx), pymraw_streak(cihx))
+
+
+if __name__ == "__main__":
+    main()
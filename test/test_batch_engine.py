@@ -0,0 +1,56 @@
+import sys
+sys.path.append("src")
+import warnings
+warnings.filterwarnings('ignore', module='pyMRAW')
+import subprocess
+import numpy as np
+import pandas as pd
+
+from batch_engine import BATCH_RAM_BUDGET, EvalParams, main, run_batch, video_info
+from bounce_evaluator import bounce_eval
+from data_classes import BounceData
+from video_reader import open_video
+from test_bounce_evaluator import _bounce_video
+from test_video_reader import _write_recording
+
+
+def test_batch_writes_results(tmp_path):
+    video, _ = _bounce_video()
+    good = tmp_path / "a"
+    bad = tmp_path / "b" / "c"
+    good.mkdir()
+    bad.mkdir(parents=True)
+    cihx = _write_recording(good, video, 12)
+    # blank video, no contour can be found
+    _write_recording(bad, np.full_like(video, 4000), 12)
+
+    assert main([str(tmp_path), "*.cihx", "--ball-size", "3", "--no-cache"]) == 1
+
+    reader = open_video(str(cihx))
+    expected, _ = bounce_eval(reader, video_info(reader, cihx, EvalParams(ball_size=3e-3)))
+    assert BounceData.from_json_file(good / "rec.json") == expected
+    table = pd.read_csv(good / "rec_eval.csv", sep="\t")
+    assert table["COR"][0] == expected.cor
+    assert (good / "rec_streak.png").exists()
+    assert not (bad / "rec.json").exists()
+
+
+def test_batch_engine_does_not_import_qt():
+    code = "import sys; sys.path.append('src'); import batch_engine; assert not any(m.startswith(('PySide6', 'pyqtgraph')) for m in sys.modules)"
+    subprocess.run([sys.executable, "-c", code], check=True)
+
+
+def test_parallel_batch_matches_serial(tmp_path):
+    video, _ = _bounce_video()
+    for i, shift in enumerate([0, 20, 40]):
+        folder = tmp_path / str(i)
+        folder.mkdir()
+        _write_recording(folder, np.roll(video, shift, axis=0), 12)
+    files = sorted(tmp_path.rglob("*.cihx"))
+    params = EvalParams(ball_size=3e-3)
+
+    serial = {r.filename: r.data for r in run_batch(files, params)}
+    # a budget below the footprint of a single file still runs every file, one at a time
+    for budget in (BATCH_RAM_BUDGET, 1):
+        parallel = {r.filename: r.data for r in run_batch(files, params, workers=2, ram_budget=budget)}
+        assert parallel == serial
@@ -0,0 +1,60 @@
+import sys
+sys.path.append("src")
+import warnings
+warnings.filterwarnings('ignore', module='pyMRAW')
+import os
+import numpy as np
+
+from batch_engine import EvalParams, run_batch
+from batch_ledger import LEDGER_NAME, BatchLedger
+from fingerprint import recording_stat
+from test_bounce_evaluator import _bounce_video
+from test_video_reader import _write_recording
+
+
+def _evaluated(tmp_path, params):
+    ledger = BatchLedger(tmp_path)
+    return sorted(os.path.basename(os.path.dirname(r.filename)) for r in run_batch(sorted(tmp_path.rglob("*.cihx")), params, ledger=ledger))
+
+
+def test_rerun_skips_current_files(tmp_path):
+    video, _ = _bounce_video()
+    for name in "ab":
+        (tmp_path / name).mkdir()
+        _write_recording(tmp_path / name, video, 12)
+    (tmp_path / "c").mkdir()
+    _write_recording(tmp_path / "c", np.full_like(video, 4000), 12)
+    params = EvalParams(ball_size=3e-3)
+
+    assert _evaluated(tmp_path, params) == ["a", "b", "c"]
+    # only the failed file is retried
+    assert _evaluated(tmp_path, params) == ["c"]
+    assert BatchLedger(tmp_path).failed == [str((tmp_path / "c" / "rec.cihx").resolve())]
+    # a touched file with the same content is fingerprinted once and remembered as current
+    mraw = tmp_path / "b" / "rec.mraw"
+    os.utime(mraw, ns=(mraw.stat().st_atime_ns, mraw.stat().st_mtime_ns + 10**9))
+    assert _evaluated(tmp_path, params) == ["c"]
+    assert BatchLedger(tmp_path).entries[os.path.join("b", "rec.cihx")].stat == recording_stat(tmp_path / "b" / "rec.cihx")
+
+    # changed video and deleted results are evaluated again
+    _write_recording(tmp_path / "a", np.roll(video, 10, axis=0), 12)
+    (tmp_path / "b" / "rec.json").unlink()
+    assert _evaluated(tmp_path, params) == ["a", "b", "c"]
+    # changed parameters invalidate all results
+    assert _evaluated(tmp_path, EvalParams(ball_size=3e-3, accel_thresh=1000.0)) == ["a", "b", "c"]
+
+
+def test_ledger_survives_cut_off_line(tmp_path):
+    (tmp_path / "x.cihx").touch()
+    ledger = BatchLedger(tmp_path)
+    ledger.record(tmp_path / "x.cihx", "f", EvalParams(), 1.0)
+    with open(tmp_path / LEDGER_NAME, "a") as f:
+        f.write('{"filename": "y.cih')
+
+    ledger = BatchLedger(tmp_path)
+    assert list(ledger.entries) == ["x.cihx"]
+    ledger.record(tmp_path / "z.cihx", "f", EvalParams(), 1.0, error="failed")
+    ledger = BatchLedger(tmp_path)
+    assert list(ledger.entries) == ["x.cihx", "z.cihx"]
+    ledger.compact()
+    assert len((tmp_path / LEDGER_NAME).read_text().splitlines()) == 2
@@ -2,9 +2,12 @@ import sys
 sys.path.append("src")
 import warnings
 warnings.filterwarnings('ignore', module='pyMRAW')
+import dataclasses
+import threading
+import numpy as np
 import pytest
 
-from bounce_evaluator import bounce_eval
+from bounce_evaluator import BounceEvaluator, EvaluationCancelled, bounce_eval
 from data_classes import BounceData, VideoInfoPresets
 from video_reader import VideoReaderMem
 
@@ -25,4 +28,69 @@ def test_default_bounce():
     data, streak = bounce_eval(reader.image_array, info)
     compare_data = BounceData.from_json_file("data/ball_12bit_full.json")
 
-    assert data == compare_data
\ No newline at end of file
+    assert data == compare_data
+
+
+def _bounce_video(num_frames=600, height=128, width=64, radius=15, frame_rate=30000, pixel_scale=1e-4):
+    """ dark ball falling at 1 m/s onto a surface and leaving it with 0.6 m/s """
+    t = np.arange(num_frames) / frame_rate
+    t_impact, t_contact, surface = num_frames / 2 / frame_rate, 5e-4, 90.0
+    top = np.where(t < t_impact, surface - (t_impact - t) / pixel_scale, surface)
+    contact = (t >= t_impact) & (t < t_impact + t_contact)
+    top = np.where(contact, surface + 3.0 * np.sin(np.pi * (t - t_impact) / t_contact), top)
+    top = np.where(t >= t_impact + t_contact, surface - (t - t_impact - t_contact) * 0.6 / pixel_scale, top)
+    yy, xx = np.mgrid[0:height, 0:width]
+    video = np.empty((num_frames, height, width), np.uint16)
+    for i in range(num_frames):
+        coverage = np.clip(radius - np.hypot(yy - top[i] - radius, xx - width / 2) + 0.5, 0, 1)
+        video[i] = (4000 - 3800 * coverage).astype(np.uint16)
+    info = VideoInfoPresets(length=num_frames, shape=(height, width), pixel_scale=None, frame_rate=frame_rate, bit_depth=12,
+                            accel_thresh=1500.0, filename="synthetic", ball_size=3e-3, rel_threshold=0.5)
+    return video, info
+
+
+def test_incremental_evaluation():
+    video, info = _bounce_video()
+    evaluator = BounceEvaluator(video)
+    data, streak = evaluator.evaluate(info)
+    assert evaluator.recomputed == ["streak", "contour", "scale", "kinematics", "impact", "fits"]
+    assert set(evaluator.timings) == set(evaluator.recomputed)
+    assert data == bounce_eval(video, info)[0]
+    assert 0.5 < data.cor < 0.7
+
+    evaluator.evaluate(info)
+    assert evaluator.recomputed == []
+
+    info = dataclasses.replace(info, accel_thresh=1000.0)
+    data, _ = evaluator.evaluate(info)
+    assert evaluator.recomputed == ["impact", "fits"]
+    assert data == bounce_eval(video, info)[0]
+
+    info = dataclasses.replace(info, rel_threshold=0.4)
+    data, _ = evaluator.evaluate(info)
+    assert evaluator.recomputed == ["contour", "scale", "kinematics", "impact", "fits"]
+    assert data == bounce_eval(video, info)[0]
+
+
+def test_cancel_between_stages():
+    video, info = _bounce_video()
+    evaluator = BounceEvaluator(video)
+    cancel = threading.Event()
+    stages = []
+    def on_stage(name):
+        stages.append(name)
+        if name == "kinematics": cancel.set()
+    with pytest.raises(EvaluationCancelled):
+        evaluator.evaluate(info, cancel_event=cancel, stage_callback=on_stage)
+    assert stages == ["streak", "contour", "scale", "kinematics"]
+
+    # cancelled while building the streak, no stage output is kept
+    cancel = threading.Event()
+    with pytest.raises(EvaluationCancelled):
+        BounceEvaluator(video).evaluate(info, progress_callback=lambda frac: cancel.set(), cancel_event=cancel)
+
+    # the stages finished before the checkpoint are reused
+    stages.clear()
+    data, _ = evaluator.evaluate(info, stage_callback=stages.append)
+    assert stages == evaluator.recomputed == ["impact", "fits"]
+    assert data == bounce_eval(video, info)[0]
@@ -0,0 +1,45 @@
+import sys
+sys.path.append("src")
+import json
+import numpy as np
+
+from data_classes import BounceData, SERIES_FIELDS
+
+
+def _bounce_data(n=20, **series):
+    rng = np.random.default_rng(0)
+    series = {name: rng.normal(size=n) for name in SERIES_FIELDS} | {"contour_x": np.arange(5, 5 + n)} | series
+    return BounceData(video_framerate=30000.0, video_resolution="128x64", video_num_frames=600, video_pixel_scale=1e-4, video_name="ball.cihx",
+                      acceleration_thresh=1500.0, impact_idx=7, cor=0.6, **series)
+
+
+def test_series_are_arrays_without_copy():
+    time = np.linspace(0, 1, 20)
+    data = _bounce_data(time=time)
+    assert data.time is time
+    assert data.contour_x.dtype == np.int32
+    assert not hasattr(data, "__dict__")
+
+    table = data.series_table()
+    assert len(table) == 20 and table["cor"].eq(0.6).all()
+    assert list(table.columns) == list(BounceData.__dataclass_fields__)
+    assert np.shares_memory(table["velocity"].to_numpy(), data.velocity)
+
+
+def test_json_roundtrip_and_equality(tmp_path):
+    data = _bounce_data()
+    data.to_json_file(tmp_path / "data.json")
+    raw = json.loads((tmp_path / "data.json").read_text())
+    assert raw["contourX"][:2] == [5, 6] and len(raw["positionSmooth"]) == 20
+
+    loaded = BounceData.from_json_file(tmp_path / "data.json")
+    assert loaded == data
+    np.testing.assert_array_equal(loaded.velocity, data.velocity)
+
+    # older files stored the frame indices as strings
+    raw["contourX"] = [str(x) for x in raw["contourX"]]
+    raw["videoName"] = "other.cihx"
+    assert BounceData.from_dict(raw) == data
+
+    loaded.velocity[3] += 1
+    assert loaded != data
@@ -0,0 +1,39 @@
+import sys
+sys.path.append("src")
+import numpy as np
+
+from frame_cache import FrameCache, to_8bit
+
+
+def _video():
+    return np.random.default_rng(2).integers(0, 4096, size=(50, 8, 8), dtype=np.uint16)
+
+
+def test_cache_hits_and_conversion():
+    video = _video()
+    cache = FrameCache(video, read_ahead=0)
+    first = cache[10]
+    assert first.dtype == np.uint8
+    np.testing.assert_array_equal(first, to_8bit(video[10]))
+    assert cache[10] is first
+    assert (cache.hits, cache.misses) == (1, 1)
+    cache.close()
+
+
+def test_cache_respects_memory_budget():
+    cache = FrameCache(_video(), max_bytes=5 * 64, read_ahead=0)
+    for i in range(20):
+        cache[i]
+    assert len(cache) == 5
+    assert cache.nbytes <= 5 * 64
+    assert 19 in cache and 0 not in cache
+    cache.close()
+
+
+def test_read_ahead_follows_direction():
+    cache = FrameCache(_video(), read_ahead=4)
+    cache[30]
+    cache[29]
+    cache._prefetcher.submit(lambda: None).result()
+    assert all(i in cache for i in range(25, 29))
+    cache.close()
@@ -0,0 +1,50 @@
+import sys
+sys.path.append("src")
+import warnings
+warnings.filterwarnings('ignore', module='pyMRAW')
+import json
+import dataclasses
+import tracemalloc
+
+import instrumentation
+from batch_engine import EvalParams, run_batch
+from bounce_evaluator import BounceEvaluator
+from instrumentation import StageProfiler, aggregate_profiles
+from test_bounce_evaluator import _bounce_video
+from test_video_reader import _write_recording
+
+
+def test_profile_stages():
+    video, info = _bounce_video()
+    profiler = StageProfiler()
+    evaluator = BounceEvaluator(video, profiler=profiler)
+    evaluator.evaluate(info)
+    assert [p.stage for p in profiler.profiles] == evaluator.recomputed
+    streak = profiler.profiles[0]
+    # the streak image of 600 frames with 128 rows of uint16 is allocated in this stage
+    assert streak.peak_bytes >= 600 * 128 * 2
+    assert all(p.wall > 0 and p.cpu >= 0 for p in profiler.profiles)
+    assert not tracemalloc.is_tracing()
+    # a reevaluation after a reset only profiles the stages it recomputed
+    profiler.reset()
+    evaluator.evaluate(dataclasses.replace(info, accel_thresh=info.accel_thresh + 100))
+    assert [p.stage for p in profiler.profiles] == evaluator.recomputed == ["impact", "fits"]
+
+
+def test_aggregate_profiles():
+    profiles = [[{"stage": "a", "wall": float(i), "cpu": 0.0, "peak_bytes": 10 * i}, {"stage": "b", "wall": 1.0, "cpu": 1.0, "peak_bytes": 0}] for i in range(101)]
+    table = aggregate_profiles(profiles)
+    assert list(table.index) == ["a", "b"]
+    assert table.loc["a", "wall_p50"] == 50.0
+    assert table.loc["a", "wall_p90"] == 90.0
+    assert table.loc["a", "peak_bytes_max"] == 1000
+    assert table.loc["b", "count"] == 101
+
+
+def test_batch_profile_sidecar(tmp_path, monkeypatch):
+    monkeypatch.setattr(instrumentation, "PROFILE_STAGES", True)
+    video, _ = _bounce_video()
+    cihx = _write_recording(tmp_path, video, 12)
+    result, = run_batch([cihx], EvalParams(ball_size=3e-3))
+    assert [p["stage"] for p in result.profile] == ["streak", "contour", "scale", "kinematics", "impact", "fits"]
+    assert json.loads((tmp_path / "rec_profile.json").read_text()) == result.profile
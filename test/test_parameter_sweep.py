@@ -0,0 +1,29 @@
+import sys
+sys.path.append("src")
+import dataclasses
+
+from bounce_evaluator import bounce_eval
+from parameter_sweep import sweep
+from test_bounce_evaluator import _bounce_video
+
+
+def test_sweep_matches_single_evaluations():
+    video, info = _bounce_video()
+    table = sweep(video, info, rel_thresholds=[0.4, 0.5, 0.6], accel_threshs=[1000.0, 1500.0], savgol_windows=[None, 15])
+    assert len(table) == 12
+    assert table["error"].isna().all()
+    for row in table.itertuples():
+        data, _ = bounce_eval(video, dataclasses.replace(info, rel_threshold=row.rel_threshold, accel_thresh=row.accel_thresh, savgol_window=row.savgol_window))
+        assert row.cor == data.cor
+        assert row.max_deformation == data.max_deformation
+        assert row.pixel_scale == data.video_pixel_scale
+
+
+def test_parallel_sweep():
+    video, info = _bounce_video()
+    grids = dict(rel_thresholds=[0.4, 0.5, 0.6], accel_threshs=[1000.0, 1500.0])
+    progress = []
+    serial = sweep(video, info, **grids)
+    parallel = sweep(video, info, workers=2, progress_callback=progress.append, **grids)
+    assert serial.equals(parallel)
+    assert progress[-1] == 1.0
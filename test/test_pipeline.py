@@ -0,0 +1,52 @@
+import sys
+sys.path.append("src")
+import time
+import pytest
+
+from pipeline import Pipeline
+
+
+def _slow(fn, seconds=0.05):
+    def stage(x):
+        time.sleep(seconds)
+        return fn(x)
+    return stage
+
+
+def test_stages_overlap():
+    pipeline = Pipeline([("a", _slow(lambda x: x + 1)), ("b", _slow(lambda x: x * 2)), ("c", _slow(str))])
+    start = time.perf_counter()
+    items = list(pipeline.run(range(8)))
+    elapsed = time.perf_counter() - start
+    assert [item.value for item in items] == [str((i + 1) * 2) for i in range(8)]
+    assert [item.key for item in items] == list(range(8))
+    # 8 items of 3 stages take 24 steps one after another, overlapping needs 8 + 2
+    assert elapsed < 16 * 0.05
+    assert all(stats.items == 8 for stats in pipeline.stats)
+    assert all(0 < stats.utilization <= 1 for stats in pipeline.stats)
+
+
+def test_failed_items_skip_later_stages():
+    calls = []
+    def save(x):
+        calls.append(x)
+        return x
+    pipeline = Pipeline([("invert", lambda x: 1 / x), ("save", save)])
+    items = list(pipeline.run([1, 0, 2]))
+    assert [item.error is None for item in items] == [True, False, True]
+    assert "ZeroDivisionError" in items[1].error
+    assert calls == [1.0, 0.5]
+    assert pipeline.stats[1].items == 2
+
+
+def test_error_of_items_is_raised():
+    def items():
+        yield 1
+        yield 2
+        raise OSError("read error")
+    pipeline = Pipeline([("double", lambda x: x * 2)])
+    done = []
+    with pytest.raises(OSError, match="read error"):
+        for item in pipeline.run(items()):
+            done.append(item.value)
+    assert done == [2, 4]
@@ -0,0 +1,50 @@
+import sys
+sys.path.append("src")
+
+from playback import PlaybackScheduler
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_scheduler_holds_display_rate():
+    clock = FakeClock()
+    sched = PlaybackScheduler(30000, 1000, display_fps=30, speed=1/1000, clock=clock)
+    sched.start(10)
+    frames = []
+    for _ in range(30):
+        frames.append(sched.next_frame())
+        clock.now += 1/30
+    assert frames == list(range(10, 40))
+    assert sched.skipped_frames == 0 and sched.dropped_frames == 0
+    assert abs(sched.achieved_fps - 30) < 1e-6
+    assert sched.upcoming_frame() == 41
+
+
+def test_scheduler_skips_when_behind():
+    clock = FakeClock()
+    sched = PlaybackScheduler(30000, 100, display_fps=30, speed=1/1000, clock=clock, loop=True)
+    sched.start(0)
+    sched.next_frame()
+    clock.now += 5/30
+    assert sched.next_frame() == 5
+    assert sched.skipped_frames == 4
+    assert sched.dropped_frames == 4
+    clock.now += 100/30
+    assert sched.next_frame() == 5
+
+
+def test_scheduler_stops_at_last_frame():
+    clock = FakeClock()
+    sched = PlaybackScheduler(30000, 100, display_fps=30, speed=1/1000, clock=clock)
+    sched.start(90)
+    clock.now += 8/30
+    assert sched.next_frame() == 98 and not sched.at_end
+    clock.now += 5/30
+    assert sched.next_frame() == 99 and sched.at_end
+    assert sched.upcoming_frame() == 99
@@ -0,0 +1,72 @@
+import sys
+sys.path.append("src")
+import warnings
+warnings.filterwarnings('ignore', module='pyMRAW')
+import shutil
+import dataclasses
+import numpy as np
+
+import result_cache
+from batch_engine import EvalParams, run_batch
+from bounce_evaluator import bounce_eval
+from result_cache import ResultCache, params_hash
+from video_reader import open_video
+from test_bounce_evaluator import _bounce_video
+from test_streak_cache import _info
+from test_video_reader import _write_recording
+
+
+def test_result_cache_keys_and_copies(tmp_path, monkeypatch):
+    video, _ = _bounce_video()
+    (tmp_path / "a").mkdir()
+    cihx = _write_recording(tmp_path / "a", video, 12)
+    info = _info(cihx, roi_cols=(10, 50))
+    info = dataclasses.replace(info, length=len(video), shape=video.shape[1:], ball_size=3e-3)
+    data, streak = bounce_eval(open_video(str(cihx)), info)
+    cache = ResultCache(tmp_path / "cache")
+
+    assert cache.load(str(cihx), info) is None
+    cache.store(str(cihx), info, data, streak)
+    cached, cached_streak = cache.load(str(cihx), info)
+    assert cached == data
+    np.testing.assert_array_equal(cached_streak, streak)
+
+    # a copy has the same content, the result gets the name of the copy
+    shutil.copytree(tmp_path / "a", tmp_path / "b")
+    copy = tmp_path / "b" / "rec.cihx"
+    cached, _ = cache.load(str(copy), dataclasses.replace(info, filename=str(copy)))
+    assert cached == data and cached.video_name == str(copy)
+
+    # parameters are hashed canonically, other parameters or evaluator versions are other entries
+    assert params_hash(dataclasses.replace(info, shape=list(info.shape), roi_cols=[10, 50])) == params_hash(info)
+    assert cache.load(str(cihx), dataclasses.replace(info, accel_thresh=2000.0)) is None
+    monkeypatch.setattr(result_cache, "EVALUATOR_VERSION", "changed")
+    assert cache.load(str(cihx), info) is None
+    monkeypatch.undo()
+
+    # unreadable entries count as missing and are removed
+    cache.path(cache.key(str(cihx), info)).write_bytes(b"broken")
+    assert cache.load(str(cihx), info) is None
+    assert not cache.path(cache.key(str(cihx), info)).exists()
+
+
+def test_batch_uses_cached_results(tmp_path, monkeypatch):
+    video, _ = _bounce_video()
+    for i, shift in enumerate([0, 30]):
+        (tmp_path / str(i)).mkdir()
+        _write_recording(tmp_path / str(i), np.roll(video, shift, axis=0), 12)
+    files = sorted(tmp_path.rglob("*.cihx"))
+    params = EvalParams(ball_size=3e-3)
+    cache = ResultCache(tmp_path / "cache")
+
+    first = {r.filename: r.data for r in run_batch(files, params, result_cache=cache)}
+    assert cache.misses == 2
+
+    def fail(*args, **kwargs):
+        raise AssertionError("evaluated again")
+    monkeypatch.setattr("batch_engine.BounceEvaluator.streak", fail)
+    for f in files:
+        f.with_suffix(".json").unlink()
+    second = {r.filename: r.data for r in run_batch(files, params, result_cache=cache)}
+    assert second == first and cache.hits == 2
+    assert all(f.with_suffix(".json").exists() for f in files)
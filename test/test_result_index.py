@@ -0,0 +1,55 @@
+import sys
+sys.path.append("src")
+import os
+import time
+import dataclasses
+import pandas as pd
+
+from fingerprint import video_fingerprint
+from result_index import INDEX_NAME, ResultIndex, main, parse_filter
+from result_io import save_result
+from test_data_classes import _bounce_data
+
+
+def _save(folder, name, **scalars):
+    folder.mkdir(parents=True, exist_ok=True)
+    data = dataclasses.replace(_bounce_data(), video_name=str(folder / (name + ".cihx")), **scalars)
+    return save_result(folder / (name + ".json"), data, None, 0.5)["csv"]
+
+
+def test_incremental_update_and_query(tmp_path):
+    _save(tmp_path / "a", "ball_1", cor=0.4)
+    # only ball_1 still has its recording
+    (tmp_path / "a" / "ball_1.cihx").write_bytes(b"header")
+    (tmp_path / "a" / "ball_1.mraw").write_bytes(bytes(1000))
+    changed = _save(tmp_path / "a", "ball_2", cor=0.7)
+    removed = _save(tmp_path / "b" / "c", "ball_3", cor=0.3, video_framerate=10000.0)
+    _save(tmp_path / "b", "cube", cor=0.45)
+
+    with ResultIndex(tmp_path / INDEX_NAME) as index:
+        assert index.update(tmp_path) == (4, 0, 0)
+        assert index.update(tmp_path) == (0, 0, 0)
+
+        low = index.query([parse_filter("cor<0.5"), parse_filter("video_framerate = 30000")])
+        assert sorted(low["name"]) == ["ball_1", "cube"]
+        assert low["img_rel_threshold"].eq(0.5).all()
+        fingerprints = low.set_index("name")["video_fingerprint"]
+        assert fingerprints["ball_1"] == video_fingerprint(tmp_path / "a" / "ball_1.cihx", with_mtime=False) and pd.isna(fingerprints["cube"])
+        assert sorted(index.query(folder=tmp_path / "b")["name"]) == ["ball_3", "cube"]
+        assert sorted(index.query(name="ball_*")["name"]) == ["ball_1", "ball_2", "ball_3"]
+        assert len(index.query(since=time.time() + 60)) == 0
+
+        _save(tmp_path / "a", "ball_2", cor=0.2)
+        os.utime(changed, ns=(0, time.time_ns() + 10**9))
+        os.remove(removed)
+        assert index.update(tmp_path) == (0, 1, 1)
+        assert len(index) == 3
+        assert sorted(index.query([("cor", "<", 0.5)])["name"]) == ["ball_1", "ball_2", "cube"]
+
+
+def test_cli_writes_matches(tmp_path):
+    _save(tmp_path / "a", "ball_1", cor=0.4)
+    _save(tmp_path / "a", "ball_2", cor=0.7)
+    out = tmp_path / "matches.csv"
+    assert main([str(tmp_path), "-f", "cor>=0.5", "-o", str(out)]) == 0
+    assert list(pd.read_csv(out, sep="\t")["name"]) == ["ball_2"]
@@ -0,0 +1,37 @@
+import sys
+sys.path.append("src")
+import json
+import numpy as np
+import pytest
+
+from result_io import RESULT_FORMAT_VERSION, ResultFile, load_result, save_npz, save_result
+from test_data_classes import _bounce_data
+
+
+def test_save_result_writes_npz_matching_json(tmp_path):
+    data = _bounce_data()
+    streak = np.zeros((16, 20), dtype=np.uint8)
+    paths = save_result(tmp_path / "ball.json", data, streak, 0.4)
+    assert {p.name for p in tmp_path.iterdir()} == {"ball.json", "ball.npz", "ball_eval.csv", "ball_streak.png"}
+    assert paths["npz"] == tmp_path / "ball.npz"
+
+    assert load_result(paths["npz"]) == load_result(paths["json"]) == data
+    assert load_result(paths["npz"]).video_name == data.video_name
+
+
+def test_result_file_reads_header_without_series(tmp_path):
+    data = _bounce_data()
+    save_npz(tmp_path / "ball.npz", data, rel_threshold=0.4)
+    with ResultFile(tmp_path / "ball.npz") as result:
+        assert result.header["cor"] == 0.6
+        assert result.header["impact_idx"] == 7
+        assert result.header["img_rel_threshold"] == 0.4
+        np.testing.assert_array_equal(result.series("velocity"), data.velocity)
+        assert result.bounce_data() == data
+
+
+def test_result_file_rejects_newer_format(tmp_path):
+    header = json.dumps({"format_version": RESULT_FORMAT_VERSION + 1}).encode()
+    np.savez(tmp_path / "new.npz", header=np.frombuffer(header, dtype=np.uint8))
+    with pytest.raises(ValueError):
+        ResultFile(tmp_path / "new.npz")
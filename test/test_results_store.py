@@ -0,0 +1,63 @@
+import sys
+sys.path.append("src")
+import dataclasses
+import numpy as np
+
+from bounce_evaluator import bounce_eval
+from data_classes import SERIES_FIELDS
+from results_store import ResultsStore
+from test_bounce_evaluator import _bounce_video
+
+
+def test_store_roundtrip(tmp_path):
+    video, info = _bounce_video()
+    results = {}
+    for folder in ("a", "a/b", "c"):
+        for thresh in (1000.0, 1500.0):
+            data, _ = bounce_eval(video, dataclasses.replace(info, filename=f"/data/{folder}/ball_{int(thresh)}.cihx", accel_thresh=thresh))
+            results[(folder, thresh)] = data
+
+    store = ResultsStore(tmp_path, chunk_size=4)
+    for (folder, thresh), data in results.items():
+        store.append(data, params_hash=str(thresh), rel_threshold=0.5)
+    # the first 4 results are flushed automatically
+    assert len(list(store.path.glob("*.npz"))) == 1
+    assert len(store) == 6
+    store.flush()
+    store = ResultsStore(tmp_path)
+    assert len(store) == 6
+
+    table = store.query(folder="/data/a")
+    assert sorted(table["name"]) == ["ball_1000", "ball_1000", "ball_1500", "ball_1500"]
+    assert len(store.query(name="*_1500")) == 3
+    row = store.query(folder="/data/c", params_hash="1000.0").iloc[0]
+    expected = results[("c", 1000.0)]
+    assert row["cor"] == expected.cor
+    assert row["video_roi"] == ""
+    series = store.load_series(row)
+    np.testing.assert_array_equal(series["acceleration_smooth"], expected.acceleration_smooth)
+    np.testing.assert_array_equal(series["contour_x"], expected.contour_x)
+
+    # a second evaluation of the same video replaces the first one in queries
+    store.append(dataclasses.replace(expected, cor=0.1), params_hash="1000.0")
+    store.flush()
+    assert store.query(folder="/data/c", params_hash="1000.0")["cor"].tolist() == [0.1]
+    assert len(store.query(latest=False)) == 7
+
+
+def test_series_of_every_result_in_a_chunk(tmp_path):
+    video, info = _bounce_video()
+    store = ResultsStore(tmp_path, chunk_size=3)
+    expected = {}
+    for i, thresh in enumerate((1000.0, 1500.0, 2000.0)):
+        data, _ = bounce_eval(video, dataclasses.replace(info, filename=f"/data/ball_{i}.cihx", accel_thresh=thresh))
+        store.append(data)
+        expected[data.video_name] = data
+    assert len(list(store.path.glob("*.npz"))) == 1
+
+    for _, row in store.query().iterrows():
+        data = expected[f"/data/{row['name']}.cihx"]
+        series = store.load_series(row)
+        assert set(series) == set(SERIES_FIELDS)
+        for name in SERIES_FIELDS:
+            np.testing.assert_array_equal(series[name], getattr(data, name))
@@ -0,0 +1,21 @@
+import sys
+sys.path.append("src")
+import numpy as np
+import pytest
+
+from streak_builder import build_streak
+
+
+@pytest.mark.parametrize("workers", [1, 4])
+@pytest.mark.parametrize("chunk_size", [1, 7, 64, 1000])
+def test_streak_matches_full_reduction(chunk_size, workers):
+    rng = np.random.default_rng(1)
+    video = rng.integers(0, 4096, size=(100, 12, 20), dtype=np.uint16)
+    progress = []
+
+    streak = build_streak(video, chunk_size=chunk_size, progress_callback=progress.append, workers=workers)
+
+    np.testing.assert_array_equal(streak, video.min(axis=2).T)
+    assert streak.dtype == video.dtype
+    assert progress[-1] == 1.0
+    assert progress == sorted(progress)
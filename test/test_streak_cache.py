@@ -0,0 +1,70 @@
+import sys
+sys.path.append("src")
+import warnings
+warnings.filterwarnings('ignore', module='pyMRAW')
+import os
+import dataclasses
+import numpy as np
+
+from data_classes import VideoInfoPresets
+from streak_cache import StreakCache
+from test_video_reader import _write_recording
+
+
+def _info(cihx, **kwargs):
+    return VideoInfoPresets(length=12, shape=(8, 16), pixel_scale=None, frame_rate=30000.0, bit_depth=12,
+                            accel_thresh=1500.0, filename=str(cihx), ball_size=2.5e-3, rel_threshold=0.5, **kwargs)
+
+
+def test_streak_cache_roundtrip_and_keys(tmp_path):
+    cihx = _write_recording(tmp_path, np.zeros((12, 8, 16), dtype=np.uint16), 12)
+    cache = StreakCache(tmp_path / "cache", max_bytes=2**20)
+    info = _info(cihx)
+    streak = np.arange(8 * 12, dtype=np.uint16).reshape(8, 12)
+
+    assert cache.load(str(cihx), info) is None
+    cache.store(str(cihx), info, streak)
+    np.testing.assert_array_equal(cache.load(str(cihx), info), streak)
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    # other region of interest or changed content are different entries
+    assert cache.load(str(cihx), dataclasses.replace(info, roi_cols=(2, 10))) is None
+    with open(tmp_path / "rec.mraw", "r+b") as f:
+        f.write(b"\1")
+    assert cache.load(str(cihx), info) is None
+
+
+def test_streak_cache_evicts_least_recently_used(tmp_path):
+    cache = StreakCache(tmp_path / "cache", max_bytes=3000)
+    infos = []
+    for i in range(4):
+        folder = tmp_path / str(i)
+        folder.mkdir()
+        cihx = _write_recording(folder, np.full((12, 8, 16), i), 16)
+        infos.append((str(cihx), _info(cihx)))
+        cache.store(*infos[-1], np.zeros((100, 10), dtype=np.uint8))
+        os.utime(cache.path(cache.key(*infos[-1])), (i, i))
+    cache.store(*infos[0], np.zeros((100, 10), dtype=np.uint8))
+    assert cache.nbytes <= 3000
+    assert cache.load(*infos[0]) is not None
+    assert cache.load(*infos[1]) is None
+
+
+def test_streak_cache_tolerates_broken_and_vanished_entries(tmp_path, monkeypatch):
+    cihx = _write_recording(tmp_path, np.zeros((12, 8, 16), dtype=np.uint16), 12)
+    cache = StreakCache(tmp_path / "cache", max_bytes=2**20)
+    info = _info(cihx)
+    cache.store(str(cihx), info, np.zeros((8, 12), dtype=np.uint16))
+
+    # truncated entry
+    path = cache.path(cache.key(str(cihx), info))
+    path.write_bytes(path.read_bytes()[:40])
+    assert cache.load(str(cihx), info) is None
+    assert not path.exists()
+
+    # entries removed by another process between listing and stat
+    cache.store(str(cihx), info, np.zeros((8, 12), dtype=np.uint16))
+    listed = list(cache.cache_dir.glob("*.npy")) + [cache.cache_dir / "gone.npy"]
+    monkeypatch.setattr(type(cache.cache_dir), "glob", lambda self, pattern: iter(listed))
+    cache.evict()
+    assert cache.nbytes == path.stat().st_size
@@ -0,0 +1,65 @@
+import sys
+sys.path.append("src")
+import warnings
+warnings.filterwarnings('ignore', module='pyMRAW')
+import numpy as np
+import pytest
+
+from bounce_evaluator import bounce_eval
+from data_classes import VideoInfoPresets
+from streak_builder import build_streak
+from synthetic_video import SyntheticBounce, SyntheticVideoReader, render, write_mp4, write_mraw
+from video_reader import open_video, pack_uint12, unpack_uint12
+
+
+def _evaluate(video, params: SyntheticBounce, pixel_scale=None):
+    info = VideoInfoPresets(length=len(video), shape=video.shape[1:], pixel_scale=pixel_scale, frame_rate=params.frame_rate,
+                            bit_depth=params.bit_depth, accel_thresh=1500.0, filename="synthetic", ball_size=params.ball_size, rel_threshold=0.5)
+    return bounce_eval(video, info)[0]
+
+
+def test_reader_renders_lazily():
+    params = SyntheticBounce(num_frames=50, noise=10)
+    video, truth = render(params)
+    reader = SyntheticVideoReader(params)
+    assert len(reader) == 50 and reader.frame_shape == (128, 64)
+    assert len(truth.time) == len(truth.position) == 50
+    np.testing.assert_array_equal(reader[7], video[7])
+    np.testing.assert_array_equal(reader[-1], video[-1])
+    np.testing.assert_array_equal(reader[10:30:4], video[10:30:4])
+    np.testing.assert_array_equal(reader[[3, 1, 40]], video[[3, 1, 40]])
+    np.testing.assert_array_equal(build_streak(reader, chunk_size=16), video.min(axis=2).T)
+
+
+def test_pack_uint12_roundtrip():
+    pixels = np.random.default_rng(1).integers(0, 4096, size=(3, 4, 10)).astype(np.uint16)
+    np.testing.assert_array_equal(unpack_uint12(pack_uint12(pixels)).reshape(pixels.shape), pixels)
+
+
+@pytest.mark.parametrize("bit", [8, 12, 16])
+def test_write_mraw_roundtrip(tmp_path, bit):
+    params = SyntheticBounce(num_frames=40, height=32, width=16, ball_size=1.5e-3, bit_depth=bit, noise=3)
+    cihx = write_mraw(params, str(tmp_path / "synthetic"), chunk_size=16)
+    reader = open_video(cihx)
+    assert len(reader) == 40 and reader.frame_shape == (32, 16)
+    assert reader.color_bit_depth == bit and reader.frame_rate == params.frame_rate
+    np.testing.assert_array_equal(reader[:], render(params)[0])
+
+
+def test_write_mp4_readable(tmp_path):
+    params = SyntheticBounce(num_frames=30, height=32, width=16, ball_size=1.5e-3, bit_depth=8)
+    reader = open_video(write_mp4(params, str(tmp_path / "synthetic.mp4")))
+    assert len(reader) == 30 and reader.frame_shape == (32, 16)
+    assert np.abs(reader[:].astype(int) - render(params)[0]).mean() < 5
+
+
+@pytest.mark.parametrize("kwargs", [{}, dict(deformation_profile="triangle"), dict(cor=0.8, speed_in=0.5), dict(noise=20)])
+def test_evaluation_recovers_ground_truth(kwargs):
+    params = SyntheticBounce(**kwargs)
+    video, truth = render(params)
+    # the scale from the ball size is unreliable in noisy videos, so the true scale is given
+    data = _evaluate(video, params, pixel_scale=truth.pixel_scale)
+    assert data.cor == pytest.approx(truth.cor, abs=0.01)
+    assert data.speed_in == pytest.approx(truth.speed_in, rel=0.02)
+    assert data.speed_out == pytest.approx(truth.speed_out, rel=0.02)
+    assert data.max_deformation == pytest.approx(truth.max_deformation, abs=2 * truth.pixel_scale)
@@ -0,0 +1,47 @@
+import sys
+sys.path.append("src")
+import warnings
+warnings.filterwarnings('ignore', module='pyMRAW')
+import av
+import numpy as np
+import pytest
+
+from test_video_reader import _write_recording
+from video_probe import plan_batch, probe_video
+
+
+def test_probe_mraw_header(tmp_path):
+    cihx = _write_recording(tmp_path, np.zeros((12, 8, 16), dtype=np.uint16), 12)
+    probe = probe_video(str(cihx))
+    assert (probe.num_frames, probe.height, probe.width, probe.bit_depth) == (12, 8, 16, 12)
+    assert probe.frame_rate == 30000.0
+    assert probe.memory_bytes == 12 * 8 * 16 * 2
+    assert probe.decode_seconds > 0
+
+
+def test_probe_rejects_incomplete_recording(tmp_path):
+    cihx = _write_recording(tmp_path, np.zeros((12, 8, 16), dtype=np.uint16), 12)
+    (tmp_path / "rec.mraw").write_bytes(b"\0" * 10)
+    with pytest.raises(ValueError):
+        probe_video(str(cihx))
+    assert plan_batch([cihx]) == []
+
+
+def test_probe_container_header(tmp_path):
+    path = str(tmp_path / "clip.mp4")
+    with av.open(path, "w") as container:
+        stream = container.add_stream("mpeg4", rate=25)
+        stream.width, stream.height, stream.pix_fmt = 32, 16, "yuv420p"
+        for _ in range(10):
+            frame = av.VideoFrame.from_ndarray(np.zeros((16, 32, 3), dtype=np.uint8), format="rgb24")
+            container.mux(stream.encode(frame))
+        container.mux(stream.encode())
+    probe = probe_video(path)
+    assert (probe.num_frames, probe.height, probe.width, probe.bit_depth) == (10, 16, 32, 8)
+    assert probe.frame_rate == 25.0
+
+
+def test_plan_batch_deduplicates_recordings(tmp_path):
+    cihx = _write_recording(tmp_path, np.zeros((4, 2, 4), dtype=np.uint16), 16)
+    plan = plan_batch([cihx, tmp_path / "rec.mraw", tmp_path / "missing.cihx"])
+    assert [p.filename for p in plan] == [str(cihx)]
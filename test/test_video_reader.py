@@ -0,0 +1,125 @@
+import sys
+sys.path.append("src")
+import warnings
+warnings.filterwarnings('ignore', module='pyMRAW')
+import re
+import av
+import numpy as np
+import pyMRAW
+import pytest
+
+from streak_builder import build_streak
+from video_reader import VideoReaderAV, VideoReaderMraw, crop_video, open_video, pack_uint12, unpack_uint12, unpack_uint12_row_min
+
+
+def _write_recording(tmp_path, frames, bit):
+    """ writes frames as mraw next to a copy of the bundled cihx with adjusted size and bit depth """
+    n, h, w = frames.shape
+    with open("data/ball_12bit_full.cihx", "rb") as f:
+        header = f.read()
+    header = re.sub(rb"<width>384</width>", b"<width>%d</width>" % w, header)
+    header = re.sub(rb"<height>384</height>", b"<height>%d</height>" % h, header)
+    header = re.sub(rb"<totalFrame>\d+</totalFrame>", b"<totalFrame>%d</totalFrame>" % n, header)
+    header = re.sub(rb"<bit>12</bit>", b"<bit>%d</bit>" % bit, header)
+    cihx = tmp_path / "rec.cihx"
+    cihx.write_bytes(header)
+    if bit == 12:
+        pack_uint12(frames).tofile(tmp_path / "rec.mraw")
+    else:
+        frames.astype(np.uint8 if bit == 8 else np.uint16).tofile(tmp_path / "rec.mraw")
+    return cihx
+
+
+@pytest.mark.parametrize("bit", [8, 12, 16])
+def test_mraw_reader_matches_pymraw(tmp_path, bit):
+    rng = np.random.default_rng(0)
+    frames = rng.integers(0, 2**bit, size=(12, 8, 16))
+    cihx = _write_recording(tmp_path, frames, bit)
+
+    reader = open_video(str(cihx))
+    assert isinstance(reader, VideoReaderMraw)
+    assert len(reader) == 12
+    assert reader.frame_shape == (8, 16)
+    assert reader.color_bit_depth == bit
+    assert reader.frame_rate == 30000.0
+
+    np.testing.assert_array_equal(reader[3], frames[3])
+    np.testing.assert_array_equal(reader[-1], frames[-1])
+    np.testing.assert_array_equal(reader[2:7], frames[2:7])
+    np.testing.assert_array_equal(reader[1:11:3], frames[1:11:3])
+    np.testing.assert_array_equal(reader[range(4, 6)], frames[4:6])
+    np.testing.assert_array_equal(reader[[0, 5, 2]], frames[[0, 5, 2]])
+    np.testing.assert_array_equal(reader.image_array, frames)
+
+    images, _ = pyMRAW.load_video(str(cihx))
+    np.testing.assert_array_equal(reader[:], images)
+    np.testing.assert_array_equal(build_streak(reader, chunk_size=5, workers=2), frames.min(axis=2).T)
+
+
+def test_mraw_reader_opens_mraw_file(tmp_path):
+    frames = np.arange(4 * 2 * 4).reshape(4, 2, 4)
+    _write_recording(tmp_path, frames, 12)
+    reader = VideoReaderMraw(str(tmp_path / "rec.mraw"))
+    np.testing.assert_array_equal(reader[:], frames)
+    with pytest.raises(IndexError):
+        reader[4]
+
+
+@pytest.mark.parametrize("bit", [8, 12, 16])
+def test_region_reader_crops_while_reading(tmp_path, bit):
+    rng = np.random.default_rng(3)
+    frames = rng.integers(0, 2**bit, size=(10, 8, 16))
+    reader = open_video(str(_write_recording(tmp_path, frames, bit)))
+
+    for cols in [(3, 12), (4, 10), (1, 2), None]:
+        region = crop_video(reader, rows=(2, 7), cols=cols, frames=(1, 9))
+        expected = frames[1:9, 2:7, slice(*(cols or (None,)))]
+        assert len(region) == 8
+        assert region.frame_shape == expected.shape[1:]
+        np.testing.assert_array_equal(region[:], expected)
+        np.testing.assert_array_equal(region[2], expected[2])
+        np.testing.assert_array_equal(region[1:7:2], expected[1:7:2])
+
+    assert crop_video(reader) is reader
+
+
+def _write_mp4(path, num_frames=40):
+    """ encodes a moving gradient, keyframes every 8 frames so seeking is exercised """
+    with av.open(path, "w") as container:
+        stream = container.add_stream("mpeg4", rate=50)
+        stream.width, stream.height, stream.pix_fmt = 32, 24, "yuv420p"
+        stream.codec_context.gop_size = 8
+        for i in range(num_frames):
+            img = np.full((24, 32, 3), (i * 6) % 256, dtype=np.uint8)
+            img[:, (i % 32)] = 255
+            container.mux(stream.encode(av.VideoFrame.from_ndarray(img, format="rgb24")))
+        container.mux(stream.encode())
+
+
+def test_av_reader_streams_and_seeks(tmp_path):
+    path = str(tmp_path / "clip.mp4")
+    _write_mp4(path)
+    reader = open_video(path)
+    assert isinstance(reader, VideoReaderAV)
+    assert len(reader) == 40 and reader.frame_shape == (24, 32)
+
+    sequential = np.stack(list(reader.iter_frames()))
+    assert sequential.shape == (40, 24, 32)
+    for i in [17, 3, 39, 0, 25]:
+        np.testing.assert_array_equal(reader[i], sequential[i])
+    np.testing.assert_array_equal(reader[10:30:5], sequential[10:30:5])
+    np.testing.assert_array_equal(build_streak(reader, chunk_size=6, workers=4), sequential.min(axis=2).T)
+
+
+def test_unpack_uint12_into_buffer_and_fused_min():
+    rng = np.random.default_rng(4)
+    frames = rng.integers(0, 4096, size=(6, 4, 10))
+    packed = pack_uint12(frames)
+
+    out = np.zeros(frames.size, dtype=np.uint16)
+    assert unpack_uint12(packed, out=out) is out
+    np.testing.assert_array_equal(out.reshape(frames.shape), frames)
+
+    row_min = np.zeros((6, 4), dtype=np.uint16)
+    unpack_uint12_row_min(packed, frames.shape, out=row_min)
+    np.testing.assert_array_equal(row_min, frames.min(axis=2))